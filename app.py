@@ -13,6 +13,12 @@ def init_db():
     # Crear todas las tablas
     db.create_all()
     
+    # Calificaciones de bases de datos anteriores a updated_at: se toma la fecha de creación
+    if _add_missing_columns('recipe_rating', [('updated_at', 'TIMESTAMP')]):
+        from sqlalchemy import text
+        db.session.execute(text('UPDATE recipe_rating SET updated_at = created_at'))
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_recipe_rating_updated_at ON recipe_rating (updated_at)'))
+    
     # Crear restricciones dietéticas básicas
     restrictions = [
         ('vegetariano', 'Dieta que excluye carne y pescado'),
@@ -173,6 +179,15 @@ def init_db():
     
     try:
         db.session.commit()
+        
+        # Recetas cargadas con los scripts SQL de data/ no pasan por before_flush
+        pending = Recipe.query.filter(Recipe.restriction_conflicts.is_(None)).all()
+        for recipe in pending:
+            recipe.refresh_restriction_conflicts()
+        db.session.commit()
+        if pending:
+            print(f"Máscaras de restricciones calculadas para {len(pending)} recetas")
+        
         print("Base de datos inicializada exitosamente!")
         print("Usuario admin creado - username: admin, password: admin123")
     except Exception as e:
@@ -185,24 +200,150 @@ def train_ml_models():
     print("Entrenando modelos de machine learning...")
     
     try:
-        from ml_models.recommendation_engine import RecommendationEngine
-        from ml_models.clustering import RecipeClustering
+        import time
+        from ml_models.model_registry import ModelRegistry
+        from ml_models.training_job import train_version
+        from app.recipe_catalog import prepare_recipes_data_for_ml, prepare_ratings_data_for_ml
         
-        # Entrenar sistema de recomendaciones
-        print("Entrenando sistema de recomendaciones...")
-        rec_engine = RecommendationEngine()
-        rec_engine.train_models()
+        # Mismo flujo que los trabajos en segundo plano: se publica una versión nueva del registro
+        # (sin recetas en la base de datos, el motor y el clustering usan datos de ejemplo)
+        def on_stage(name, progress, timings, errors):
+            print(f"Entrenando {name}...")
         
-        # Entrenar clustering
-        print("Entrenando modelo de clustering...")
-        clustering = RecipeClustering()
-        clustering.train_clustering()
+        data_as_of = time.time()  # antes de leer: las calificaciones posteriores se aplican en línea
+        version, timings, errors = train_version(
+            prepare_recipes_data_for_ml(), prepare_ratings_data_for_ml(), ModelRegistry(), on_stage=on_stage,
+            metadata={'data_as_of': data_as_of}
+        )
+        for name, error in errors.items():
+            print(f"Etapa {name} con error: {error}")
         
-        print("Modelos entrenados exitosamente!")
+        if version:
+            print(f"Modelos entrenados exitosamente! Versión {version} ({timings})")
+        else:
+            print("No se pudo entrenar ningún modelo.")
         
     except Exception as e:
         print(f"Error entrenando modelos: {e}")
 
+def _add_missing_columns(table, columns):
+    """Agrega a la tabla las columnas que falten (bases de datos anteriores); devuelve las agregadas"""
+    from sqlalchemy import inspect, text
+    
+    existing_columns = {column['name'] for column in inspect(db.engine).get_columns(table)}
+    added = []
+    for column, ddl in columns:
+        if column not in existing_columns:
+            db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            print(f"Columna {table}.{column} agregada")
+            added.append(column)
+    return added
+
+@app.cli.command()
+def backfill_rating_stats():
+    """Recalcular rating_count, rating_sum y avg_rating de todas las recetas"""
+    from sqlalchemy import text
+    from app.recipe_catalog import recipe_catalog
+
+    print("Recalculando agregados de calificaciones...")
+
+    try:
+        # Agregar columnas en bases de datos creadas antes de los agregados
+        _add_missing_columns('recipe', [('rating_count', 'INTEGER NOT NULL DEFAULT 0'),
+                                     ('rating_sum', 'INTEGER NOT NULL DEFAULT 0'),
+                                     ('avg_rating', 'FLOAT NOT NULL DEFAULT 0')])
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_recipe_avg_rating ON recipe (avg_rating)'))
+
+        # Un solo UPDATE con subconsultas correlacionadas
+        updated = Recipe.recompute_rating_stats()
+        db.session.commit()
+        recipe_catalog.invalidate()
+
+        print(f"Agregados actualizados para {updated} recetas")
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recalculando agregados: {e}")
+
+@app.cli.command()
+def backfill_restriction_masks():
+    """Recalcular la máscara de restricciones dietéticas y alérgenos de todas las recetas"""
+    from sqlalchemy.orm import selectinload
+    from app.recipe_catalog import recipe_catalog
+    
+    print("Recalculando máscaras de restricciones dietéticas...")
+    
+    try:
+        _add_missing_columns('recipe', [('restriction_conflicts', 'BIGINT')])
+        db.session.commit()
+        
+        recipes = Recipe.query.options(
+            selectinload(Recipe.ingredients),
+            selectinload(Recipe.nutritional_info)
+        ).all()
+        for recipe in recipes:
+            recipe.refresh_restriction_conflicts()
+        db.session.commit()
+        recipe_catalog.invalidate()
+        
+        print(f"Máscaras actualizadas para {len(recipes)} recetas")
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recalculando máscaras: {e}")
+
+# Librerías que no deben importarse al crear la app: se cargan en el primer uso o en el warmup
+HEAVY_STARTUP_MODULES = ('sklearn', 'pandas', 'scipy', 'nltk', 'matplotlib', 'reportlab')
+
+def _parse_importtime(output):
+    """Líneas de python -X importtime -> [(módulo, profundidad, propio µs, acumulado µs)]"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return imports
+
+@app.cli.command()
+def check_startup():
+    """Medir el tiempo de importación al crear la app (python -X importtime) contra el presupuesto"""
+    import subprocess
+    import sys
+    
+    budget_ms = app.config.get('STARTUP_IMPORT_BUDGET_MS', 1500)
+    env = {**os.environ, 'WARMUP_ON_START': '0'}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'from app import create_app; create_app()'],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        print(f"La app no se pudo crear:\n{result.stderr[-2000:]}")
+        raise SystemExit(1)
+    
+    imports = _parse_importtime(result.stderr)
+    total_ms = sum(self_us for _, _, self_us, _ in imports) / 1000
+    heavy = sorted({name for name, _, _, _ in imports if name.split('.')[0] in HEAVY_STARTUP_MODULES})
+    
+    print(f"Tiempo de importación al crear la app: {total_ms:.0f} ms (presupuesto {budget_ms} ms)")
+    print("Importaciones más costosas:")
+    top_level = sorted((entry for entry in imports if entry[1] == 0), key=lambda entry: entry[3], reverse=True)
+    for name, _, _, cumulative_us in top_level[:10]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    
+    failed = False
+    if heavy:
+        roots = sorted({name.split('.')[0] for name in heavy})
+        print(f"Librerías pesadas importadas al iniciar: {', '.join(roots)}")
+        failed = True
+    if total_ms > budget_ms:
+        print("Presupuesto de arranque excedido")
+        failed = True
+    if failed:
+        raise SystemExit(1)
+    print("Arranque dentro del presupuesto")
+
 @app.cli.command()
 def create_sample_user():
     """Crear usuario de ejemplo para pruebas"""
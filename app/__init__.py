@@ -4,8 +4,38 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
-import nltk
 import os
+import time
+
+
+def setup_nltk(data_path=None):
+    """Preflight de los datos de NLTK: solo comprueba lo instalado, nunca descarga"""
+    try:
+        from ml_models.nlp_processor import preflight_nltk_resources, NLTK_INSTALL_HINT
+        status = preflight_nltk_resources(data_path)
+        if any(status.values()):
+            print(f"✅ Datos NLTK disponibles: {', '.join(name for name, ok in status.items() if ok)}")
+        else:
+            print(f"⚠️ Datos punkt de NLTK no instalados (se usa el tokenizador por expresiones regulares). "
+                  f"Instalar con: {NLTK_INSTALL_HINT}")
+        return status
+    except Exception as e:
+        print(f"⚠️ Error general con NLTK: {e}")
+        return {}
+
+
+def warmup(app):
+    """
+    Carga por adelantado lo que si no se carga en el primer uso: modelos ML y datos de
+    NLTK. Con gunicorn --preload se ejecuta una vez en el proceso maestro y los workers
+    heredan los modelos ya cargados.
+    """
+    start = time.perf_counter()
+    from app.routes import expert_system
+    expert_system.warmup()
+    setup_nltk(app.config.get('NLTK_DATA_PATH'))
+    print(f"🔥 Warmup completado en {time.perf_counter() - start:.2f}s")
+
 
 def create_app():
     app = Flask(__name__, 
@@ -14,6 +44,9 @@ def create_app():
     
     app.config.from_object('config.Config')
     
+    # Ruta de los datos de NLTK para todo el proceso (también el preflight perezoso, sin warmup)
+    os.environ.setdefault('NLTK_DATA', os.path.abspath(app.config.get('NLTK_DATA_PATH', 'nltk_data/')))
+    
     # Inicializar extensiones
     from app.models import db
     db.init_app(app)
@@ -126,33 +159,6 @@ def create_app():
         except:
             return default
     
-    # ✅ MEJORAR DESCARGA DE DATOS NLTK
-    def setup_nltk():
-        try:
-            # Intentar usar punkt
-            nltk.data.find('tokenizers/punkt')
-            print("✅ NLTK punkt ya disponible")
-        except LookupError:
-            try:
-                print("📥 Descargando datos NLTK...")
-                nltk.download('punkt', quiet=True)
-                nltk.download('punkt_tab', quiet=True)
-                nltk.download('stopwords', quiet=True)
-                print("✅ Datos NLTK descargados")
-            except Exception as e:
-                print(f"⚠️ Error descargando NLTK: {e}")
-        except Exception as e:
-            print(f"⚠️ Error general con NLTK: {e}")
-    
-    # Configurar NLTK en un hilo separado para no bloquear la app
-    try:
-        import threading
-        nltk_thread = threading.Thread(target=setup_nltk)
-        nltk_thread.daemon = True
-        nltk_thread.start()
-    except Exception as e:
-        print(f"⚠️ No se pudo inicializar NLTK: {e}")
-    
     # ✅ MANEJAR ERRORES DE TEMPLATE DE FORMA SEGURA
     @app.errorhandler(500)
     def handle_template_error(error):
@@ -179,6 +185,17 @@ def create_app():
         print(f"❌ Error registrando blueprints: {e}")
         raise e
     
+    # Compactación periódica de los modelos actualizados en línea (el hilo lo inicia cada worker)
+    try:
+        from app.routes import model_updater
+        model_updater.start(app, app.config.get('MODEL_COMPACTION_INTERVAL_SECONDS', 0))
+    except Exception as e:
+        print(f"⚠️ No se pudo iniciar la compactación de modelos: {e}")
+    
+    # Modelos y NLTK se cargan en el primer uso; WARMUP_ON_START los carga ya
+    if app.config.get('WARMUP_ON_START'):
+        warmup(app)
+    
     # Crear directorios necesarios
     try:
         os.makedirs(app.config.get('PDF_UPLOAD_FOLDER', 'static/pdfs'), exist_ok=True)
@@ -0,0 +1,124 @@
+# app/enrichment.py - Enriquecimiento de páginas de recomendaciones
+from concurrent.futures import ThreadPoolExecutor, wait
+import threading
+import time
+
+from flask import current_app
+
+# Valores por defecto si la configuración no los define
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_DEADLINE_SECONDS = 1.5
+
+
+class RecommendationEnricher:
+    """
+    Etapa de enriquecimiento de una página de recomendaciones.
+    Las etapas baratas y en memoria (faltantes, sustituciones, nutrición) corren en lote
+    en el hilo de la petición; las costosas (recetas similares, que pueden caer en
+    clustering o consultas) van a un pool de hilos acotado. Lo que no termina antes del
+    plazo de la petición se marca como omitido en lugar de bloquear la página.
+    """
+
+    def __init__(self, expert_system, max_workers=None):
+        self.expert_system = expert_system
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """Pool compartido entre peticiones, creado con el primer uso"""
+        with self._lock:
+            if self._executor is None:
+                max_workers = self.max_workers or current_app.config.get('ENRICHMENT_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='enrichment')
+            return self._executor
+
+    def enrich(self, recipes, available_ingredients, n_similar=3, deadline_seconds=None):
+        """Lista de dicts {recipe, missing_info, substitutions, nutritional_analysis, similar_recipes, omitted}"""
+        if deadline_seconds is None:
+            deadline_seconds = current_app.config.get('ENRICHMENT_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS)
+        deadline = time.monotonic() + deadline_seconds
+
+        # Etapa costosa: ids de similares en el pool, una tarea por receta. Los modelos
+        # fijados en esta petición se pasan a las tareas: su contexto nuevo no hereda g
+        app = current_app._get_current_object()
+        models = self.expert_system.ml_models
+        executor = self._get_executor()
+        similar_futures = {
+            recipe.id: executor.submit(self._similar_ids, app, models, recipe.id, n_similar)
+            for recipe in recipes
+        }
+
+        # Etapas en memoria, en lote, mientras el pool trabaja
+        missing_by_recipe = self._run_stage('faltantes', self.expert_system.calculate_missing_ingredients_batch,
+                                            recipes, available_ingredients)
+        substitutions_by_recipe = self._run_stage('sustituciones', self.expert_system.get_ingredient_substitutions_batch,
+                                                  recipes, available_ingredients)
+        nutrition_by_recipe = self._run_stage('nutrición', self._nutrition_batch, recipes)
+
+        # Esperar solo lo que queda del plazo
+        wait(similar_futures.values(), timeout=max(deadline - time.monotonic(), 0))
+        similar_ids = {}
+        for recipe_id, future in similar_futures.items():
+            if future.done() and not future.exception():
+                similar_ids[recipe_id] = future.result()
+            elif future.done():
+                print(f"⚠️ Error obteniendo recetas similares de {recipe_id}: {future.exception()}")
+                similar_ids[recipe_id] = []
+            else:
+                future.cancel()  # si aún no empezó, no ocupa el pool
+
+        # Cargar los objetos Recipe de los similares en la sesión de la petición
+        try:
+            similar_by_recipe = self.expert_system.hydrate_similar(similar_ids)
+        except Exception as e:
+            print(f"⚠️ Error cargando recetas similares: {e}")
+            similar_by_recipe = {}
+
+        enhanced = []
+        for recipe in recipes:
+            omitted = []
+            for stage, results in (('missing_info', missing_by_recipe),
+                                   ('substitutions', substitutions_by_recipe),
+                                   ('nutritional_analysis', nutrition_by_recipe)):
+                if results is None:
+                    omitted.append(stage)
+            if recipe.id not in similar_ids:
+                omitted.append('similar_recipes')
+
+            enhanced.append({
+                'recipe': recipe,
+                'missing_info': (missing_by_recipe or {}).get(recipe.id, {'missing': [], 'available': [], 'coverage_percentage': 0}),
+                'substitutions': (substitutions_by_recipe or {}).get(recipe.id, {}),
+                'nutritional_analysis': (nutrition_by_recipe or {}).get(recipe.id),
+                'similar_recipes': similar_by_recipe.get(recipe.id, []),
+                'omitted': omitted
+            })
+
+        if any(entry['omitted'] for entry in enhanced):
+            print(f"⏱️ Enriquecimiento incompleto en {deadline_seconds}s: {sum(len(e['omitted']) for e in enhanced)} partes omitidas")
+        return enhanced
+
+    def _similar_ids(self, app, models, recipe_id, n_similar):
+        """Tarea del pool: su propio contexto de aplicación (y sesión), con los modelos de la petición"""
+        with app.app_context():
+            self.expert_system.pin_models(models)
+            return self.expert_system.similar_recipe_ids(recipe_id, n_similar)
+
+    def _nutrition_batch(self, recipes):
+        return {recipe.id: self.expert_system.get_nutritional_analysis(recipe) for recipe in recipes}
+
+    def _run_stage(self, name, stage, *args):
+        """Ejecuta una etapa en lote; si falla se omite para todas las recetas"""
+        try:
+            return stage(*args)
+        except Exception as e:
+            print(f"❌ Error en etapa de enriquecimiento '{name}': {e}")
+            return None
+
+    def shutdown(self):
+        """Detiene el pool (las tareas pendientes se cancelan)"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
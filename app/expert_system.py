@@ -1,9 +1,20 @@
 # app/expert_system.py - VERSIÓN CORREGIDA CON ML
-from app.models import Recipe, Ingredient, User, DietaryRestriction, IngredientSubstitution, NutritionalInfo, db
-from sqlalchemy import or_, func
-import re
+from app.models import Recipe, Ingredient, User, DietaryRestriction, NutritionalInfo, db
+from app.recipe_catalog import recipe_catalog, hydrate_recipes
+from ml_models.dietary_rules import required_mask
+from ml_models.ingredient_index import IngredientIndex
+from ml_models.ranking import top_k_indices
+from ml_models.result_cache import ResultCache
+from ml_models.model_registry import ModelRegistry, ModelBundle, ENGINE_DIR, CLUSTERING_FILE, CONTENT_FILTER_FILE
+from flask import g, has_app_context
+from sqlalchemy import func, or_
+import numpy as np
 import os
 import pickle
+import threading
+
+CONTENT_FILTER_MODEL_PATH = 'ml_models/trained_models/content_filter_model.pkl'
+CLUSTERING_MODEL_PATH = 'ml_models/trained_models/clustering_model.pkl'
 
 class CulinaryExpertSystem:
     def __init__(self):
@@ -15,11 +26,74 @@ class CulinaryExpertSystem:
             'difficulty_preference': self._apply_difficulty_preference,
         }
         
-        # Cargar modelos ML si existen
-        self.ml_models = self._load_ml_models()
+        # Modelos ML: se cargan en el primer uso o en warmup() (conjunto inmutable; se
+        # reemplaza completo al cambiar de versión)
+        self._ml_models = None
+        self._load_lock = threading.Lock()
+        
+        # Cache de resultados: ids de receta por (usuario, despensa, restricciones, preferencias, versión);
+        # las invalidaciones llegan a todos los procesos por el registro de cambios del catálogo
+        self.recommendation_cache = ResultCache(max_entries=512, ttl_seconds=300)
+        self.model_version = 0
+        recipe_catalog.subscribe(self._apply_cache_change)
+        
+    @property
+    def ml_models(self):
+        """Modelos de la versión actual; dentro de una petición se usa el mismo conjunto de principio a fin"""
+        if not has_app_context():
+            return self._current_models()
+        if 'expert_ml_models' not in g:
+            g.expert_ml_models = self._current_models()
+        return g.expert_ml_models
+    
+    def _current_models(self):
+        """Conjunto actual; la primera llamada carga la versión actual del registro"""
+        models = self._ml_models
+        if models is None:
+            with self._load_lock:
+                if self._ml_models is None:
+                    try:
+                        self._ml_models = self._load_ml_models()
+                    except Exception as e:
+                        print(f"⚠️ Error cargando la versión actual de modelos: {e}")
+                        self._ml_models = ModelBundle({'recommendation_engine': None, 'clustering': None,
+                                                       'content_filter': None})
+                models = self._ml_models
+        return models
+    
+    def pin_models(self, models):
+        """Fija un conjunto de modelos en el contexto actual (tareas en otro hilo de la misma petición)"""
+        g.expert_ml_models = models
+    
+    @property
+    def loaded_models(self):
+        """Conjunto actual si ya se cargó, o None (no dispara la carga)"""
+        return self._ml_models
+    
+    def warmup(self):
+        """Carga los modelos por adelantado (antes de crear los workers, por ejemplo)"""
+        return self._current_models()
+    
+    def _load_ml_models(self, version=None):
+        """Carga los modelos de una versión del registro (la actual por defecto) o de las rutas antiguas"""
+        registry = ModelRegistry()
+        version = version or registry.current_version()
+        manifest = None
+        engine_path = 'ml_models/trained_models/'
+        clustering_path = CLUSTERING_MODEL_PATH
+        content_filter_path = CONTENT_FILTER_MODEL_PATH
+        
+        if version:
+            mismatched = registry.verify(version)
+            if mismatched:
+                raise ValueError(f"Versión de modelos {version} corrupta: {', '.join(mismatched)}")
+            manifest = registry.manifest(version)
+            version_dir = registry.version_dir(version)
+            engine_path = os.path.join(version_dir, ENGINE_DIR) + os.sep
+            clustering_path = os.path.join(version_dir, CLUSTERING_FILE)
+            content_filter_path = os.path.join(version_dir, CONTENT_FILTER_FILE)
+            print(f"📦 Cargando versión de modelos {version}")
         
-    def _load_ml_models(self):
-        """Carga los modelos de ML si están disponibles"""
         models = {
             'recommendation_engine': None,
             'clustering': None,
@@ -29,7 +103,7 @@ class CulinaryExpertSystem:
         try:
             # Intentar cargar RecommendationEngine
             from ml_models.recommendation_engine import RecommendationEngine
-            models['recommendation_engine'] = RecommendationEngine()
+            models['recommendation_engine'] = RecommendationEngine(model_path=engine_path)
             print("✅ RecommendationEngine cargado")
         except Exception as e:
             print(f"⚠️ RecommendationEngine no disponible: {e}")
@@ -38,7 +112,7 @@ class CulinaryExpertSystem:
             # Intentar cargar Clustering
             from ml_models.clustering import RecipeClustering
             models['clustering'] = RecipeClustering()
-            models['clustering'].load_model('ml_models/trained_models/clustering_model.pkl')
+            models['clustering'].load_model(clustering_path)
             print("✅ Clustering cargado")
         except Exception as e:
             print(f"⚠️ Clustering no disponible: {e}")
@@ -47,12 +121,12 @@ class CulinaryExpertSystem:
             # Intentar cargar ContentFilter
             from ml_models.content_filter import ContentBasedFilter
             models['content_filter'] = ContentBasedFilter()
-            models['content_filter'].load_model('ml_models/trained_models/content_filter_model.pkl')
+            models['content_filter'].load_model(content_filter_path)
             print("✅ ContentFilter cargado")
         except Exception as e:
             print(f"⚠️ ContentFilter no disponible: {e}")
             
-        return models
+        return ModelBundle(models, version, manifest)
     
     def get_recommendations(self, user_id, available_ingredients, preferences=None):
         """
@@ -66,10 +140,23 @@ class CulinaryExpertSystem:
             print(f"❌ DEBUG: Usuario {user_id} no encontrado")
             return []
         
-        # Procesar ingredientes
-        processed_ingredients = self._process_ingredients_simple(available_ingredients)
+        # Procesar ingredientes (nombres para mostrar y para el cache, ids para las consultas)
+        processed_ingredients, ingredient_ids = self._resolve_ingredients(available_ingredients)
         print(f"🔍 DEBUG: Ingredientes procesados: {processed_ingredients}")
         
+        # Reutilizar el resultado si ya se calculó para la misma consulta
+        cache_key = self._recommendation_cache_key(user, processed_ingredients, preferences)
+        cached_ids = self.recommendation_cache.get(cache_key)
+        if cached_ids is not None:
+            print(f"⚡ Recomendaciones desde cache: {len(cached_ids)} recetas")
+            return hydrate_recipes(cached_ids)
+        
+        recommendations = self._compute_recommendations(user, processed_ingredients, preferences, ingredient_ids)
+        self.recommendation_cache.put(cache_key, [recipe.id for recipe in recommendations], user.id)
+        return recommendations
+    
+    def _compute_recommendations(self, user, processed_ingredients, preferences, ingredient_ids=None):
+        """Ejecuta el pipeline completo de recomendaciones (ML con respaldo tradicional)"""
         # USAR ML SI ESTÁ DISPONIBLE
         if self.ml_models['recommendation_engine']:
             try:
@@ -79,13 +166,76 @@ class CulinaryExpertSystem:
                 print(f"❌ Error en ML, usando método tradicional: {e}")
         
         # Método tradicional como fallback
-        return self._get_traditional_recommendations(user, processed_ingredients, preferences)
+        return self._get_traditional_recommendations(user, processed_ingredients, preferences, ingredient_ids)
+    
+    def _recommendation_cache_key(self, user, ingredients, preferences):
+        """Clave del cache: despensa y restricciones normalizadas, preferencias y versiones de modelos y del catálogo"""
+        preferences = preferences or {}
+        return (
+            user.id,
+            tuple(sorted({ing.lower().strip() for ing in ingredients if ing and ing.strip()})),
+            tuple(sorted(restriction.name for restriction in user.dietary_restrictions)),
+            preferences.get('max_prep_time'),
+            preferences.get('difficulty_preference'),
+            self._models_version(),
+            self._catalog_version()
+        )
+    
+    def _models_version(self):
+        models = self.ml_models
+        engine = models['recommendation_engine']
+        return (self.model_version, getattr(models, 'version', None), getattr(engine, 'model_version', 0))
+    
+    def _catalog_version(self):
+        """Versión del catálogo al día con los cambios de todos los procesos (también aplica las invalidaciones del cache)"""
+        return recipe_catalog.current_version()
+    
+    def reload_models(self, version=None):
+        """
+        Carga una versión completa aparte y la publica con una sola asignación: las
+        peticiones en curso terminan con el conjunto anterior. Si la versión no carga
+        se conserva la actual.
+        """
+        try:
+            bundle = self._load_ml_models(version)
+        except Exception as e:
+            print(f"❌ No se pudo cargar la versión de modelos {version}: {e}")
+            return False
+        with self._load_lock:  # no la pisa una carga inicial que termine después
+            self._ml_models = bundle
+        self.mark_models_retrained()
+        return True
+    
+    def mark_models_retrained(self):
+        """Descarta resultados calculados con modelos anteriores"""
+        self.model_version += 1
+        removed = self.recommendation_cache.clear()
+        print(f"🧹 Cache de recomendaciones invalidado ({removed} entradas)")
+    
+    def invalidate_user_recommendations(self, user_id, all_workers=True):
+        """Descarta los resultados cacheados de un usuario (nuevas calificaciones o preferencias), en todos los procesos"""
+        if all_workers:
+            recipe_catalog.broadcast({'recommendation_users': [user_id]})
+        return self.recommendation_cache.invalidate_user(user_id)
+    
+    def clear_recommendation_cache(self):
+        """Descarta todos los resultados cacheados en todos los procesos; devuelve cuántos había en este"""
+        recipe_catalog.broadcast({'recommendation_cache': True})
+        return self.recommendation_cache.clear()
+    
+    def _apply_cache_change(self, change):
+        if change.get('recommendation_cache'):
+            self.recommendation_cache.clear()
+        for user_id in change.get('recommendation_users', ()):
+            self.recommendation_cache.invalidate_user(user_id)
     
     def _get_ml_recommendations(self, user, ingredients, preferences):
         """Recomendaciones usando Machine Learning"""
         try:
             # Preparar perfil de usuario para ML
             user_profile = {
+                'user_id': user.id,
+                'ratings': {r.recipe_id: r.rating for r in user.recipe_ratings},  # fold-in del filtrado colaborativo
                 'dietary_restrictions': [dr.name for dr in user.dietary_restrictions],
                 'avg_rating_given': self._calculate_user_avg_rating(user),
                 'preferred_cuisines': self._get_user_preferred_cuisines(user)
@@ -94,18 +244,17 @@ class CulinaryExpertSystem:
             # Obtener datos de recetas para ML
             recipes_data = self._prepare_recipes_for_ml()
             
-            # Usar RecommendationEngine
+            # Usar RecommendationEngine (el grafo va como argumento: el motor es compartido entre peticiones)
             ml_recommendations = self.ml_models['recommendation_engine'].get_recommendations(
-                user_profile, ingredients, recipes_data, n_recommendations=10
+                user_profile, ingredients, recipes_data, n_recommendations=10,
+                substitution_graph=recipe_catalog.get_substitution_graph()
             )
             
-            # Convertir resultados ML a objetos Recipe
-            recommended_recipes = []
-            for rec in ml_recommendations:
-                recipe_id = rec['recipe'].get('id') if isinstance(rec['recipe'], dict) else rec['recipe'].id
-                recipe = Recipe.query.get(recipe_id)
-                if recipe:
-                    recommended_recipes.append(recipe)
+            # Convertir resultados ML a objetos Recipe (una consulta, mismo orden)
+            recommended_recipes = hydrate_recipes([
+                rec['recipe'].get('id') if isinstance(rec['recipe'], dict) else rec['recipe'].id
+                for rec in ml_recommendations
+            ])
             
             print(f"✅ ML devolvió {len(recommended_recipes)} recomendaciones")
             return recommended_recipes
@@ -114,17 +263,25 @@ class CulinaryExpertSystem:
             print(f"❌ Error en ML recommendations: {e}")
             raise e
     
-    def _get_traditional_recommendations(self, user, ingredients, preferences):
+    def _get_traditional_recommendations(self, user, ingredients, preferences, ingredient_ids=None):
         """Método tradicional sin ML"""
         print("🔄 Usando método tradicional (sin ML)")
         
         # Obtener recetas candidatas
-        candidate_recipes = self._get_candidate_recipes(ingredients)
-        print(f"🔍 DEBUG: Recetas candidatas encontradas: {len(candidate_recipes)}")
+        if ingredient_ids is None:
+            ingredient_ids = self._resolve_ingredients(ingredients)[1]
+        restriction_names = [restriction.name for restriction in user.dietary_restrictions]
+        candidates = self._get_candidate_recipes(ingredient_ids, restriction_names)
+        print(f"🔍 DEBUG: Recetas candidatas encontradas: {len(candidates)}")
+        
+        # Cuántos ingredientes de la despensa tiene cada candidata (ya contados en la consulta)
+        match_counts = {recipe.id: count for recipe, count in candidates}
+        candidate_recipes = [recipe for recipe, count in candidates]
         
         if not candidate_recipes:
             print("❌ DEBUG: No se encontraron recetas candidatas")
             candidate_recipes = Recipe.query.limit(20).all()
+            match_counts = None
             print(f"🔍 DEBUG: Usando todas las recetas como fallback: {len(candidate_recipes)}")
         
         # Aplicar reglas del sistema experto
@@ -132,46 +289,15 @@ class CulinaryExpertSystem:
         print(f"🔍 DEBUG: Recetas después de filtros: {len(filtered_recipes)}")
         
         # Rankear por coincidencia de ingredientes y rating
-        ranked_recipes = self._rank_recipes_simple(filtered_recipes, ingredients)
+        ranked_recipes = self._rank_recipes_simple(filtered_recipes, ingredients, k=10, match_counts=match_counts)
         print(f"🔍 DEBUG: Recetas rankeadas: {len(ranked_recipes)}")
         
-        return ranked_recipes[:10]
+        # Cargar relaciones de las 10 elegidas de una vez (la página las usa todas)
+        return hydrate_recipes([recipe.id for recipe in ranked_recipes])
     
     def _prepare_recipes_for_ml(self):
-        """Prepara recetas en formato para ML"""
-        recipes = Recipe.query.all()
-        recipes_data = []
-        
-        for recipe in recipes:
-            recipe_dict = {
-                'id': recipe.id,
-                'name': recipe.name,
-                'description': recipe.description or '',
-                'ingredients': [ing.name for ing in recipe.ingredients],
-                'cuisine_type': recipe.cuisine_type,
-                'difficulty': recipe.difficulty,
-                'prep_time': recipe.prep_time or 30,
-                'cook_time': recipe.cook_time or 30,
-                'servings': recipe.servings or 4,
-                'avg_rating': recipe.average_rating or 3.0,
-                'ratings': [r.rating for r in recipe.ratings]
-            }
-            
-            # Agregar info nutricional si existe
-            if recipe.nutritional_info:
-                recipe_dict['nutritional_info'] = {
-                    'calories_per_serving': recipe.nutritional_info.calories_per_serving or 400,
-                    'protein': recipe.nutritional_info.protein or 15,
-                    'carbs': recipe.nutritional_info.carbs or 50,
-                    'fat': recipe.nutritional_info.fat or 12,
-                    'fiber': recipe.nutritional_info.fiber or 3,
-                    'sugar': recipe.nutritional_info.sugar or 8,
-                    'sodium': recipe.nutritional_info.sodium or 800
-                }
-            
-            recipes_data.append(recipe_dict)
-        
-        return recipes_data
+        """Prepara recetas en formato para ML (snapshot compartido del catálogo)"""
+        return recipe_catalog.get_recipes_data()
     
     def _calculate_user_avg_rating(self, user):
         """Calcula el rating promedio que da el usuario"""
@@ -195,9 +321,17 @@ class CulinaryExpertSystem:
         return preferred[:3]  # Top 3
     
     def get_similar_recipes_ml(self, recipe_id, n_recommendations=5):
-        """Obtiene recetas similares usando clustering ML"""
+        """Obtiene recetas similares: vecinos precalculados o, si no hay, clustering ML"""
+        return hydrate_recipes(self.similar_recipe_ids(recipe_id, n_recommendations))
+    
+    def similar_recipe_ids(self, recipe_id, n_recommendations=5):
+        """Ids de recetas similares sin cargar los objetos Recipe"""
+        neighbor_ids = self._precomputed_neighbor_ids(recipe_id, n_recommendations)
+        if neighbor_ids is not None:
+            return neighbor_ids
+        
         if not self.ml_models['clustering']:
-            return self._get_similar_recipes_traditional(recipe_id, n_recommendations)
+            return [recipe.id for recipe in self._get_similar_recipes_traditional(recipe_id, n_recommendations)]
         
         try:
             # Usar clustering ML
@@ -205,19 +339,40 @@ class CulinaryExpertSystem:
             similar = self.ml_models['clustering'].get_similar_recipes(
                 recipe_id, recipes_data, n_recommendations
             )
-            
-            # Convertir a objetos Recipe
-            similar_recipes = []
-            for recipe_dict in similar:
-                recipe = Recipe.query.get(recipe_dict['id'])
-                if recipe:
-                    similar_recipes.append(recipe)
-            
-            return similar_recipes
+            return [recipe_dict['id'] for recipe_dict in similar]
             
         except Exception as e:
             print(f"❌ Error en clustering ML: {e}")
-            return self._get_similar_recipes_traditional(recipe_id, n_recommendations)
+            return [recipe.id for recipe in self._get_similar_recipes_traditional(recipe_id, n_recommendations)]
+    
+    def similar_recipe_ids_batch(self, recipe_ids, n_recommendations=3):
+        """Ids de recetas similares para varias recetas: {id: [ids similares]}"""
+        return {recipe_id: self.similar_recipe_ids(recipe_id, n_recommendations) for recipe_id in recipe_ids}
+    
+    def hydrate_similar(self, similar_ids):
+        """Convierte {id: [ids similares]} en {id: [Recipe]} con una sola consulta"""
+        loaded = hydrate_recipes([similar_id for ids in similar_ids.values() for similar_id in ids])
+        loaded_by_id = {recipe.id: recipe for recipe in loaded}
+        return {
+            recipe_id: [loaded_by_id[similar_id] for similar_id in ids if similar_id in loaded_by_id]
+            for recipe_id, ids in similar_ids.items()
+        }
+    
+    def get_similar_recipes_batch(self, recipe_ids, n_recommendations=3):
+        """
+        Recetas similares de varias recetas a la vez: se calculan los ids de todas y
+        los objetos Recipe se cargan en una sola consulta.
+        """
+        return self.hydrate_similar(self.similar_recipe_ids_batch(recipe_ids, n_recommendations))
+    
+    def _precomputed_neighbor_ids(self, recipe_id, n_recommendations):
+        """Ids de la tabla de vecinos del filtro de contenido entrenado, o None si la receta no está"""
+        content_filter = self.ml_models['content_filter']
+        if not content_filter:
+            return None
+        
+        neighbors = content_filter.neighbors(recipe_id, n_recommendations)
+        return neighbors[0] if neighbors is not None else None
     
     def _get_similar_recipes_traditional(self, recipe_id, n_recommendations):
         """Método tradicional para recetas similares"""
@@ -244,84 +399,116 @@ class CulinaryExpertSystem:
     
     # MÉTODOS ORIGINALES MANTENIDOS
     def _process_ingredients_simple(self, ingredients_text):
-        """Procesamiento simple de ingredientes"""
-        if isinstance(ingredients_text, list):
-            ingredients = ingredients_text
-        else:
-            # Separar por comas, punto y coma o saltos de línea
-            ingredients = re.split(r'[,;\n]+', str(ingredients_text))
-        
-        processed = []
-        for ingredient in ingredients:
-            if ingredient.strip():
-                # Limpiar y normalizar
-                clean_ingredient = ingredient.strip().lower()
-                # Remover cantidades y unidades básicas
-                clean_ingredient = re.sub(r'\d+\s*(kg|g|taza|tazas|cdas?|cditas?|piezas?|dientes?)', '', clean_ingredient)
-                clean_ingredient = clean_ingredient.strip()
-                if len(clean_ingredient) > 2:
-                    processed.append(clean_ingredient)
-        
-        return processed
+        """Nombres canónicos (los de la BD) de los ingredientes de un texto o lista"""
+        return self._resolve_ingredients(ingredients_text)[0]
     
-    def _get_candidate_recipes(self, ingredients):
-        """Obtiene recetas que contienen al menos uno de los ingredientes disponibles"""
-        if not ingredients:
-            return Recipe.query.limit(20).all()
-        
-        print(f"🔍 DEBUG: Buscando recetas con ingredientes: {ingredients}")
-        
-        # Buscar ingredientes en la base de datos usando LIKE para coincidencias parciales
-        ingredient_conditions = []
-        for ingredient_name in ingredients:
-            ingredient_conditions.append(Ingredient.name.ilike(f'%{ingredient_name}%'))
-        
-        # Buscar ingredientes que coincidan
-        matching_ingredients = Ingredient.query.filter(or_(*ingredient_conditions)).all()
-        print(f"🔍 DEBUG: Ingredientes encontrados en BD: {[ing.name for ing in matching_ingredients]}")
+    def _resolve_ingredients(self, ingredients_text):
+        """
+        (nombres, ids) de los ingredientes de un texto o lista vía IngredientResolver.
+        Los nombres son los de la BD (para mostrar y para la clave del cache); las frases
+        que no resuelve se buscan por subcadena o con errores de tipeo (_match_unresolved)
+        y, si tampoco aparecen, se conservan normalizadas
+        """
+        if not isinstance(ingredients_text, list):
+            ingredients_text = str(ingredients_text)
+        
+        resolver = recipe_catalog.get_ingredient_resolver()
+        names, ids = [], []
+        for phrase, ingredient_ids in resolver.resolve_phrases(ingredients_text):
+            if ingredient_ids:
+                names.extend(resolver.names[ingredient_id] for ingredient_id in ingredient_ids)
+                ids.extend(ingredient_ids)
+            elif len(phrase) > 2:
+                matches = self._match_unresolved(phrase)
+                names.extend(name for ingredient_id, name in matches)
+                ids.extend(ingredient_id for ingredient_id, name in matches)
+                if not matches:
+                    names.append(phrase)
+        
+        return list(dict.fromkeys(names)), list(dict.fromkeys(ids))
+    
+    def _match_unresolved(self, phrase, limit=5):
+        """
+        [(id, nombre)] de los ingredientes parecidos a una frase que el resolvedor no reconoce.
+        En PostgreSQL es una consulta servida por el índice GIN de trigramas (ILIKE para
+        subcadenas y el operador % de pg_trgm para errores de tipeo); en otras bases de
+        datos, el índice de coincidencias en memoria
+        """
+        if db.engine.dialect.name == 'postgresql':
+            return (db.session.query(Ingredient.id, Ingredient.name)
+                    .filter(or_(Ingredient.name.ilike(f'%{phrase}%'), Ingredient.name.bool_op('%')(phrase)))
+                    .order_by(func.similarity(Ingredient.name, phrase).desc(), Ingredient.id)
+                    .limit(limit).all())
+        matches = recipe_catalog.get_ingredient_match_index().match(phrase, limit=limit)
+        return [(ingredient.id, ingredient.name) for ingredient, similarity in matches]
+    
+    def _get_candidate_recipes(self, ingredient_ids, restriction_names=()):
+        """
+        Pares (receta, ingredientes coincidentes) de las recetas que contienen al menos
+        uno de los ingredientes (ids ya resueltos), las de más coincidencias primero
+        """
+        if not ingredient_ids:
+            return []
         
-        if not matching_ingredients:
-            print("❌ DEBUG: No se encontraron ingredientes en la BD")
-            return Recipe.query.limit(20).all()
+        print(f"🔍 DEBUG: Buscando recetas con ingredientes: {ingredient_ids}")
         
-        # Obtener recetas que contengan estos ingredientes
-        recipe_ids = db.session.query(Recipe.id).join(Recipe.ingredients).filter(
-            Ingredient.id.in_([ing.id for ing in matching_ingredients])
-        ).distinct().all()
+        # Los ids ya vienen resueltos: no se vuelve a buscar por nombre ('leche' no trae 'leche de coco')
+        match_count = func.count(func.distinct(Ingredient.id)).label('match_count')
+        query = db.session.query(Recipe, match_count).join(Recipe.ingredients).filter(Ingredient.id.in_(ingredient_ids))
         
-        recipe_ids = [rid[0] for rid in recipe_ids]
-        print(f"🔍 DEBUG: IDs de recetas encontradas: {recipe_ids}")
+        # Restricciones dietéticas como un AND de bits sobre la máscara guardada
+        if restriction_names:
+            query = query.filter(Recipe.compatible_with(restriction_names))
         
-        recipes = Recipe.query.filter(Recipe.id.in_(recipe_ids)).all()
-        print(f"🔍 DEBUG: Recetas obtenidas: {[r.name for r in recipes]}")
+        # Una sola consulta: recetas candidatas con cuántos ingredientes coinciden
+        rows = query.group_by(Recipe.id).order_by(match_count.desc(), Recipe.id).all()
+        if restriction_names:
+            # Recetas sin máscara guardada: se calcula aquí
+            rows = [(recipe, count) for recipe, count in rows
+                    if recipe.restriction_conflicts is not None or recipe.is_compatible_with(restriction_names)]
+        print(f"🔍 DEBUG: Recetas obtenidas: {[(recipe.name, count) for recipe, count in rows]}")
         
-        return recipes
+        return rows
     
     def _apply_expert_rules(self, recipes, user, ingredients, preferences):
-        """Aplica las reglas del sistema experto"""
-        filtered_recipes = recipes
+        """Aplica las reglas del sistema experto como máscaras sobre el catálogo columnar"""
+        recipe_ids = [recipe.id for recipe in recipes]
+        columns = recipe_catalog.get_columnar_catalog()
+        rows = columns.positions(recipe_ids)
+        if (rows < 0).any():
+            # Recetas que aún no están en el snapshot (p. ej. insertadas por SQL): se recargan aquí
+            recipe_catalog.refresh([recipe_id for recipe_id, row in zip(recipe_ids, rows) if row < 0])
+            columns = recipe_catalog.get_columnar_catalog()
+            rows = columns.positions(recipe_ids)
+        selected = np.flatnonzero(rows >= 0)
         
         # Aplicar cada regla
         for rule_name, rule_func in self.rules.items():
             try:
-                print(f"🔍 DEBUG: Aplicando regla: {rule_name}")
-                filtered_recipes = rule_func(filtered_recipes, user, ingredients, preferences)
-                print(f"🔍 DEBUG: Recetas después de {rule_name}: {len(filtered_recipes)}")
+                mask = rule_func(columns, rows[selected], user, ingredients, preferences)
+                selected = selected[mask]
             except Exception as e:
                 print(f"❌ ERROR aplicando regla {rule_name}: {e}")
                 continue
         
-        return filtered_recipes
+        return [recipes[i] for i in selected]
     
-    def _rank_recipes_simple(self, recipes, available_ingredients):
-        """Rankea recetas por coincidencia de ingredientes y rating"""
-        scored_recipes = []
+    def _rank_recipes_simple(self, recipes, available_ingredients, k=None, match_counts=None):
+        """
+        Rankea recetas por coincidencia de ingredientes y rating (solo las k mejores si se indica k).
+        Con match_counts ({id: ingredientes coincidentes} de la consulta de candidatas) la
+        cobertura sale de esos conteos en lugar de volver a cruzar la despensa
+        """
+        if match_counts is not None:
+            ingredient_scores = self._coverage_from_counts(recipes, match_counts)
+        else:
+            ingredient_scores = self._calculate_ingredient_match_scores(recipes, available_ingredients)
+        scores = np.zeros(len(recipes))
         
-        for recipe in recipes:
+        for position, (recipe, ingredient_score) in enumerate(zip(recipes, ingredient_scores)):
             score = 0
             
             # Score por coincidencia de ingredientes (peso 60%)
-            ingredient_score = self._calculate_ingredient_match_score(recipe, available_ingredients)
             score += ingredient_score * 0.6
             
             # Score por rating promedio (peso 30%)
@@ -329,83 +516,70 @@ class CulinaryExpertSystem:
             score += rating_score * 0.3
             
             # Score por popularidad (peso 10%)
-            popularity_score = min(len(recipe.ratings), 10) / 10.0
+            popularity_score = min(recipe.rating_count or 0, 10) / 10.0
             score += popularity_score * 0.1
             
-            scored_recipes.append((recipe, score))
+            scores[position] = score
             print(f"🔍 DEBUG: {recipe.name} - Score: {score:.3f} (ingredientes: {ingredient_score:.3f}, rating: {rating_score:.3f})")
         
-        # Ordenar por score descendente
-        scored_recipes.sort(key=lambda x: x[1], reverse=True)
-        return [recipe for recipe, score in scored_recipes]
+        # Top-k por score descendente (los empates conservan el orden de las candidatas)
+        return [recipes[idx] for idx in top_k_indices(scores, k)]
+    
+    def _coverage_from_counts(self, recipes, match_counts):
+        """Fracción de ingredientes disponibles: coincidencias / ingredientes de la receta"""
+        index = recipe_catalog.get_columnar_catalog().ingredient_index
+        rows = index.positions([recipe.id for recipe in recipes])
+        totals = np.zeros(len(recipes))
+        known = rows >= 0
+        totals[known] = index.ingredient_counts[rows[known]]
+        for position in np.flatnonzero(~known):
+            totals[position] = len(recipes[position].ingredients)  # aún no está en el snapshot
+        
+        counts = np.array([match_counts.get(recipe.id, 0) for recipe in recipes], dtype=float)
+        return np.divide(counts, totals, out=np.zeros(len(recipes)), where=totals > 0).clip(0, 1)
     
     def _calculate_ingredient_match_score(self, recipe, available_ingredients):
         """Calcula el score de coincidencia de ingredientes"""
-        if not recipe.ingredients or not available_ingredients:
-            return 0.0
-        
-        recipe_ingredient_names = [ing.name.lower() for ing in recipe.ingredients]
-        available_lower = [ing.lower() for ing in available_ingredients]
-        
-        matches = 0
-        for recipe_ing in recipe_ingredient_names:
-            for available_ing in available_lower:
-                if available_ing in recipe_ing or recipe_ing in available_ing:
-                    matches += 1
-                    break
-        
-        score = matches / len(recipe_ingredient_names)
-        return score
+        return float(self._calculate_ingredient_match_scores([recipe], available_ingredients)[0])
     
-    def _apply_dietary_restrictions(self, recipes, user, ingredients, preferences):
+    def _calculate_ingredient_match_scores(self, recipes, available_ingredients):
+        """Calcula en lote la fracción de ingredientes de cada receta que hay en la despensa"""
+        scores = np.zeros(len(recipes))
+        if not recipes or not available_ingredients:
+            return scores
+        
+        # Un solo producto disperso sobre el índice invertido del catálogo
+        index = recipe_catalog.get_columnar_catalog().ingredient_index
+        rows = index.positions([recipe.id for recipe in recipes])
+        known = rows >= 0
+        if known.any():
+            match = index.match_pantry(available_ingredients, partial=True)
+            scores[known] = match.coverage[rows[known]]
+        
+        # Recetas aún no incluidas en el snapshot
+        for position in np.flatnonzero(~known):
+            recipe = recipes[position]
+            single = IngredientIndex.from_recipes([{'id': recipe.id, 'ingredients': [ing.name for ing in recipe.ingredients]}])
+            scores[position] = single.match_pantry(available_ingredients, partial=True).coverage[0]
+        
+        return scores
+    
+    def _apply_dietary_restrictions(self, columns, rows, user, ingredients, preferences):
         """Regla: Filtrar recetas según restricciones dietéticas"""
         if not user.dietary_restrictions:
-            return recipes
+            return np.ones(len(rows), dtype=bool)
         
-        filtered_recipes = []
-        for recipe in recipes:
-            is_compatible = True
-            
-            for restriction in user.dietary_restrictions:
-                if not self._recipe_meets_restriction(recipe, restriction):
-                    is_compatible = False
-                    break
-            
-            if is_compatible:
-                filtered_recipes.append(recipe)
-        
-        return filtered_recipes
+        return columns.restriction_mask(rows, [restriction.name for restriction in user.dietary_restrictions])
     
     def _recipe_meets_restriction(self, recipe, restriction):
         """Verifica si una receta cumple con una restricción dietética específica"""
-        restriction_name = restriction.name.lower()
-        recipe_ingredients = [ing.name.lower() for ing in recipe.ingredients]
-        ingredients_text = ' '.join(recipe_ingredients)
-        
-        # Reglas específicas por tipo de restricción
-        if restriction_name == 'vegetariano':
-            forbidden = ['pollo', 'carne', 'pescado', 'cerdo', 'pavo', 'cordero']
-            return not any(forbidden_item in ingredients_text for forbidden_item in forbidden)
-        
-        elif restriction_name == 'vegano':
-            forbidden = ['pollo', 'carne', 'pescado', 'huevo', 'leche', 'queso', 'mantequilla', 'crema']
-            return not any(forbidden_item in ingredients_text for forbidden_item in forbidden)
-        
-        elif restriction_name == 'sin gluten':
-            forbidden = ['harina', 'trigo', 'avena', 'cebada', 'centeno', 'pan', 'pasta']
-            return not any(forbidden_item in ingredients_text for forbidden_item in forbidden)
-        
-        elif restriction_name == 'sin lactosa':
-            forbidden = ['leche', 'queso', 'mantequilla', 'crema', 'yogurt']
-            return not any(forbidden_item in ingredients_text for forbidden_item in forbidden)
-        
-        return True
+        return recipe.is_compatible_with([restriction.name])
     
-    def _match_ingredients(self, recipes, user, ingredients, preferences):
+    def _match_ingredients(self, columns, rows, user, ingredients, preferences):
         """Regla: Priorizar recetas que usen más ingredientes disponibles"""
-        return recipes
+        return np.ones(len(rows), dtype=bool)
     
-    def _apply_time_constraints(self, recipes, user, ingredients, preferences):
+    def _apply_time_constraints(self, columns, rows, user, ingredients, preferences):
         """Regla: Filtrar por tiempo máximo de preparación"""
         max_time = None
         
@@ -419,17 +593,12 @@ class CulinaryExpertSystem:
             max_time = pref.max_prep_time
         
         if not max_time:
-            return recipes
+            return np.ones(len(rows), dtype=bool)
         
-        filtered = []
-        for recipe in recipes:
-            total_time = (recipe.prep_time or 0) + (recipe.cook_time or 0)
-            if total_time <= max_time:
-                filtered.append(recipe)
-        
-        return filtered if filtered else recipes
+        mask = columns.time_mask(rows, max_time)
+        return mask if mask.any() else np.ones(len(rows), dtype=bool)
     
-    def _apply_difficulty_preference(self, recipes, user, ingredients, preferences):
+    def _apply_difficulty_preference(self, columns, rows, user, ingredients, preferences):
         """Regla: Filtrar por dificultad preferida"""
         difficulty = None
         
@@ -440,109 +609,50 @@ class CulinaryExpertSystem:
             difficulty = pref.difficulty_preference
         
         if not difficulty:
-            return recipes
+            return np.ones(len(rows), dtype=bool)
         
-        filtered = [recipe for recipe in recipes if recipe.difficulty == difficulty]
-        return filtered if filtered else recipes
+        mask = columns.difficulty_mask(rows, difficulty)
+        return mask if mask.any() else np.ones(len(rows), dtype=bool)
     
     def get_ingredient_substitutions(self, recipe, available_ingredients):
         """Obtiene sustituciones para ingredientes faltantes en una receta"""
-        available_set = set(ing.lower().strip() for ing in available_ingredients)
-        substitutions = {}
-        
-        for ingredient in recipe.ingredients:
-            ingredient_name = ingredient.name.lower()
-            
-            # Si no tenemos el ingrediente, buscar sustitutos
-            if not any(avail in ingredient_name or ingredient_name in avail for avail in available_set):
-                # Buscar sustituciones en la base de datos
-                substitutes = IngredientSubstitution.query.filter_by(
-                    recipe_id=recipe.id,
-                    original_ingredient_id=ingredient.id
-                ).all()
-                
-                if substitutes:
-                    substitutions[ingredient.name] = [
-                        {
-                            'substitute': sub.substitute_ingredient.name,
-                            'ratio': sub.conversion_ratio,
-                            'notes': sub.notes
-                        } for sub in substitutes
-                    ]
-                else:
-                    # Sustituciones genéricas basadas en categoría
-                    generic_subs = self._get_generic_substitutions(ingredient)
-                    if generic_subs:
-                        substitutions[ingredient.name] = generic_subs
-        
-        return substitutions
-    
-    def _get_generic_substitutions(self, ingredient):
-        """Obtiene sustituciones genéricas basadas en el tipo de ingrediente"""
-        ingredient_name = ingredient.name.lower()
-        
-        generic_substitutions = {
-            # Lácteos
-            'leche': [
-                {'substitute': 'leche de almendra', 'ratio': '1:1', 'notes': 'Para personas sin lactosa'},
-                {'substitute': 'leche de coco', 'ratio': '1:1', 'notes': 'Sabor más dulce'}
-            ],
-            'mantequilla': [
-                {'substitute': 'aceite de coco', 'ratio': '1:1', 'notes': 'Opción vegana'},
-                {'substitute': 'margarina', 'ratio': '1:1', 'notes': 'Sin lactosa'}
-            ],
-            'queso': [
-                {'substitute': 'queso vegano', 'ratio': '1:1', 'notes': 'Opción sin lactosa'},
-                {'substitute': 'levadura nutricional', 'ratio': '1:4', 'notes': 'Sabor similar al queso'}
-            ],
-            
-            # Huevos
-            'huevo': [
-                {'substitute': 'linaza molida + agua', 'ratio': '1 tbsp linaza + 3 tbsp agua por huevo', 'notes': 'Opción vegana'},
-                {'substitute': 'aquafaba', 'ratio': '3 tbsp por huevo', 'notes': 'Líquido de garbanzos'}
-            ],
-            
-            # Harinas
-            'harina': [
-                {'substitute': 'harina de arroz', 'ratio': '1:1', 'notes': 'Sin gluten'},
-                {'substitute': 'harina de almendra', 'ratio': '1:1', 'notes': 'Baja en carbohidratos'}
-            ],
-            
-            # Carnes
-            'pollo': [
-                {'substitute': 'tofu', 'ratio': '1:1', 'notes': 'Opción vegetariana'},
-                {'substitute': 'setas portobello', 'ratio': '1:1', 'notes': 'Textura similar'}
-            ],
-            'carne': [
-                {'substitute': 'lentejas', 'ratio': '1:1', 'notes': 'Rica en proteína'},
-                {'substitute': 'frijoles negros', 'ratio': '1:1', 'notes': 'Opción vegetariana'}
-            ]
-        }
-        
-        # Buscar coincidencias parciales
-        for key, subs in generic_substitutions.items():
-            if key in ingredient_name:
-                return subs
-        
-        return []
+        return self.get_ingredient_substitutions_batch([recipe], available_ingredients)[recipe.id]
+    
+    def get_ingredient_substitutions_batch(self, recipes, available_ingredients):
+        """
+        Sustituciones de varias recetas: {id: sustituciones}. Los faltantes son los de
+        calculate_missing_ingredients_batch (la despensa se cruza una vez con el índice de
+        ingredientes) y los sustitutos salen del grafo en memoria, sin consultas
+        """
+        graph = recipe_catalog.get_substitution_graph()
+        missing = self.calculate_missing_ingredients_batch(recipes, available_ingredients)
+        return {recipe.id: graph.for_ingredients(missing[recipe.id]['missing'], recipe.id) for recipe in recipes}
     
     def calculate_missing_ingredients(self, recipe, available_ingredients):
         """Calcula qué ingredientes faltan para una receta"""
-        available_set = set(ing.lower().strip() for ing in available_ingredients)
-        recipe_ingredients = [ing.name.lower() for ing in recipe.ingredients]
-        
-        missing = []
-        available = []
+        return self.calculate_missing_ingredients_batch([recipe], available_ingredients)[recipe.id]
+    
+    def calculate_missing_ingredients_batch(self, recipes, available_ingredients):
+        """Ingredientes faltantes de varias recetas, resolviendo la despensa una sola vez: {id: info}"""
+        index = recipe_catalog.get_columnar_catalog().ingredient_index
+        pantry = index.pantry_vector(available_ingredients, partial=True)
         
-        for recipe_ing in recipe_ingredients:
-            found = False
-            for avail_ing in available_set:
-                if avail_ing in recipe_ing or recipe_ing in avail_ing:
-                    available.append(recipe_ing)
-                    found = True
-                    break
-            if not found:
-                missing.append(recipe_ing)
+        result = {}
+        for recipe in recipes:
+            row = index.recipe_positions.get(recipe.id)
+            if row is None:
+                single = IngredientIndex.from_recipes([{'id': recipe.id, 'ingredients': [ing.name for ing in recipe.ingredients]}])
+                result[recipe.id] = self._missing_info(single, 0, single.pantry_vector(available_ingredients, partial=True))
+            else:
+                result[recipe.id] = self._missing_info(index, row, pantry)
+        return result
+    
+    def _missing_info(self, index, row, pantry):
+        """Faltantes, disponibles y cobertura de una fila del índice de ingredientes"""
+        recipe_ingredients = index.recipe_ingredients[row]
+        missing = index.missing_for(row, pantry)
+        missing_set = set(missing)
+        available = [name for name in recipe_ingredients if name not in missing_set]
         
         coverage_percentage = len(available) / len(recipe_ingredients) * 100 if recipe_ingredients else 0
         
@@ -552,6 +662,24 @@ class CulinaryExpertSystem:
             'coverage_percentage': coverage_percentage
         }
     
+    def what_can_i_cook(self, available_ingredients, max_missing=2, limit=50, partial=True):
+        """
+        Recetas cocinables con la despensa del usuario: primero las completas y luego
+        las que necesitan 1, 2 ... max_missing ingredientes más, cada grupo por rating
+        """
+        index = recipe_catalog.get_columnar_catalog().ingredient_index
+        pantry = index.pantry_vector(available_ingredients, partial=partial)
+        rows, missing_counts = index.cookable(pantry, max_missing)
+        
+        return [
+            {
+                'recipe': index.recipes[row],
+                'missing_count': int(missing_count),
+                'missing_ingredients': index.missing_for(row, pantry)
+            }
+            for row, missing_count in zip(rows[:limit].tolist(), missing_counts[:limit].tolist())
+        ]
+    
     def get_nutritional_analysis(self, recipe):
         """Proporciona análisis nutricional de una receta"""
         if not recipe.nutritional_info:
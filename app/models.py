@@ -2,6 +2,10 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import DDL, case, cast, event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+from ml_models.dietary_rules import recipe_conflicts, required_mask
+from sqlalchemy.ext.hybrid import hybrid_property
 
 db = SQLAlchemy()
 
@@ -56,6 +60,15 @@ class Recipe(db.Model):
     image_path = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Agregados de calificaciones, mantenidos al calificar (ver apply_rating_change)
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    avg_rating = db.Column(db.Float, nullable=False, default=0.0, server_default='0', index=True)
+    
+    # Bits de restricciones dietéticas que la receta NO cumple (ver ml_models/dietary_rules.py).
+    # NULL = sin calcular (recetas insertadas por los scripts de data/): se calcula al leerla
+    restriction_conflicts = db.Column(db.BigInteger, nullable=True)
+    
     # Relaciones
     ingredients = db.relationship('Ingredient', 
                                 secondary=recipe_ingredients, 
@@ -68,11 +81,78 @@ class Recipe(db.Model):
     def total_time(self):
         return (self.prep_time or 0) + (self.cook_time or 0)
     
-    @property
+    @hybrid_property
     def average_rating(self):
-        if self.ratings:
-            return sum(rating.rating for rating in self.ratings) / len(self.ratings)
-        return 0
+        return self.avg_rating or 0
+    
+    @average_rating.expression
+    def average_rating(cls):
+        return cls.avg_rating
+    
+    def compute_restriction_conflicts(self):
+        """Máscara de restricciones a partir de ingredientes e información nutricional"""
+        nutrition = None
+        if self.nutritional_info:
+            nutrition = {
+                'sugar': self.nutritional_info.sugar,
+                'sodium': self.nutritional_info.sodium,
+                'carbs': self.nutritional_info.carbs
+            }
+        
+        return recipe_conflicts(
+            [ing.name for ing in self.ingredients],
+            nutrition,
+            has_allergen=any(ing.common_allergen for ing in self.ingredients)
+        )
+    
+    def refresh_restriction_conflicts(self):
+        """Recalcula y guarda la máscara de restricciones"""
+        self.restriction_conflicts = self.compute_restriction_conflicts()
+    
+    @property
+    def conflict_mask(self):
+        """Máscara guardada, o calculada en el momento si la receta aún no la tiene"""
+        if self.restriction_conflicts is None:
+            return self.compute_restriction_conflicts()
+        return self.restriction_conflicts
+    
+    def is_compatible_with(self, restriction_names):
+        """True si la receta cumple todas las restricciones"""
+        return not self.conflict_mask & required_mask(restriction_names)
+    
+    @classmethod
+    def compatible_with(cls, restriction_names):
+        """
+        Condición SQL: recetas compatibles con todas las restricciones (un AND de bits).
+        Las recetas sin máscara (NULL) pasan el filtro y se verifican con is_compatible_with
+        """
+        return or_(cls.restriction_conflicts.is_(None),
+                   cls.restriction_conflicts.op('&')(required_mask(restriction_names)) == 0)
+    
+    def apply_rating_change(self, new_rating, previous_rating=None):
+        """Actualiza los agregados de calificación con un UPDATE atómico"""
+        count_delta = 0 if previous_rating is not None else 1
+        sum_delta = new_rating - (previous_rating or 0)
+        new_count = Recipe.rating_count + count_delta
+        new_sum = Recipe.rating_sum + sum_delta
+        
+        Recipe.query.filter_by(id=self.id).update({
+            Recipe.rating_count: new_count,
+            Recipe.rating_sum: new_sum,
+            Recipe.avg_rating: case((new_count > 0, cast(new_sum, db.Float) / new_count), else_=0.0)
+        }, synchronize_session=False)
+        db.session.expire(self, ['rating_count', 'rating_sum', 'avg_rating'])
+    
+    @classmethod
+    def recompute_rating_stats(cls):
+        """Recalcula los agregados de todas las recetas desde RecipeRating (un solo UPDATE); devuelve cuántas"""
+        per_recipe = RecipeRating.recipe_id == cls.id
+        updated = cls.query.update({
+            cls.rating_count: select(func.count(RecipeRating.id)).where(per_recipe).scalar_subquery(),
+            cls.rating_sum: select(func.coalesce(func.sum(RecipeRating.rating), 0)).where(per_recipe).scalar_subquery(),
+            cls.avg_rating: select(func.coalesce(func.avg(RecipeRating.rating), 0)).where(per_recipe).scalar_subquery()
+        }, synchronize_session=False)
+        return updated
 
 class Ingredient(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -89,6 +169,17 @@ class Ingredient(db.Model):
                                                 foreign_keys='IngredientSubstitution.substitute_ingredient_id',
                                                 backref='substitute_ingredient')
 
+# Índice GIN de trigramas (pg_trgm): ILIKE '%x%' y el operador % (ingredientes sin resolver en el
+# sistema experto, sugerencias de ingredientes) sin recorrer la tabla
+event.listen(
+    Ingredient.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql')
+)
+db.Index(
+    'ix_ingredient_name_trgm', Ingredient.name,
+    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+).ddl_if(dialect='postgresql')
+
 class DietaryRestriction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False, unique=True)
@@ -136,6 +227,8 @@ class RecipeRating(db.Model):
     rating = db.Column(db.Integer, nullable=False)  # 1-5 estrellas
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Fecha de la última edición; los workers aplican en línea las calificaciones por esta fecha
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class UserIngredient(db.Model):
     """Ingredientes que el usuario tiene disponibles"""
@@ -147,4 +240,27 @@ class UserIngredient(db.Model):
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relación con ingrediente
-    ingredient = db.relationship('Ingredient', backref='user_stocks')
\ No newline at end of file
+    ingredient = db.relationship('Ingredient', backref='user_stocks')
+
+@event.listens_for(Session, 'before_flush')
+def _refresh_restriction_conflicts(session, flush_context, instances):
+    """Mantiene Recipe.restriction_conflicts al escribir recetas, nutrición o ingredientes"""
+    recipes = set()
+    
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Recipe):
+            # Una calificación nueva también ensucia la receta: solo importan sus ingredientes
+            if obj in session.new or inspect(obj).attrs.ingredients.history.has_changes():
+                recipes.add(obj)
+        elif isinstance(obj, NutritionalInfo):
+            recipe = obj.recipe or (session.get(Recipe, obj.recipe_id) if obj.recipe_id else None)
+            if recipe is not None:
+                recipes.add(recipe)
+        elif isinstance(obj, Ingredient) and obj not in session.new:
+            state = inspect(obj)
+            if state.attrs.name.history.has_changes() or state.attrs.common_allergen.history.has_changes():
+                recipes.update(obj.recipe_list)
+    
+    for recipe in recipes:
+        if recipe not in session.deleted:
+            recipe.refresh_restriction_conflicts()
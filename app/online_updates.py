@@ -0,0 +1,170 @@
+# app/online_updates.py - Actualización en línea de modelos tras cada calificación
+from datetime import datetime
+import os
+import threading
+import time
+
+from sqlalchemy import and_, or_
+
+from app.models import RecipeRating
+
+
+class OnlineModelUpdater:
+    """
+    Aplica las calificaciones nuevas a los modelos en memoria (vectores del filtrado
+    colaborativo de la receta y del usuario) en lugar de reentrenar dentro de la
+    petición. El estado compartido entre workers es la BD: cada worker aplica, al
+    sincronizar, las calificaciones creadas o editadas después de la última que vio
+    (cursor por updated_at e id), así una calificación llega a todos en segundos. Las
+    pendientes de compactar son las posteriores a los datos de la versión actual del
+    registro; un hilo por worker
+    (iniciado después del fork) lanza el reentrenamiento completo si hay alguna y el
+    bloqueo de trabajos impide que dos workers lo lancen a la vez.
+    """
+
+    def __init__(self, expert_system, training_jobs, check_interval_seconds=5, max_batch=500):
+        self.expert_system = expert_system
+        self.training_jobs = training_jobs
+        self.check_interval_seconds = check_interval_seconds
+        self.max_batch = max_batch
+        self._cursor = None  # (updated_at, id) de la última calificación aplicada por este worker
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._app = None
+        self.interval_seconds = 0
+        self._thread = None
+        self._thread_pid = None
+        self.last_compaction = None
+
+    def models_as_of(self, manifest=None):
+        """Fecha (UTC) de los datos con que se entrenó una versión (la actual del registro por omisión)"""
+        if manifest is None:
+            registry = self.training_jobs.registry
+            version = registry.current_version()
+            manifest = registry.manifest(version) if version else None
+        if not manifest:
+            return None
+        timestamp = (manifest.get('metadata') or {}).get('data_as_of', manifest.get('created_at'))
+        return datetime.utcfromtimestamp(timestamp) if timestamp else None
+
+    def record_rating(self, user_id, recipe_id):
+        """Aplica en este worker la calificación recién guardada (las de otros workers llegan al sincronizar); True si se aplicó"""
+        bundle = self.expert_system.loaded_models  # no fuerza la carga de los modelos
+        if bundle is None or not bundle.get('recommendation_engine'):
+            return False
+        applied = self._apply(bundle, user_id, recipe_id)
+        self.sync()
+        return applied
+
+    def reset(self):
+        """Tras cargar una versión nueva: se vuelven a aplicar las calificaciones posteriores a sus datos"""
+        with self._lock:
+            self._cursor = None
+        return self.sync(force=True)
+
+    def sync(self, force=False):
+        """Aplica las calificaciones guardadas por cualquier worker desde la última aplicada; devuelve cuántas"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval_seconds:
+            return 0
+        self._last_check = now
+
+        bundle = self.expert_system.loaded_models  # no fuerza la carga de los modelos
+        if bundle is None or not bundle.get('recommendation_engine'):
+            return 0
+
+        with self._lock:
+            query = RecipeRating.query.with_entities(RecipeRating.id, RecipeRating.user_id,
+                                                     RecipeRating.recipe_id, RecipeRating.updated_at)
+            cursor = self._cursor
+            if cursor is None:
+                as_of = self.models_as_of(bundle.manifest)
+                if as_of is None:
+                    # Modelos sin versión del registro: las calificaciones existentes ya están en ellos
+                    latest = query.order_by(RecipeRating.updated_at.desc(), RecipeRating.id.desc()).first()
+                    self._cursor = (latest.updated_at, latest.id) if latest else (datetime.utcnow(), 0)
+                    return 0
+                cursor = (as_of, 0)
+
+            # Cursor (updated_at, id): las filas con la misma fecha que quedaron fuera del lote llegan en el siguiente
+            updated_at, last_id = cursor
+            rows = (query.filter(or_(RecipeRating.updated_at > updated_at,
+                                     and_(RecipeRating.updated_at == updated_at, RecipeRating.id > last_id)))
+                    .order_by(RecipeRating.updated_at, RecipeRating.id).limit(self.max_batch).all())
+            for user_id, recipe_id in dict.fromkeys((row.user_id, row.recipe_id) for row in rows):
+                if self._apply(bundle, user_id, recipe_id):
+                    # Cada worker aplica la calificación a sus modelos: basta invalidar su propio cache
+                    self.expert_system.invalidate_user_recommendations(user_id, all_workers=False)
+            self._cursor = (rows[-1].updated_at, rows[-1].id) if rows else cursor
+            return len(rows)
+
+    def _apply(self, bundle, user_id, recipe_id):
+        engine = bundle.get('recommendation_engine')
+        try:
+            user_ratings = dict(RecipeRating.query.filter_by(user_id=user_id)
+                                .with_entities(RecipeRating.recipe_id, RecipeRating.rating).all())
+            recipe_ratings = dict(RecipeRating.query.filter_by(recipe_id=recipe_id)
+                                  .with_entities(RecipeRating.user_id, RecipeRating.rating).all())
+            updated = engine.update_rating(user_id, recipe_id, user_ratings, recipe_ratings)
+            if updated:
+                print(f"⚡ Modelo colaborativo actualizado en línea (usuario {user_id}, receta {recipe_id})")
+            return updated
+        except Exception as e:
+            print(f"⚠️ Error en actualización en línea: {e}")
+            return False
+
+    def pending_count(self):
+        """Calificaciones posteriores a los datos de la versión actual (las mismas para todos los workers)"""
+        as_of = self.models_as_of()
+        query = RecipeRating.query
+        if as_of is not None:
+            query = query.filter(RecipeRating.updated_at > as_of)
+        return query.count()
+
+    def compact(self, force=False):
+        """Lanza el reentrenamiento completo como trabajo en segundo plano si hay calificaciones pendientes"""
+        try:
+            pending = self.pending_count()
+            if not pending and not force:
+                return False
+
+            print(f"🗜️ Compactando modelos ({pending} calificaciones en línea)...")
+            job, started = self.training_jobs.submit()
+            if not started:
+                # Otro worker ya la lanzó; se revisa en la próxima ronda
+                print(f"⚠️ Compactación pospuesta: ya hay un entrenamiento en curso ({job['job_id'] if job else '?'})")
+                return False
+            self.last_compaction = time.time()
+            return True
+
+        except Exception as e:
+            print(f"⚠️ Compactación pospuesta: {e}")
+            return False
+
+    def start(self, app, interval_seconds):
+        """Configura la compactación periódica; el hilo lo inicia cada worker con ensure_started"""
+        self._app = app
+        self.interval_seconds = interval_seconds or 0
+
+    def ensure_started(self):
+        """
+        Inicia el hilo de compactación de este proceso (daemon). Se comprueba el pid:
+        con gunicorn --preload la app se crea en el maestro y los hilos no sobreviven al fork
+        """
+        if not self.interval_seconds or self._app is None or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            app, interval_seconds = self._app, self.interval_seconds
+
+            def run():
+                while True:
+                    time.sleep(interval_seconds)
+                    with app.app_context():
+                        self.compact()
+
+            self._thread = threading.Thread(target=run, name='model-compaction', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+        print(f"✅ Compactación de modelos cada {interval_seconds}s (pid {os.getpid()})")
@@ -377,42 +377,17 @@ class RecipePDFGenerator:
             story.append(Spacer(1, 0.2*inch))
     
     def _get_simple_substitutions(self, recipe):
-        """Obtiene sustituciones simples sin usar expert_system"""
-        substitutions = {}
-        
-        # Sustituciones básicas hardcodeadas
-        common_substitutions = {
-            'leche': [
-                {'substitute': 'leche de almendra', 'ratio': '1:1', 'notes': 'Opción sin lactosa'},
-                {'substitute': 'leche de coco', 'ratio': '1:1', 'notes': 'Sabor más cremoso'}
-            ],
-            'mantequilla': [
-                {'substitute': 'aceite de coco', 'ratio': '1:1', 'notes': 'Opción vegana'},
-                {'substitute': 'margarina', 'ratio': '1:1', 'notes': 'Sin lactosa'}
-            ],
-            'huevo': [
-                {'substitute': 'linaza molida + agua', 'ratio': '1 tbsp + 3 tbsp agua', 'notes': 'Opción vegana'},
-                {'substitute': 'aquafaba', 'ratio': '3 tbsp por huevo', 'notes': 'Líquido de garbanzos'}
-            ],
-            'azúcar': [
-                {'substitute': 'stevia', 'ratio': '1:8', 'notes': 'Mucho más dulce'},
-                {'substitute': 'miel', 'ratio': '3:4', 'notes': 'Opción natural'}
-            ],
-            'harina': [
-                {'substitute': 'harina de arroz', 'ratio': '1:1', 'notes': 'Sin gluten'},
-                {'substitute': 'harina de almendra', 'ratio': '1:1', 'notes': 'Baja en carbohidratos'}
-            ]
-        }
+        """Obtiene sustituciones del grafo compartido sin usar expert_system"""
+        try:
+            from app.recipe_catalog import recipe_catalog
+            graph = recipe_catalog.get_substitution_graph()
+        except Exception as e:
+            print(f"⚠️ Grafo de sustituciones no disponible, usando reglas genéricas: {e}")
+            from ml_models.substitution_graph import SubstitutionGraph
+            graph = SubstitutionGraph()
         
         # Buscar ingredientes que tengan sustitutos
-        for ingredient in recipe.ingredients:
-            ingredient_name = ingredient.name.lower()
-            for key, subs in common_substitutions.items():
-                if key in ingredient_name:
-                    substitutions[ingredient.name] = subs
-                    break
-        
-        return substitutions
+        return graph.for_ingredients([ingredient.name for ingredient in recipe.ingredients], recipe.id)
     
     def _add_cooking_tips(self, story, recipe):
         """Agregar consejos de cocina usando función simple"""
@@ -0,0 +1,422 @@
+# app/recipe_catalog.py - Catálogo de recetas en memoria para ML
+from app.models import (Recipe, RecipeRating, NutritionalInfo, Ingredient, IngredientSubstitution,
+                        DietaryRestriction, db, user_restrictions)
+from ml_models.columnar_catalog import ColumnarCatalog
+from ml_models.ingredient_resolver import IngredientResolver
+from ml_models.substitution_graph import SubstitutionGraph
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, aliased, selectinload
+import json
+import os
+import threading
+
+# Clave en session.info donde se acumulan las recetas modificadas en cada flush
+_CHANGED_KEY = 'recipe_catalog_changed_ids'
+_FULL_RELOAD_KEY = 'recipe_catalog_full_reload'
+_INGREDIENTS_KEY = 'recipe_catalog_ingredients_changed'
+_SUBSTITUTIONS_KEY = 'recipe_catalog_substitutions_changed'
+
+# Registro de cambios compartido por todos los procesos de la app
+DEFAULT_CHANGES_PATH = 'ml_models/trained_models/catalog_changes.log'
+
+
+def recipe_to_ml_dict(recipe):
+    """Convierte una receta ORM al diccionario que consumen los modelos de ML"""
+    recipe_dict = {
+        'id': recipe.id,
+        'name': recipe.name,
+        'description': recipe.description or '',
+        'ingredients': [ing.name for ing in recipe.ingredients],
+        'cuisine_type': recipe.cuisine_type,
+        'difficulty': recipe.difficulty,
+        'prep_time': recipe.prep_time or 30,
+        'cook_time': recipe.cook_time or 30,
+        'servings': recipe.servings or 4,
+        'total_time': recipe.total_time,
+        'avg_rating': recipe.average_rating or 3.0,
+        'ratings': [r.rating for r in recipe.ratings],
+        'restriction_conflicts': recipe.restriction_conflicts  # None si aún no se calculó
+    }
+
+    # Agregar info nutricional si existe
+    if recipe.nutritional_info:
+        recipe_dict['nutritional_info'] = {
+            'calories_per_serving': recipe.nutritional_info.calories_per_serving or 400,
+            'protein': recipe.nutritional_info.protein or 15,
+            'carbs': recipe.nutritional_info.carbs or 50,
+            'fat': recipe.nutritional_info.fat or 12,
+            'fiber': recipe.nutritional_info.fiber or 3,
+            'sugar': recipe.nutritional_info.sugar or 8,
+            'sodium': recipe.nutritional_info.sodium or 800
+        }
+
+    return recipe_dict
+
+
+def hydrate_recipes(recipe_ids):
+    """
+    Convierte una lista ordenada de ids en objetos Recipe con una sola consulta IN.
+    Ingredientes e información nutricional llegan con selectinload (las sustituciones
+    salen del grafo en memoria), así una página de resultados hace un número fijo de
+    consultas. Conserva el orden recibido y omite ids inexistentes o repetidos.
+    """
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if not recipe_ids:
+        return []
+    
+    recipes = Recipe.query.options(
+        selectinload(Recipe.ingredients),
+        selectinload(Recipe.nutritional_info)
+    ).filter(Recipe.id.in_(recipe_ids)).all()
+    
+    recipes_by_id = {recipe.id: recipe for recipe in recipes}
+    return [recipes_by_id[recipe_id] for recipe_id in recipe_ids if recipe_id in recipes_by_id]
+
+
+class CatalogChangeLog:
+    """
+    Registro de cambios del catálogo compartido entre procesos: un archivo de líneas
+    JSON al que cada commit agrega una línea ({'recipes': [...], 'reload': ...}). Cada
+    proceso lee lo nuevo desde su última posición; sin cambios basta un os.stat. Al
+    pasar de max_bytes se reemplaza por un archivo vacío y quien lo note recarga todo.
+    """
+
+    def __init__(self, path, max_bytes=1 << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def position(self):
+        """(archivo, tamaño) actuales; el archivo se crea si aún no existe"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            os.close(os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644))
+            stat = os.stat(self.path)
+        return (stat.st_ino, stat.st_size)
+
+    def append(self, entry):
+        """Agrega un cambio con una sola escritura en modo append (las líneas no se mezclan)"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644))
+            os.replace(tmp_path, self.path)
+
+    def read_since(self, position):
+        """(cambios nuevos, posición nueva); cambios None si el archivo se reemplazó"""
+        current = self.position()
+        if current[0] != position[0] or current[1] < position[1]:
+            return None, current
+        if current[1] == position[1]:
+            return [], current
+        with open(self.path, 'rb') as f:
+            f.seek(position[1])
+            data = f.read(current[1] - position[1])
+        complete = data[:data.rfind(b'\n') + 1]  # una línea a medio escribir se lee la próxima vez
+        return [json.loads(line) for line in complete.splitlines() if line.strip()], (position[0], position[1] + len(complete))
+
+
+class RecipeCatalog:
+    """
+    Snapshot versionado del catálogo de recetas, compartido por todo el proceso.
+
+    Se construye una sola vez con carga anticipada de ingredientes, ratings e
+    información nutricional. Los cambios confirmados sobre Recipe, RecipeRating o
+    NutritionalInfo se publican en el registro de cambios y cada proceso, en su
+    siguiente acceso, solo recarga las recetas afectadas. Cada cambio produce una
+    lista nueva (copy-on-write), así que quien ya tiene un snapshot no lo ve mutar.
+    Otros componentes con estado por proceso (el cache de recomendaciones) publican
+    sus invalidaciones en el mismo registro con broadcast y las reciben con subscribe.
+    """
+
+    def __init__(self, changes_path=DEFAULT_CHANGES_PATH):
+        self._lock = threading.RLock()
+        self._snapshot = ([], {})  # (lista de dicts ordenada por id, id de receta -> posición)
+        self._pending_ids = set()
+        self._full_reload = True
+        self._columnar = None
+        self._ingredient_matches = None
+        self._ingredient_resolver = None
+        self._substitutions = None
+        self.changes = CatalogChangeLog(changes_path)
+        self._changes_position = None  # hasta dónde se leyó el registro de cambios
+        self._changes_applied = 0  # cambios del catálogo leídos por este proceso
+        self._subscribers = []
+        self.version = 0
+
+    def get_recipes_data(self):
+        """Devuelve el snapshot actual (no debe modificarse)"""
+        return self._current_snapshot()[0]
+
+    def get_recipe_data(self, recipe_id):
+        """Devuelve el diccionario de una receta del snapshot o None"""
+        recipes, positions = self._current_snapshot()
+        position = positions.get(recipe_id)
+        return recipes[position] if position is not None else None
+
+    def _current_snapshot(self):
+        """(recetas, posiciones) al día con los cambios de todos los procesos, leídos juntos bajo el lock"""
+        with self._lock:
+            self._read_changes()
+            if self._full_reload:
+                self._load_all()
+            elif self._pending_ids:
+                self._patch(self._pending_ids)
+            return self._snapshot
+
+    def current_version(self):
+        """Versión de los datos del catálogo al día con el registro de cambios, sin recargar recetas"""
+        with self._lock:
+            self._read_changes()
+            return self._changes_applied
+
+    def get_columnar_catalog(self):
+        """Devuelve la vista columnar del snapshot, reconstruida solo si cambió la versión"""
+        with self._lock:
+            recipes = self.get_recipes_data()
+            if self._columnar is None or self._columnar[0] != self.version:
+                self._columnar = (self.version, ColumnarCatalog.from_recipes(recipes))
+            return self._columnar[1]
+
+    def get_ingredient_match_index(self):
+        """Índice de nombres, subcadenas y errores de tipeo (IngredientMatchIndex) de todos los ingredientes"""
+        with self._lock:
+            self._read_changes()
+            if self._ingredient_matches is None:
+                from ml_models.nlp_processor import IngredientMatchIndex  # NLTK se importa al primer uso
+                rows = Ingredient.query.with_entities(Ingredient.id, Ingredient.name).order_by(Ingredient.id).all()
+                self._ingredient_matches = IngredientMatchIndex(rows)
+            return self._ingredient_matches
+
+    def get_ingredient_resolver(self):
+        """Resolución de texto libre a ids de Ingredient, compartida por todas las peticiones"""
+        with self._lock:
+            self._read_changes()
+            if self._ingredient_resolver is None:
+                rows = Ingredient.query.with_entities(Ingredient.id, Ingredient.name).order_by(Ingredient.id).all()
+                self._ingredient_resolver = IngredientResolver(rows)
+            return self._ingredient_resolver
+
+    def invalidate_ingredient_names(self):
+        """Fuerza reconstruir el índice de coincidencias y la resolución de ingredientes (en todos los procesos)"""
+        self._record({'ingredients': True})
+    
+    def get_substitution_graph(self):
+        """Grafo de sustituciones (reglas genéricas + tabla IngredientSubstitution), una consulta al construirlo"""
+        with self._lock:
+            self._read_changes()
+            if self._substitutions is None:
+                original = aliased(Ingredient)
+                substitute = aliased(Ingredient)
+                rows = (IngredientSubstitution.query
+                        .join(original, IngredientSubstitution.original_ingredient_id == original.id)
+                        .join(substitute, IngredientSubstitution.substitute_ingredient_id == substitute.id)
+                        .with_entities(IngredientSubstitution.recipe_id, original.name, substitute.name,
+                                       IngredientSubstitution.conversion_ratio, IngredientSubstitution.notes)
+                        .order_by(IngredientSubstitution.id)
+                        .all())
+                self._substitutions = SubstitutionGraph.from_rows(rows)
+            return self._substitutions
+    
+    def invalidate_substitutions(self):
+        """Fuerza reconstruir el grafo de sustituciones (en todos los procesos)"""
+        self._record({'substitutions': True})
+
+    def mark_changed(self, recipe_ids):
+        """Marca recetas para recargarlas en el próximo acceso (en todos los procesos)"""
+        self._record({'recipes': sorted(recipe_ids)})
+
+    def refresh(self, recipe_ids):
+        """Recarga ya, solo en este proceso, recetas que faltan en el snapshot (las que no pasaron por el registro de cambios)"""
+        with self._lock:
+            self._pending_ids.update(recipe_ids)
+            return self._current_snapshot()[0]
+
+    def invalidate(self):
+        """Fuerza la reconstrucción completa en el próximo acceso (en todos los procesos)"""
+        self._record({'reload': True})
+
+    def broadcast(self, change):
+        """Publica en todos los procesos un cambio para los suscriptores (no toca el catálogo)"""
+        self._record(change)
+
+    def subscribe(self, callback):
+        """callback(cambio) se llama con cada cambio leído del registro, bajo el lock del catálogo"""
+        self._subscribers.append(callback)
+
+    def _record(self, change):
+        """Publica un cambio en el registro compartido; si no se puede escribir, se aplica solo aquí"""
+        try:
+            self.changes.append(change)
+        except OSError as e:
+            print(f"⚠️ No se pudo registrar el cambio del catálogo ({e}); se aplica solo en este proceso")
+            with self._lock:
+                self._apply_change(change)
+
+    def _read_changes(self):
+        """Aplica los cambios registrados (por este u otro proceso) desde la última lectura"""
+        try:
+            if self._changes_position is None:
+                # Primer acceso: todo está por cargar, basta con empezar a leer desde aquí
+                self._changes_position = self.changes.position()
+                return
+            changes, self._changes_position = self.changes.read_since(self._changes_position)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ No se pudo leer el registro de cambios del catálogo: {e}")
+            return
+        if changes is None:
+            changes = [{'reload': True, 'ingredients': True, 'substitutions': True}]
+        for change in changes:
+            self._apply_change(change)
+
+    def _apply_change(self, change):
+        for callback in self._subscribers:
+            callback(change)
+        if not change.keys() & {'ingredients', 'substitutions', 'reload', 'recipes'}:
+            return
+        self._changes_applied += 1
+        if change.get('ingredients'):
+            self._ingredient_matches = None
+            self._ingredient_resolver = None
+        if change.get('substitutions'):
+            self._substitutions = None
+        if change.get('reload'):
+            self._full_reload = True
+        self._pending_ids.update(change.get('recipes', ()))
+
+    def _query(self):
+        return Recipe.query.options(
+            selectinload(Recipe.ingredients),
+            selectinload(Recipe.ratings),
+            selectinload(Recipe.nutritional_info)
+        )
+
+    def _load_all(self):
+        recipes = self._query().order_by(Recipe.id).all()
+        self._publish([recipe_to_ml_dict(recipe) for recipe in recipes])
+        self._full_reload = False
+        self._pending_ids.clear()
+        print(f"📚 Catálogo de recetas cargado: {len(self._snapshot[0])} recetas (v{self.version})")
+
+    def _patch(self, recipe_ids):
+        changed_ids = set(recipe_ids)
+        reloaded = {
+            recipe.id: recipe_to_ml_dict(recipe)
+            for recipe in self._query().filter(Recipe.id.in_(changed_ids)).all()
+        }
+
+        # Reemplazar, eliminar o agregar sin tocar la lista publicada
+        recipes = [reloaded.pop(recipe['id'], recipe) for recipe in self._snapshot[0]
+                   if recipe['id'] not in changed_ids or recipe['id'] in reloaded]
+        recipes.extend(sorted(reloaded.values(), key=lambda r: r['id']))
+
+        self._publish(recipes)
+        self._pending_ids.clear()
+
+    def _publish(self, recipes):
+        # Recetas y posiciones se reemplazan juntas: un lector nunca ve una sin la otra
+        self._snapshot = (recipes, {recipe['id']: position for position, recipe in enumerate(recipes)})
+        self.version += 1
+
+
+# Instancia única por proceso
+recipe_catalog = RecipeCatalog()
+
+
+def prepare_recipes_data_for_ml():
+    """Prepara datos de recetas para ML (snapshot compartido del catálogo)"""
+    return recipe_catalog.get_recipes_data()
+
+
+def prepare_ratings_data_for_ml():
+    """Prepara datos de ratings para ML (usuarios y sus restricciones en consultas aparte, no una por rating)"""
+    ratings = RecipeRating.query.join(Recipe, Recipe.id == RecipeRating.recipe_id).all()
+    avg_by_user = dict(db.session.query(RecipeRating.user_id, db.func.avg(RecipeRating.rating))
+                       .group_by(RecipeRating.user_id).all())
+    restrictions_by_user = {}
+    for user_id, name in (db.session.query(user_restrictions.c.user_id, DietaryRestriction.name)
+                          .join(DietaryRestriction, DietaryRestriction.id == user_restrictions.c.restriction_id)):
+        restrictions_by_user.setdefault(user_id, []).append(name)
+    ratings_data = []
+    
+    # Solo ratings de recetas existentes (el join)
+    for rating in ratings:
+        user_profile = {
+            'dietary_restrictions': restrictions_by_user.get(rating.user_id, []),
+            'avg_rating_given': float(avg_by_user.get(rating.user_id) or 4.0)
+        }
+        
+        ratings_data.append({
+            'user_id': rating.user_id,
+            'recipe_id': rating.recipe_id,
+            'rating': rating.rating,
+            'user_profile': user_profile
+        })
+    
+    return ratings_data
+
+
+def _affected_recipe_id(obj):
+    if isinstance(obj, Recipe):
+        return obj.id
+    if isinstance(obj, (RecipeRating, NutritionalInfo)):
+        return obj.recipe_id
+    return None
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_catalog_changes(session, flush_context):
+    """Acumula las recetas afectadas por el flush hasta el commit"""
+    changed_ids = session.info.setdefault(_CHANGED_KEY, set())
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, IngredientSubstitution):
+            session.info[_SUBSTITUTIONS_KEY] = True
+            continue
+        
+        if isinstance(obj, Ingredient):
+            renamed = obj not in session.new and inspect(obj).attrs.name.history.has_changes()
+            if obj in session.new or obj in session.deleted or renamed:
+                session.info[_INGREDIENTS_KEY] = True
+            if obj in session.deleted or renamed:
+                # Renombrar o borrar un ingrediente afecta a todas sus recetas y sustituciones
+                session.info[_FULL_RELOAD_KEY] = True
+                session.info[_SUBSTITUTIONS_KEY] = True
+            continue
+
+        recipe_id = _affected_recipe_id(obj)
+        if recipe_id is not None:
+            changed_ids.add(recipe_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_catalog_changes(session):
+    """Publica los cambios del commit en una sola línea del registro compartido"""
+    change = {}
+    changed_ids = session.info.pop(_CHANGED_KEY, None)
+    if session.info.pop(_INGREDIENTS_KEY, False):
+        change['ingredients'] = True
+    if session.info.pop(_SUBSTITUTIONS_KEY, False):
+        change['substitutions'] = True
+    if session.info.pop(_FULL_RELOAD_KEY, False):
+        change['reload'] = True
+    elif changed_ids:
+        change['recipes'] = sorted(changed_ids)
+    if change:
+        recipe_catalog._record(change)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_FULL_RELOAD_KEY, None)
+    session.info.pop(_INGREDIENTS_KEY, None)
+    session.info.pop(_SUBSTITUTIONS_KEY, None)
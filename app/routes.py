@@ -1,9 +1,13 @@
 # app/routes.py - VERSIÓN CORREGIDA CON ML
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, send_file
 from flask_login import login_required, current_user
-from app.models import Recipe, Ingredient, User, DietaryRestriction, UserPreference, RecipeRating, db
+from app.models import Recipe, Ingredient, User, DietaryRestriction, UserPreference, RecipeRating, UserIngredient, db
 from app.forms import IngredientInputForm, PreferencesForm, RecipeRatingForm, AdvancedSearchForm, PDFGenerationForm
 from app.expert_system import CulinaryExpertSystem
+from app.recipe_catalog import recipe_catalog
+from app.enrichment import RecommendationEnricher
+from app.online_updates import OnlineModelUpdater
+from app.training_jobs import TrainingJobManager
 import json
 from datetime import datetime
 import os
@@ -12,23 +16,62 @@ main = Blueprint('main', __name__)
 
 # Inicializar sistema experto (con ML integrado)
 expert_system = CulinaryExpertSystem()
+enricher = RecommendationEnricher(expert_system)
+training_jobs = TrainingJobManager()
+model_updater = OnlineModelUpdater(expert_system, training_jobs)
 
-# Intentar inicializar modelos ML adicionales
-try:
-    from ml_models.clustering import RecipeClustering
-    clustering_model = RecipeClustering()
-    print("✅ Clustering model inicializado")
-except Exception as e:
-    clustering_model = None
-    print(f"⚠️ Clustering model no disponible: {e}")
+def reload_trained_models(version):
+    """Cambia este worker a una versión publicada del registro de modelos"""
+    if expert_system.reload_models(version):
+        # Las calificaciones posteriores a los datos de la versión se vuelven a aplicar en línea
+        model_updater.reset()
 
-try:
-    from ml_models.recommendation_engine import RecommendationEngine
-    recommendation_engine = RecommendationEngine()
-    print("✅ Recommendation engine inicializado")
-except Exception as e:
-    recommendation_engine = None
-    print(f"⚠️ Recommendation engine no disponible: {e}")
+@main.before_app_request
+def sync_trained_models():
+    """
+    Cambia a la versión actual del registro si es nueva y aplica las calificaciones
+    guardadas por otros workers (cada pocos segundos)
+    """
+    try:
+        model_updater.ensure_started()
+        training_jobs.sync_models(reload_trained_models)
+        model_updater.sync()
+    except Exception as e:
+        print(f"⚠️ Error cargando modelos entrenados: {e}")
+
+def start_training_job():
+    """Lanza el entrenamiento en segundo plano y avisa al usuario"""
+    try:
+        job, started = training_jobs.submit()  # el proceso lee sus datos de la BD
+        if started:
+            flash(f"Entrenamiento iniciado en segundo plano (trabajo {job['job_id']}). "
+                  "Los modelos nuevos se usarán al terminar.", 'info')
+        else:
+            flash(f"Ya hay un entrenamiento en curso (trabajo {job['job_id'] if job else '?'}).", 'warning')
+        return job
+        
+    except Exception as e:
+        print(f"❌ Error iniciando entrenamiento: {e}")
+        import traceback
+        traceback.print_exc()
+        flash(f'Error iniciando entrenamiento: {str(e)}', 'error')
+        return None
+
+@main.route('/training_jobs/active')
+@login_required
+def active_training_job():
+    """Trabajo de entrenamiento en curso (JSON)"""
+    job = training_jobs.active_job()
+    return jsonify({'active': job is not None, 'job': job})
+
+@main.route('/training_jobs/<job_id>')
+@login_required
+def training_job_status(job_id):
+    """Estado, progreso y tiempos de un trabajo de entrenamiento (JSON)"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job)
 
 @main.route('/')
 def index():
@@ -55,6 +98,7 @@ def dashboard():
     # Recomendaciones personalizadas usando ML si está disponible
     cluster_recommendations = []
     try:
+        clustering_model = expert_system.ml_models['clustering']
         if clustering_model and hasattr(clustering_model, 'cluster_labels') and clustering_model.cluster_labels:
             # Usar clustering ML
             cluster_recommendations = get_cluster_recommendations_for_user_ml(current_user.id, 5)
@@ -63,7 +107,7 @@ def dashboard():
             cluster_recommendations = get_recommendations_by_ratings(current_user.id, 5)
     except Exception as e:
         print(f"Error obteniendo recomendaciones: {e}")
-        cluster_recommendations = Recipe.query.filter(Recipe.average_rating >= 4.0).limit(5).all()
+        cluster_recommendations = Recipe.query.filter(Recipe.avg_rating >= 4.0).order_by(Recipe.avg_rating.desc()).limit(5).all()
     
     return render_template('dashboard.html', 
                          form=form, 
@@ -80,16 +124,18 @@ def get_cluster_recommendations_for_user_ml(user_id, limit=5):
         ).all()
         
         if not user_high_ratings:
-            return Recipe.query.filter(Recipe.average_rating >= 4.0).limit(limit).all()
+            return Recipe.query.filter(Recipe.avg_rating >= 4.0).order_by(Recipe.avg_rating.desc()).limit(limit).all()
         
-        # Usar el sistema experto con ML para obtener similares
+        # Usar el sistema experto con ML para obtener similares (top 3 recetas del usuario, en lote)
         similar_recipes = []
-        for rating in user_high_ratings[:3]:  # Usar top 3 recetas del usuario
-            try:
-                similar = expert_system.get_similar_recipes_ml(rating.recipe_id, 2)
+        try:
+            similar_by_recipe = expert_system.get_similar_recipes_batch(
+                [rating.recipe_id for rating in user_high_ratings[:3]], 2
+            )
+            for similar in similar_by_recipe.values():
                 similar_recipes.extend(similar)
-            except:
-                continue
+        except Exception as e:
+            print(f"⚠️ Error obteniendo recetas similares: {e}")
         
         # Remover duplicados y limitar
         seen_ids = set()
@@ -127,12 +173,12 @@ def get_recommendations_by_ratings(user_id, limit=5):
         if preferred_cuisines:
             recommendations = Recipe.query.filter(
                 Recipe.cuisine_type.in_(preferred_cuisines),
-                Recipe.average_rating >= 4.0
-            ).limit(limit).all()
+                Recipe.avg_rating >= 4.0
+            ).order_by(Recipe.avg_rating.desc()).limit(limit).all()
         else:
             recommendations = Recipe.query.filter(
-                Recipe.average_rating >= 4.0
-            ).limit(limit).all()
+                Recipe.avg_rating >= 4.0
+            ).order_by(Recipe.avg_rating.desc()).limit(limit).all()
         
         return recommendations
         
@@ -185,48 +231,8 @@ def get_recommendations():
                 flash('No se encontraron recetas con esos ingredientes. Intenta con otros ingredientes o verifica que estén bien escritos.', 'warning')
                 return redirect(url_for('main.dashboard'))
             
-            # Calcular información adicional para cada receta
-            enhanced_recommendations = []
-            for recipe in recommendations:
-                try:
-                    # Calcular ingredientes faltantes
-                    missing_info = expert_system.calculate_missing_ingredients(
-                        recipe, ingredients_text.split(',')
-                    )
-                    
-                    # Obtener sustituciones
-                    substitutions = expert_system.get_ingredient_substitutions(
-                        recipe, ingredients_text.split(',')
-                    )
-                    
-                    # Análisis nutricional
-                    nutritional_analysis = expert_system.get_nutritional_analysis(recipe)
-                    
-                    # Recetas similares usando ML si está disponible
-                    similar_recipes = []
-                    try:
-                        similar_recipes = expert_system.get_similar_recipes_ml(recipe.id, 3)
-                    except:
-                        similar_recipes = []
-                    
-                    enhanced_recommendations.append({
-                        'recipe': recipe,
-                        'missing_info': missing_info,
-                        'substitutions': substitutions,
-                        'nutritional_analysis': nutritional_analysis,
-                        'similar_recipes': similar_recipes
-                    })
-                    
-                except Exception as e:
-                    print(f"❌ ERROR procesando receta {recipe.name}: {e}")
-                    # Agregar receta básica sin información adicional
-                    enhanced_recommendations.append({
-                        'recipe': recipe,
-                        'missing_info': {'missing': [], 'available': [], 'coverage_percentage': 0},
-                        'substitutions': {},
-                        'nutritional_analysis': None,
-                        'similar_recipes': []
-                    })
+            # Faltantes, sustituciones, nutrición y similares en lote (similares con plazo)
+            enhanced_recommendations = enricher.enrich(recommendations, ingredients_text.split(','))
             
             print(f"🔍 DEBUG: Recomendaciones mejoradas: {len(enhanced_recommendations)}")
             
@@ -379,7 +385,7 @@ def recipe_detail(recipe_id):
 @main.route('/rate_recipe/<int:recipe_id>', methods=['POST'])
 @login_required
 def rate_recipe(recipe_id):
-    """Calificar una receta y reentrenar modelos ML"""
+    """Calificar una receta y actualizar los modelos ML en línea"""
     recipe = Recipe.query.get_or_404(recipe_id)
     form = RecipeRatingForm()
     
@@ -390,6 +396,8 @@ def rate_recipe(recipe_id):
             recipe_id=recipe_id
         ).first()
         
+        previous_rating = existing_rating.rating if existing_rating else None
+        
         if existing_rating:
             # Actualizar calificación existente
             existing_rating.rating = int(form.rating.data)
@@ -405,26 +413,15 @@ def rate_recipe(recipe_id):
             db.session.add(new_rating)
         
         try:
+            # Actualizar agregados de la receta en la misma transacción
+            recipe.apply_rating_change(int(form.rating.data), previous_rating)
             db.session.commit()
+            expert_system.invalidate_user_recommendations(current_user.id)
             flash('¡Calificación guardada exitosamente!', 'success')
             
-            # Reentrenar modelos ML si están disponibles
-            try:
-                if recommendation_engine:
-                    print("🔄 Reentrenando RecommendationEngine...")
-                    recommendation_engine.train_models()
-                    print("✅ RecommendationEngine reentrenado")
-                
-                if clustering_model:
-                    print("🔄 Reentrenando Clustering...")
-                    # Obtener datos actualizados para reentrenamiento
-                    recipes_data = prepare_recipes_data_for_ml()
-                    clustering_model.train_clustering(recipes_data)
-                    print("✅ Clustering reentrenado")
-                    
-            except Exception as e:
-                print(f"⚠️ Error reentrenando modelos ML: {e}")
-                # No afecta la funcionalidad principal
+            # Actualizar vectores del usuario y la receta (los demás workers al sincronizar);
+            # el reentrenamiento completo lo hace la compactación
+            model_updater.record_rating(current_user.id, recipe_id)
             
         except Exception as e:
             db.session.rollback()
@@ -432,42 +429,6 @@ def rate_recipe(recipe_id):
     
     return redirect(url_for('main.recipe_detail', recipe_id=recipe_id))
 
-def prepare_recipes_data_for_ml():
-    """Prepara datos de recetas para ML"""
-    recipes = Recipe.query.all()
-    recipes_data = []
-    
-    for recipe in recipes:
-        recipe_dict = {
-            'id': recipe.id,
-            'name': recipe.name,
-            'description': recipe.description or '',
-            'ingredients': [ing.name for ing in recipe.ingredients],
-            'cuisine_type': recipe.cuisine_type,
-            'difficulty': recipe.difficulty,
-            'prep_time': recipe.prep_time or 30,
-            'cook_time': recipe.cook_time or 30,
-            'servings': recipe.servings or 4,
-            'avg_rating': recipe.average_rating or 3.0,
-            'ratings': [r.rating for r in recipe.ratings]
-        }
-        
-        # Agregar info nutricional si existe
-        if recipe.nutritional_info:
-            recipe_dict['nutritional_info'] = {
-                'calories_per_serving': recipe.nutritional_info.calories_per_serving or 400,
-                'protein': recipe.nutritional_info.protein or 15,
-                'carbs': recipe.nutritional_info.carbs or 50,
-                'fat': recipe.nutritional_info.fat or 12,
-                'fiber': recipe.nutritional_info.fiber or 3,
-                'sugar': recipe.nutritional_info.sugar or 8,
-                'sodium': recipe.nutritional_info.sodium or 800
-            }
-        
-        recipes_data.append(recipe_dict)
-    
-    return recipes_data
-
 @main.route('/preferences', methods=['GET', 'POST'])
 @login_required
 def user_preferences():
@@ -500,15 +461,9 @@ def user_preferences():
         try:
             db.session.add(user_pref)
             db.session.commit()
+            # El perfil se arma en cada petición: basta con descartar sus resultados cacheados
+            expert_system.invalidate_user_recommendations(current_user.id)
             flash('Preferencias actualizadas exitosamente', 'success')
-            
-            # Opcional: Reentrenar modelos con nuevas preferencias
-            try:
-                if recommendation_engine:
-                    print("🔄 Actualizando RecommendationEngine con nuevas preferencias...")
-                    recommendation_engine.train_models()
-            except Exception as e:
-                print(f"⚠️ Error actualizando ML con preferencias: {e}")
                 
         except Exception as e:
             db.session.rollback()
@@ -562,15 +517,7 @@ def advanced_search():
         # Filtrar por calificación mínima
         if form.min_rating.data:
             min_rating = float(form.min_rating.data)
-            # Subquery para calcular rating promedio
-            from sqlalchemy import func
-            rating_subquery = db.session.query(
-                RecipeRating.recipe_id,
-                func.avg(RecipeRating.rating).label('avg_rating')
-            ).group_by(RecipeRating.recipe_id).subquery()
-            
-            query = query.join(rating_subquery, Recipe.id == rating_subquery.c.recipe_id)
-            query = query.filter(rating_subquery.c.avg_rating >= min_rating)
+            query = query.filter(Recipe.rating_count > 0, Recipe.avg_rating >= min_rating)
         
         results = query.distinct().limit(20).all()
         
@@ -784,21 +731,9 @@ def chat_assistant():
     return jsonify(response)
 
 def extract_ingredients_from_message(message):
-    """Extrae ingredientes mencionados en un mensaje"""
-    # Lista básica de ingredientes comunes
-    common_ingredients = [
-        'pollo', 'carne', 'pescado', 'arroz', 'pasta', 'tomate', 'cebolla', 
-        'ajo', 'papa', 'zanahoria', 'pimiento', 'huevo', 'queso', 'leche'
-    ]
-    
-    message_lower = message.lower()
-    found_ingredients = []
-    
-    for ingredient in common_ingredients:
-        if ingredient in message_lower:
-            found_ingredients.append(ingredient)
-    
-    return found_ingredients
+    """Extrae los ingredientes del catálogo mencionados en un mensaje (nombres de la BD)"""
+    resolver = recipe_catalog.get_ingredient_resolver()
+    return [resolver.names[ingredient_id] for ingredient_id in resolver.extract(message)]
 
 @main.route('/generate_pdf', methods=['POST'])
 @login_required
@@ -893,53 +828,10 @@ def train_models():
         flash('No tienes permisos para esta acción', 'error')
         return redirect(url_for('main.dashboard'))
     
-    try:
-        # Entrenar sistema de recomendaciones
-        if recommendation_engine:
-            print("🔄 Entrenando RecommendationEngine...")
-            recipes_data = prepare_recipes_data_for_ml()
-            ratings_data = prepare_ratings_data_for_ml()
-            recommendation_engine.train_models(recipes_data, ratings_data)
-            print("✅ RecommendationEngine entrenado")
-        
-        # Entrenar clustering
-        if clustering_model:
-            print("🔄 Entrenando Clustering...")
-            recipes_data = prepare_recipes_data_for_ml()
-            clustering_model.train_clustering(recipes_data)
-            print("✅ Clustering entrenado")
-        
-        flash('Modelos entrenados exitosamente', 'success')
-        
-    except Exception as e:
-        print(f"❌ Error entrenando modelos: {e}")
-        import traceback
-        traceback.print_exc()
-        flash(f'Error entrenando modelos: {str(e)}', 'error')
+    start_training_job()
     
     return redirect(url_for('main.dashboard'))
 
-def prepare_ratings_data_for_ml():
-    """Prepara datos de ratings para ML"""
-    ratings = RecipeRating.query.all()
-    ratings_data = []
-    
-    for rating in ratings:
-        if rating.rated_recipe:
-            user_profile = {
-                'dietary_restrictions': [dr.name for dr in rating.rating_user.dietary_restrictions],
-                'avg_rating_given': sum(r.rating for r in rating.rating_user.recipe_ratings) / len(rating.rating_user.recipe_ratings) if rating.rating_user.recipe_ratings else 4.0
-            }
-            
-            ratings_data.append({
-                'user_id': rating.user_id,
-                'recipe_id': rating.recipe_id,
-                'rating': rating.rating,
-                'user_profile': user_profile
-            })
-    
-    return ratings_data
-
 @main.route('/my_recipes')
 @login_required
 def my_recipes():
@@ -1095,6 +987,48 @@ def ingredient_suggestions():
     
     return jsonify(suggestions)
 
+@main.route('/what_can_i_cook')
+@login_required
+def what_can_i_cook():
+    """API: recetas cocinables ahora con la despensa, tolerando hasta k ingredientes faltantes"""
+    max_missing = min(max(request.args.get('max_missing', 2, type=int), 0), 5)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    ingredients_text = request.args.get('ingredients', '').strip()
+    
+    if ingredients_text:
+        # Texto libre: coincidencia parcial de nombres como en las recomendaciones
+        pantry = expert_system._process_ingredients_simple(ingredients_text)
+        partial = True
+    else:
+        # Despensa guardada del usuario: nombres exactos de la BD
+        user_ingredients = UserIngredient.query.filter_by(user_id=current_user.id).join(
+            UserIngredient.ingredient
+        ).with_entities(Ingredient.name).all()
+        pantry = [name for (name,) in user_ingredients]
+        partial = False
+    
+    if not pantry:
+        return jsonify({'pantry': [], 'max_missing': max_missing, 'results': []})
+    
+    results = expert_system.what_can_i_cook(pantry, max_missing=max_missing, limit=limit, partial=partial)
+    
+    return jsonify({
+        'pantry': pantry,
+        'max_missing': max_missing,
+        'results': [
+            {
+                'id': result['recipe']['id'],
+                'name': result['recipe']['name'],
+                'avg_rating': result['recipe']['avg_rating'],
+                'total_time': result['recipe'].get('total_time'),
+                'missing_count': result['missing_count'],
+                'missing_ingredients': result['missing_ingredients'],
+                'url': url_for('main.recipe_detail', recipe_id=result['recipe']['id'])
+            }
+            for result in results
+        ]
+    })
+
 @main.route('/recipe_of_the_day')
 def recipe_of_the_day():
     """Receta del día con ML insights"""
@@ -1113,10 +1047,11 @@ def recipe_of_the_day():
     try:
         if expert_system.ml_models['recommendation_engine']:
             # Usar ML para seleccionar receta más popular/recomendada
-            high_rated_recipes = Recipe.query.filter(Recipe.average_rating >= 4.0).all()
-            if high_rated_recipes:
-                recipe_index = seed % len(high_rated_recipes)
-                recipe = high_rated_recipes[recipe_index]
+            high_rated_query = Recipe.query.filter(Recipe.avg_rating >= 4.0)
+            high_rated_count = high_rated_query.count()
+            if high_rated_count:
+                recipe_index = seed % high_rated_count
+                recipe = high_rated_query.order_by(Recipe.id).offset(recipe_index).first()
             else:
                 recipe_index = seed % total_recipes
                 recipe = Recipe.query.offset(recipe_index).first()
@@ -1204,7 +1139,8 @@ def ml_metrics():
                              metrics=metrics,
                              clustering_metrics=clustering_metrics,
                              content_filter_metrics=content_filter_metrics,
-                             confusion_matrix=confusion_matrix_data)
+                             confusion_matrix=confusion_matrix_data,
+                             cache_stats=expert_system.recommendation_cache.stats())
                              
     except Exception as e:
         print(f"❌ Error obteniendo métricas ML: {e}")
@@ -1478,37 +1414,7 @@ def generate_confusion_matrix():
 @login_required
 def retrain_models():
     """Reentrenar modelos ML (accesible para usuarios logueados)"""
-    try:
-        print("🔄 Iniciando reentrenamiento de modelos ML...")
-        
-        # Reentrenar sistema de recomendaciones
-        if recommendation_engine:
-            print("🔄 Reentrenando RecommendationEngine...")
-            recipes_data = prepare_recipes_data_for_ml()
-            ratings_data = prepare_ratings_data_for_ml()
-            recommendation_engine.train_models(recipes_data, ratings_data)
-            print("✅ RecommendationEngine reentrenado")
-        
-        # Reentrenar clustering
-        if clustering_model:
-            print("🔄 Reentrenando Clustering...")
-            recipes_data = prepare_recipes_data_for_ml()
-            clustering_model.train_clustering(recipes_data)
-            print("✅ Clustering reentrenado")
-        
-        # Reentrenar expert system
-        if expert_system:
-            print("🔄 Recargando Expert System...")
-            # El expert system se reinicia automáticamente
-            print("✅ Expert System actualizado")
-        
-        flash('Modelos reentrenados exitosamente. Los cambios se aplicarán en las próximas recomendaciones.', 'success')
-        
-    except Exception as e:
-        print(f"❌ Error reentrenando modelos: {e}")
-        import traceback
-        traceback.print_exc()
-        flash(f'Error durante el reentrenamiento: {str(e)}', 'error')
+    start_training_job()
     
     return redirect(url_for('main.ml_metrics'))
 
@@ -1529,11 +1435,11 @@ def optimize_models():
 @main.route('/clear_cache')
 @login_required
 def clear_cache():
-    """Limpiar cache de modelos ML"""
+    """Limpiar cache de recomendaciones"""
     try:
-        # Simular limpieza de cache
-        flash('Cache de modelos limpiado exitosamente.', 'success')
-        print("🧹 Cache limpiado")
+        removed = expert_system.clear_recommendation_cache()
+        flash(f'Cache de recomendaciones limpiado exitosamente ({removed} entradas).', 'success')
+        print(f"🧹 Cache limpiado: {removed} entradas")
         
     except Exception as e:
         print(f"❌ Error limpiando cache: {e}")
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Pruebas de la capa de la app del Sistema Experto Culinario: catálogo de recetas en
+memoria, enriquecimiento de recomendaciones, agregados de calificaciones,
+actualización en línea de los modelos y trabajos de entrenamiento, contra
+una base de datos SQLite en memoria (sin blueprints ni modelos de ML).
+Ejecutar desde la raíz del proyecto: python -m app.test_app
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from app.models import db, Recipe, RecipeRating, Ingredient, User
+from app.recipe_catalog import CatalogChangeLog, RecipeCatalog, recipe_catalog
+from app.enrichment import RecommendationEnricher
+from app.online_updates import OnlineModelUpdater
+from app.training_jobs import TrainingJobManager
+from ml_models.model_registry import ModelRegistry, write_json
+from ml_models.training_job import STATE_FILE
+
+
+def create_test_app():
+    """App Flask mínima con SQLite en memoria"""
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    return app
+
+
+@contextmanager
+def temporary_catalog_changes():
+    """Los commits de la prueba se registran en un directorio temporal; devuelve la ruta del registro"""
+    original_changes = recipe_catalog.changes
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        changes_path = os.path.join(tmp_dir, 'catalog_changes.log')
+        recipe_catalog.changes = CatalogChangeLog(changes_path)
+        try:
+            yield changes_path
+        finally:
+            recipe_catalog.changes = original_changes
+
+
+def create_test_recipes():
+    """Dos recetas con ingredientes y un usuario (dentro de un contexto de app)"""
+    db.create_all()
+    arroz, leche, pollo = Ingredient(name='arroz'), Ingredient(name='leche'), Ingredient(name='pollo')
+    recipes = [
+        Recipe(name='Arroz con leche', instructions='Cocinar el arroz en la leche.', ingredients=[arroz, leche]),
+        Recipe(name='Arroz con pollo', instructions='Cocinar el arroz con el pollo.', ingredients=[arroz, pollo]),
+    ]
+    user = User(username='tester', email='tester@example.com')
+    db.session.add_all(recipes + [user])
+    db.session.commit()
+    return [recipe.id for recipe in recipes], user.id
+
+
+def test_recipe_catalog_changes():
+    """Verifica la recarga incremental y la invalidación entre procesos vía el registro de cambios"""
+    print("\n📚 PROBANDO CATÁLOGO DE RECETAS COMPARTIDO")
+    print("=" * 50)
+
+    app = create_test_app()
+    with temporary_catalog_changes() as changes_path, app.app_context():
+        try:
+            first_id, second_id = create_test_recipes()[0]
+
+            # Dos "procesos": cada uno con su snapshot y el mismo registro de cambios
+            worker_a, worker_b = RecipeCatalog(changes_path), RecipeCatalog(changes_path)
+            snapshot = worker_b.get_recipes_data()
+            assert [recipe['id'] for recipe in worker_a.get_recipes_data()] == [first_id, second_id]
+            version = worker_b.version
+
+            # Un rating confirmado en "A" recarga en "B" solo la receta afectada
+            db.session.add(RecipeRating(user_id=User.query.first().id, recipe_id=first_id, rating=5))
+            db.session.commit()
+            refreshed = worker_b.get_recipes_data()
+            assert refreshed is not snapshot and snapshot[0]['ratings'] == []  # el snapshot anterior no muta
+            assert refreshed[0]['ratings'] == [5]
+            assert refreshed[1] is snapshot[1]
+            assert worker_b.version == version + 1
+            assert worker_b.get_recipe_data(first_id) is refreshed[0]
+            assert worker_b.get_recipes_data() is refreshed  # sin cambios nuevos no se recarga
+
+            # Un ingrediente nuevo invalida la resolución de nombres y el índice de coincidencias
+            resolver, match_index = worker_b.get_ingredient_resolver(), worker_b.get_ingredient_match_index()
+            db.session.add(Ingredient(name='canela'))
+            db.session.commit()
+            assert worker_b.get_ingredient_resolver() is not resolver
+            assert worker_b.get_ingredient_resolver().resolve('canela')
+            assert worker_b.get_ingredient_match_index() is not match_index
+            assert worker_b.get_ingredient_match_index().match('canella')[0][0].name == 'canela'
+            assert worker_b.get_ingredient_match_index() is worker_b.get_ingredient_match_index()
+
+            # invalidate (comandos de mantenimiento) recarga todo en todos los procesos
+            worker_a.invalidate()
+            reloaded = worker_b.get_recipes_data()
+            assert reloaded[1] is not refreshed[1] and reloaded[1] == refreshed[1]
+
+            # Si el registro se reemplaza (rotación), quien lo nota recarga todo
+            before = worker_b.get_recipes_data()
+            worker_a.changes.max_bytes = 1
+            worker_a.mark_changed([first_id])
+            after = worker_b.get_recipes_data()
+            assert after[1] is not before[1]
+            print(f"✅ Catálogo compartido correcto (versión {worker_b.version})")
+        finally:
+            db.drop_all()
+
+
+def test_recommendation_cache_invalidation():
+    """Verifica que las invalidaciones del cache de recomendaciones llegan a todos los procesos por el registro de cambios"""
+    print("\n🧹 PROBANDO INVALIDACIÓN DEL CACHE ENTRE PROCESOS")
+    print("=" * 50)
+
+    from app.expert_system import CulinaryExpertSystem
+
+    app = create_test_app()
+    with temporary_catalog_changes() as changes_path, app.app_context():
+        try:
+            recipe_ids = create_test_recipes()[0]
+
+            # Una invalidación no cambia la versión del catálogo; un cambio de recetas sí, sin recargarlas
+            worker_a, worker_b = RecipeCatalog(changes_path), RecipeCatalog(changes_path)
+            received = []
+            worker_b.subscribe(received.append)
+            worker_b.get_recipes_data()
+            version, snapshot_version = worker_b.current_version(), worker_b.version
+            worker_a.broadcast({'recommendation_users': [7]})
+            assert worker_b.current_version() == version and received == [{'recommendation_users': [7]}]
+            worker_a.mark_changed([recipe_ids[0]])
+            assert worker_b.current_version() == version + 1 and worker_b.version == snapshot_version
+            worker_b.get_recipes_data()
+            assert worker_b.version == snapshot_version + 1
+
+            # Dos "workers" con su propio cache: lo que invalida uno lo descarta el otro
+            worker_1, worker_2 = CulinaryExpertSystem(), CulinaryExpertSystem()
+            recipe_catalog.current_version()
+            for expert in (worker_1, worker_2):
+                expert.recommendation_cache.put(('usuario 1',), [recipe_ids[0]], 1)
+                expert.recommendation_cache.put(('usuario 2',), [recipe_ids[1]], 2)
+            worker_1.invalidate_user_recommendations(1)
+            assert worker_2.recommendation_cache.get(('usuario 1',)) == [recipe_ids[0]]
+            recipe_catalog.current_version()  # lo que hace cada búsqueda en el cache
+            assert worker_2.recommendation_cache.get(('usuario 1',)) is None
+            assert worker_2.recommendation_cache.get(('usuario 2',)) == [recipe_ids[1]]
+            assert worker_1.clear_recommendation_cache() == 1
+            recipe_catalog.current_version()
+            assert len(worker_2.recommendation_cache) == 0
+            print("✅ Invalidaciones del cache compartidas")
+        finally:
+            db.drop_all()
+
+
+def test_expert_rules_keep_recipes_missing_from_snapshot():
+    """Verifica que una receta que aún no está en el snapshot se recarga en lugar de descartarse"""
+    print("\n🧩 PROBANDO REGLAS CON RECETAS FUERA DEL SNAPSHOT")
+    print("=" * 50)
+
+    from app.expert_system import CulinaryExpertSystem
+
+    app = create_test_app()
+    with temporary_catalog_changes(), app.app_context():
+        try:
+            recipe_ids, user_id = create_test_recipes()
+            recipe_catalog.invalidate()
+            recipe_catalog.get_recipes_data()
+
+            # Insertada por SQL: no pasa por el registro de cambios
+            db.session.execute(text("INSERT INTO recipe (id, name, instructions) VALUES (60, 'Pan', 'Hornear.')"))
+            db.session.commit()
+            assert recipe_catalog.get_recipe_data(60) is None
+
+            recipes = Recipe.query.filter(Recipe.id.in_(recipe_ids + [60])).order_by(Recipe.id).all()
+            kept = CulinaryExpertSystem()._apply_expert_rules(recipes, db.session.get(User, user_id), [], {})
+            assert [recipe.id for recipe in kept] == recipe_ids + [60]
+            assert recipe_catalog.get_recipe_data(60)['name'] == 'Pan'
+            print(f"✅ {len(kept)} recetas evaluadas por las reglas")
+        finally:
+            db.drop_all()
+
+
+def test_substitutions_single_matches_batch():
+    """Verifica que las sustituciones de una receta y las del lote deciden los faltantes igual"""
+    print("\n🔁 PROBANDO SUSTITUCIONES POR RECETA Y EN LOTE")
+    print("=" * 50)
+
+    from app.expert_system import CulinaryExpertSystem
+
+    app = create_test_app()
+    with temporary_catalog_changes(), app.app_context():
+        try:
+            recipe_ids = create_test_recipes()[0]
+            recipe_catalog.invalidate()
+            recipes = Recipe.query.order_by(Recipe.id).all()
+
+            # 'Arroz integral' cubre 'arroz' (coincidencia parcial del índice de ingredientes)
+            expert = CulinaryExpertSystem()
+            pantry = ['Arroz integral', 'pollo']
+            batch = expert.get_ingredient_substitutions_batch(recipes, pantry)
+            assert batch == {recipe.id: expert.get_ingredient_substitutions(recipe, pantry) for recipe in recipes}
+            assert list(batch[recipe_ids[0]]) == ['leche'] and batch[recipe_ids[1]] == {}
+            print(f"✅ Sustituciones iguales para {len(recipes)} recetas")
+        finally:
+            db.drop_all()
+
+
+def test_rating_aggregates():
+    """Verifica apply_rating_change, el orden por avg_rating en SQL y el recálculo de filas cargadas por SQL"""
+    print("\n⭐ PROBANDO AGREGADOS DE CALIFICACIONES")
+    print("=" * 50)
+
+    app = create_test_app()
+    with temporary_catalog_changes(), app.app_context():
+        try:
+            (first_id, second_id), user_id = create_test_recipes()
+            other = User(username='otro', email='otro@example.com')
+            db.session.add(other)
+            db.session.commit()
+            recipe = db.session.get(Recipe, first_id)
+            assert (recipe.rating_count, recipe.rating_sum, recipe.avg_rating) == (0, 0, 0.0)
+
+            # Calificación nueva: suma uno al conteo
+            rating = RecipeRating(user_id=user_id, recipe_id=first_id, rating=5)
+            db.session.add(rating)
+            recipe.apply_rating_change(5)
+            db.session.add(RecipeRating(user_id=other.id, recipe_id=first_id, rating=2))
+            recipe.apply_rating_change(2)
+            db.session.commit()
+            assert (recipe.rating_count, recipe.rating_sum, recipe.avg_rating) == (2, 7, 3.5)
+
+            # Edición: solo cambia la suma, por la diferencia con la calificación anterior
+            rating.rating = 3
+            recipe.apply_rating_change(3, previous_rating=5)
+            db.session.commit()
+            assert (recipe.rating_count, recipe.rating_sum, recipe.avg_rating) == (2, 5, 2.5)
+
+            # El orden y los filtros por promedio se resuelven en SQL
+            db.session.add(RecipeRating(user_id=user_id, recipe_id=second_id, rating=4))
+            db.session.get(Recipe, second_id).apply_rating_change(4)
+            db.session.commit()
+            ordered = Recipe.query.order_by(Recipe.average_rating.desc()).all()
+            assert [r.id for r in ordered] == [second_id, first_id]
+            assert [r.id for r in Recipe.query.filter(Recipe.average_rating >= 3).all()] == [second_id]
+
+            # Filas insertadas por SQL (scripts de data/): agregados en 0 hasta el recálculo
+            db.session.execute(text("INSERT INTO recipe (id, name, instructions) VALUES (50, 'Sopa', 'Hervir.')"))
+            db.session.execute(text("INSERT INTO recipe_rating (user_id, recipe_id, rating) VALUES (:u, 50, 4), (:o, 50, 5)"),
+                               {'u': user_id, 'o': other.id})
+            db.session.commit()
+            seeded = db.session.get(Recipe, 50)
+            assert (seeded.rating_count, seeded.avg_rating) == (0, 0.0)
+            assert Recipe.recompute_rating_stats() == 3
+            db.session.commit()
+            assert (seeded.rating_count, seeded.rating_sum, seeded.avg_rating) == (2, 9, 4.5)
+            assert (recipe.rating_count, recipe.rating_sum, recipe.avg_rating) == (2, 5, 2.5)  # sin cambios
+            assert Recipe.query.order_by(Recipe.average_rating.desc()).first().id == 50
+            print("✅ Agregados de calificaciones correctos")
+        finally:
+            db.session.rollback()
+            db.drop_all()
+
+
+class FakeExpertSystem:
+    """Etapas del sistema experto que usa RecommendationEnricher, con similares configurables"""
+
+    def __init__(self, similar=None, fail_stage=None):
+        self.similar = similar or (lambda recipe_id, n: [recipe_id + 100])
+        self.fail_stage = fail_stage
+        self.ml_models = {'version': 'v-test'}
+        self.similar_calls = []
+
+    def pin_models(self, models):
+        self.pinned = models
+
+    def similar_recipe_ids(self, recipe_id, n_similar):
+        self.similar_calls.append(recipe_id)
+        return self.similar(recipe_id, n_similar)
+
+    def _stage(self, name, recipes, value):
+        if self.fail_stage == name:
+            raise RuntimeError(f"fallo en {name}")
+        return {recipe.id: value(recipe) for recipe in recipes}
+
+    def calculate_missing_ingredients_batch(self, recipes, available_ingredients):
+        return self._stage('missing', recipes, lambda recipe: {'missing': [], 'available': available_ingredients,
+                                                               'coverage_percentage': 100})
+
+    def get_ingredient_substitutions_batch(self, recipes, available_ingredients):
+        return self._stage('substitutions', recipes, lambda recipe: {'leche': ['bebida de avena']})
+
+    def get_nutritional_analysis(self, recipe):
+        return {'calories': recipe.id * 10}
+
+    def hydrate_similar(self, similar_ids):
+        return {recipe_id: [SimpleNamespace(id=similar_id) for similar_id in ids] for recipe_id, ids in similar_ids.items()}
+
+
+def test_enrichment_deadline_and_stage_errors():
+    """Verifica que el enriquecimiento respeta el plazo, aísla las etapas que fallan y conserva el orden"""
+    print("\n⏱️ PROBANDO ENRIQUECIMIENTO DE RECOMENDACIONES")
+    print("=" * 50)
+
+    app = create_test_app()
+    recipes = [SimpleNamespace(id=recipe_id) for recipe_id in (3, 1, 2)]
+    with app.app_context():
+        # Todo a tiempo: el orden de las recetas se conserva y nada se omite
+        enricher = RecommendationEnricher(FakeExpertSystem(), max_workers=2)
+        enhanced = enricher.enrich(recipes, ['arroz'], deadline_seconds=5)
+        assert [entry['recipe'].id for entry in enhanced] == [3, 1, 2]
+        assert [[similar.id for similar in entry['similar_recipes']] for entry in enhanced] == [[103], [101], [102]]
+        assert all(entry['omitted'] == [] for entry in enhanced)
+        assert enricher.expert_system.pinned == {'version': 'v-test'}  # las tareas usan los modelos de la petición
+        enricher.shutdown()
+
+        # Similares lentos: se omiten al vencer el plazo y las tareas en cola se cancelan
+        release = threading.Event()
+        slow = FakeExpertSystem(similar=lambda recipe_id, n: release.wait(5) and [])
+        enricher = RecommendationEnricher(slow, max_workers=1)
+        start = time.monotonic()
+        enhanced = enricher.enrich(recipes, ['arroz'], deadline_seconds=0.2)
+        elapsed = time.monotonic() - start
+        release.set()
+        assert elapsed < 2, elapsed
+        assert [entry['recipe'].id for entry in enhanced] == [3, 1, 2]
+        assert all(entry['omitted'] == ['similar_recipes'] and entry['similar_recipes'] == [] for entry in enhanced)
+        assert all(entry['missing_info']['coverage_percentage'] == 100 for entry in enhanced)
+        enricher.shutdown()
+        assert slow.similar_calls == [3]  # las otras dos no llegaron a ocupar el pool
+
+        # Una etapa en lote que falla se omite solo a ella
+        enricher = RecommendationEnricher(FakeExpertSystem(fail_stage='substitutions'), max_workers=2)
+        enhanced = enricher.enrich(recipes, ['arroz'], deadline_seconds=5)
+        assert all(entry['omitted'] == ['substitutions'] and entry['substitutions'] == {} for entry in enhanced)
+        assert [entry['nutritional_analysis']['calories'] for entry in enhanced] == [30, 10, 20]
+        assert all(entry['missing_info']['coverage_percentage'] == 100 for entry in enhanced)
+        enricher.shutdown()
+    print(f"✅ Enriquecimiento correcto (plazo respetado en {elapsed:.2f}s)")
+
+
+class FakeEngine:
+    """Motor que registra las actualizaciones en línea que recibe"""
+
+    def __init__(self):
+        self.updates = []
+
+    def update_rating(self, user_id, recipe_id, user_ratings, recipe_ratings):
+        self.updates.append((user_id, recipe_id, user_ratings[recipe_id]))
+        return True
+
+
+class FakeBundle(dict):
+    manifest = None
+
+
+def test_online_rating_sync():
+    """Verifica el cursor (updated_at, id) de la actualización en línea y que editar no cambia created_at"""
+    print("\n⚡ PROBANDO ACTUALIZACIÓN EN LÍNEA")
+    print("=" * 50)
+
+    app = create_test_app()
+    with temporary_catalog_changes(), app.app_context():
+        try:
+            recipe_ids, user_id = create_test_recipes()
+            users = [User(username=f'tester{i}', email=f'tester{i}@example.com') for i in range(2)]
+            db.session.add_all(users)
+            db.session.commit()
+
+            engine = FakeEngine()
+            expert_system = SimpleNamespace(loaded_models=FakeBundle(recommendation_engine=engine),
+                                            invalidate_user_recommendations=lambda user_id, all_workers=True: None)
+            registry = SimpleNamespace(current_version=lambda: 'v1',
+                                       manifest=lambda version: {'metadata': {'data_as_of': 1.0}})
+            updater = OnlineModelUpdater(expert_system, SimpleNamespace(registry=registry), max_batch=2)
+
+            # Tres calificaciones con la misma fecha y lotes de dos: la tercera llega en el siguiente lote
+            tied = datetime(2026, 1, 1)
+            ratings = [RecipeRating(user_id=rater, recipe_id=recipe_ids[0], rating=4, created_at=tied, updated_at=tied)
+                       for rater in (user_id, users[0].id, users[1].id)]
+            db.session.add_all(ratings)
+            db.session.commit()
+            assert updater.pending_count() == 3
+            assert updater.sync(force=True) == 2
+            assert updater.sync(force=True) == 1
+            assert updater.sync(force=True) == 0
+            assert {update[0] for update in engine.updates} == {user_id, users[0].id, users[1].id}
+
+            # Editar actualiza updated_at (y se vuelve a aplicar) sin tocar created_at
+            ratings[0].rating = 2
+            db.session.commit()
+            assert ratings[0].created_at == tied and ratings[0].updated_at > tied
+            assert updater.sync(force=True) == 1
+            assert engine.updates[-1] == (user_id, recipe_ids[0], 2)
+
+            # record_rating aplica en el momento la calificación indicada
+            db.session.add(RecipeRating(user_id=user_id, recipe_id=recipe_ids[1], rating=5))
+            db.session.commit()
+            assert updater.record_rating(user_id, recipe_ids[1])
+            assert (user_id, recipe_ids[1], 5) in engine.updates
+            print(f"✅ Cursor de calificaciones correcto ({len(engine.updates)} actualizaciones)")
+        finally:
+            db.drop_all()
+
+
+def failing_training_data():
+    """Cargador de datos del trabajo de prueba: falla sin tocar la BD ni entrenar"""
+    raise RuntimeError('sin datos de entrenamiento')
+
+
+def test_training_job_manager():
+    """Verifica el bloqueo de trabajos entre workers, el estado de un trabajo muerto y que el proceso se recoge"""
+    print("\n🏭 PROBANDO GESTOR DE TRABAJOS DE ENTRENAMIENTO")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as root:
+        registry = ModelRegistry(os.path.join(root, 'registry'))
+        jobs_dir = os.path.join(root, 'jobs')
+        manager = TrainingJobManager(jobs_dir, registry, data_loader='app.test_app:failing_training_data')
+        other_worker = TrainingJobManager(jobs_dir, registry)
+        os.makedirs(os.path.join(jobs_dir, 'job-vivo'))
+
+        # Un trabajo vivo de otro worker bloquea los demás
+        write_json(os.path.join(jobs_dir, 'job-vivo', STATE_FILE),
+                   {'job_id': 'job-vivo', 'status': 'running', 'pid': os.getpid(), 'started_at': time.time()})
+        assert other_worker._acquire_lock('job-vivo')
+        assert not manager._acquire_lock('job-nuevo')
+        assert manager.active_job()['job_id'] == 'job-vivo'
+        job, started = manager.submit()
+        assert not started and job['job_id'] == 'job-vivo'
+
+        # Si su proceso murió sin actualizar el estado, queda en failed y libera el bloqueo
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        write_json(os.path.join(jobs_dir, 'job-vivo', STATE_FILE),
+                   {'job_id': 'job-vivo', 'status': 'running', 'pid': dead.pid, 'started_at': time.time()})
+        assert manager.active_job() is None
+        assert manager.get('job-vivo')['status'] == 'failed'
+        assert not os.path.exists(manager.lock_path)
+
+        # Un trabajo real: queued -> failed (su cargador falla), sin bloqueo y con el proceso recogido
+        job, started = manager.submit()
+        assert started and job['status'] in ('queued', 'running')
+        job_id = job['job_id']
+        deadline = time.monotonic() + 30
+        while manager.get(job_id)['status'] in ('queued', 'running') or job_id in manager._processes:
+            assert time.monotonic() < deadline, manager.get(job_id)
+            time.sleep(0.05)
+        state = manager.get(job_id)
+        assert state['status'] == 'failed' and 'sin datos' in state['errors']['job']
+        assert state['elapsed_seconds'] >= 0
+        assert not os.path.exists(manager.lock_path) and manager.active_job() is None
+        assert registry.current_version() is None
+        print(f"✅ Trabajos de entrenamiento correctos ({job_id}: {state['status']})")
+
+
+def main():
+    """Función principal que ejecuta todas las pruebas"""
+    print("🍳 SISTEMA EXPERTO CULINARIO - PRUEBAS DE LA APP")
+    print("=" * 60)
+    test_recipe_catalog_changes()
+    test_recommendation_cache_invalidation()
+    test_expert_rules_keep_recipes_missing_from_snapshot()
+    test_substitutions_single_matches_batch()
+    test_rating_aggregates()
+    test_enrichment_deadline_and_stage_errors()
+    test_online_rating_sync()
+    test_training_job_manager()
+    print("\n🎉 TODAS LAS PRUEBAS DE LA APP COMPLETADAS")
+
+
+if __name__ == "__main__":
+    main()
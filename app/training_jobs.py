@@ -0,0 +1,198 @@
+# app/training_jobs.py - Entrenamiento de modelos en un proceso separado
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from ml_models.model_registry import ModelRegistry, read_json, write_json
+from ml_models.training_job import INPUT_FILE, STATE_FILE
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Función que el proceso de entrenamiento llama para leer sus datos
+DATA_LOADER = 'app.training_jobs:load_training_data'
+
+
+def load_training_data():
+    """
+    Recetas y ratings para entrenar, leídos en el proceso de entrenamiento con su
+    propia app y sesión de BD (sin blueprints, warmup ni hilos de la app web)
+    """
+    from flask import Flask
+    from app.models import db
+    from app.recipe_catalog import prepare_recipes_data_for_ml, prepare_ratings_data_for_ml
+
+    app = Flask(__name__)
+    app.config.from_object('config.Config')
+    db.init_app(app)
+    with app.app_context():
+        return prepare_recipes_data_for_ml(), prepare_ratings_data_for_ml()
+
+
+class TrainingJobManager:
+    """
+    Lanza el entrenamiento (ml_models.training_job) en otro proceso para no bloquear
+    un worker web. El estado de cada trabajo vive en archivos bajo jobs_dir, así que
+    cualquier worker puede consultarlo; un archivo de bloqueo impide dos trabajos a la
+    vez. Un trabajo exitoso publica una versión en el registro de modelos y cada
+    worker la carga en la siguiente petición (sync_models).
+    """
+
+    def __init__(self, jobs_dir='ml_models/trained_models/jobs', registry=None, check_interval_seconds=5,
+                 data_loader=DATA_LOADER):
+        self.jobs_dir = jobs_dir
+        self.registry = registry or ModelRegistry()
+        self.data_loader = data_loader  # 'modulo:funcion' que devuelve (recetas, ratings)
+        self.lock_path = os.path.join(jobs_dir, 'active.lock')
+        self.check_interval_seconds = check_interval_seconds
+        self._processes = {}  # trabajos en curso lanzados por este worker
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self.loaded_version = self.registry.current_version()  # la versión actual ya se cargó al iniciar
+
+    def submit(self):
+        """
+        Inicia un trabajo; devuelve (estado, True) o (trabajo activo, False) si ya hay uno.
+        Solo crea el directorio, toma el bloqueo y lanza el proceso: recetas y ratings los
+        lee el propio proceso de la BD (load_training_data), no la petición web.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self._lock:
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            if not self._acquire_lock(job_id):
+                return self.active_job(), False
+
+            try:
+                job_dir = os.path.join(self.jobs_dir, job_id)
+                os.makedirs(job_dir)
+                with open(os.path.join(job_dir, INPUT_FILE), 'wb') as f:
+                    pickle.dump({'data_loader': self.data_loader, 'registry_root': self.registry.root}, f)
+                write_json(os.path.join(job_dir, STATE_FILE), {
+                    'job_id': job_id,
+                    'status': 'queued',
+                    'created_at': time.time()
+                })
+
+                process = subprocess.Popen([sys.executable, '-m', 'ml_models.training_job', job_dir],
+                                           cwd=os.getcwd())
+                self._processes[job_id] = process  # el pid lo escribe el propio proceso en su estado
+                threading.Thread(target=self._wait, args=(job_id, process),
+                                 name=f'training-job-{job_id}', daemon=True).start()
+                print(f"🚀 Trabajo de entrenamiento {job_id} iniciado (pid {process.pid})")
+                return self.get(job_id), True
+
+            except Exception:
+                self._release_lock(job_id)
+                raise
+
+    def _wait(self, job_id, process):
+        """Espera el proceso de entrenamiento para recogerlo en cuanto termina (sin procesos zombie)"""
+        process.wait()
+        with self._lock:
+            self._processes.pop(job_id, None)
+
+    def get(self, job_id):
+        """Estado del trabajo (con la duración calculada); None si no existe"""
+        state = read_json(os.path.join(self.jobs_dir, os.path.basename(job_id), STATE_FILE))
+        if state is None:
+            return None
+
+        if state.get('status') in ACTIVE_STATUSES and not self._is_alive(state):
+            # El proceso murió sin actualizar su estado
+            state = self._update(job_id, status='failed', finished_at=time.time(),
+                                 errors={'job': 'El proceso de entrenamiento terminó inesperadamente'})
+            self._release_lock(job_id)
+
+        start, end = state.get('started_at'), state.get('finished_at') or time.time()
+        state['elapsed_seconds'] = round(end - start, 3) if start else 0.0
+        return state
+
+    def active_job(self):
+        """Trabajo en curso o None (limpia bloqueos de trabajos muertos)"""
+        try:
+            with open(self.lock_path, encoding='utf-8') as f:
+                job_id = f.read().strip()
+        except OSError:
+            return None
+
+        if not job_id:
+            # Otro worker acaba de crear el bloqueo y aún no escribe el id
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) < 10:
+                    return {'job_id': None, 'status': 'queued'}
+            except OSError:
+                return None
+
+        state = self.get(job_id) if job_id else None
+        if state is None or state.get('status') not in ACTIVE_STATUSES:
+            self._release_lock(job_id)
+            return None
+        return state
+
+    def sync_models(self, reload_models):
+        """Llama a reload_models(versión) si el registro apunta a una versión distinta de la cargada"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval_seconds:
+            return False
+        self._last_check = now
+
+        current = self.registry.current_version()
+        if current is None or current == self.loaded_version:
+            return False
+
+        with self._lock:
+            if current == self.loaded_version:
+                return False
+            print(f"🔄 Cargando versión de modelos {current}...")
+            reload_models(current)
+            self.loaded_version = current
+            return True
+
+    def _acquire_lock(self, job_id):
+        """Crea el bloqueo de forma exclusiva; reintenta una vez si el anterior estaba muerto"""
+        for _ in range(2):
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.active_job() is not None:
+                    return False
+                continue
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(job_id)
+            return True
+        return False
+
+    def _release_lock(self, job_id):
+        try:
+            with open(self.lock_path, encoding='utf-8') as f:
+                owner = f.read().strip()
+            if owner == job_id or not owner:
+                os.remove(self.lock_path)
+        except OSError:
+            pass
+
+    def _update(self, job_id, **changes):
+        path = os.path.join(self.jobs_dir, job_id, STATE_FILE)
+        state = read_json(path) or {'job_id': job_id}
+        state.update(changes)
+        write_json(path, state)
+        return state
+
+    def _is_alive(self, state):
+        process = self._processes.get(state.get('job_id'))
+        if process is not None:
+            return process.poll() is None
+        pid = state.get('pid')
+        if pid is None:
+            # Recién creado por otro worker, todavía sin pid
+            return time.time() - state.get('created_at', 0) < 60
+        if os.name == 'nt':
+            return True  # en Windows os.kill(pid, 0) terminaría el proceso
+        try:
+            os.kill(pid, 0)
+            return True
+        except OSError:
+            return False
@@ -13,9 +13,23 @@ class Config:
     ML_MODEL_PATH = 'ml_models/trained_models/'
     MAX_RECOMMENDATIONS = 10
     
+    # Cargar modelos y datos NLTK al crear la app en vez de en el primer uso
+    # (útil con gunicorn --preload; los comandos CLI arrancan más rápido sin esto)
+    WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '').lower() in ('1', 'true', 'yes')
+    
+    # Presupuesto de tiempo de importación al iniciar (flask check-startup)
+    STARTUP_IMPORT_BUDGET_MS = 1500
+    
+    # Enriquecimiento de recomendaciones (recetas similares en hilos, con plazo)
+    ENRICHMENT_MAX_WORKERS = 4
+    ENRICHMENT_DEADLINE_SECONDS = 1.5
+    
+    # Reentrenamiento completo periódico tras actualizaciones en línea (0 = desactivado)
+    MODEL_COMPACTION_INTERVAL_SECONDS = 900
+    
     # Configuración para PDFs
     PDF_UPLOAD_FOLDER = 'static/pdfs/'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
     
-    # Configuración NLTK
+    # Configuración NLTK (los datos se instalan aparte; la app nunca los descarga)
     NLTK_DATA_PATH = 'nltk_data/'
\ No newline at end of file
@@ -66,7 +66,14 @@ CREATE TABLE recipe (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_public BOOLEAN DEFAULT TRUE,
-    featured BOOLEAN DEFAULT FALSE
+    featured BOOLEAN DEFAULT FALSE,
+    -- Agregados de calificaciones (se mantienen al calificar; ver flask backfill-rating-stats)
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    avg_rating DOUBLE PRECISION NOT NULL DEFAULT 0,
+    -- Bits de restricciones dietéticas/alérgenos que la receta no cumple; NULL = sin calcular
+    -- (la app lo calcula al leer; flask init-db o backfill-restriction-masks lo guardan)
+    restriction_conflicts BIGINT
 );
 
 -- Tabla de información nutricional por receta
@@ -296,7 +303,11 @@ CREATE INDEX idx_recipe_name ON recipe(name);
 CREATE INDEX idx_recipe_cuisine ON recipe(cuisine_type);
 CREATE INDEX idx_recipe_difficulty ON recipe(difficulty);
 CREATE INDEX idx_recipe_featured ON recipe(featured);
+CREATE INDEX idx_recipe_avg_rating ON recipe(avg_rating);
 CREATE INDEX idx_ingredient_name ON ingredient(name);
+-- Trigramas para ILIKE '%x%' y el operador % sobre nombres de ingredientes (ingredientes sin resolver)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX idx_ingredient_name_trgm ON ingredient USING gin (name gin_trgm_ops);
 CREATE INDEX idx_ingredient_category ON ingredient(category);
 CREATE INDEX idx_ingredient_allergen ON ingredient(common_allergen);
 CREATE INDEX idx_recipe_ingredients_recipe ON recipe_ingredients(recipe_id);
@@ -304,6 +315,7 @@ CREATE INDEX idx_recipe_ingredients_ingredient ON recipe_ingredients(ingredient_
 CREATE INDEX idx_recipe_rating_recipe ON recipe_rating(recipe_id);
 CREATE INDEX idx_recipe_rating_user ON recipe_rating(user_id);
 CREATE INDEX idx_recipe_rating_rating ON recipe_rating(rating);
+CREATE INDEX idx_recipe_rating_updated_at ON recipe_rating(updated_at);
 CREATE INDEX idx_user_ingredient_user ON user_ingredient(user_id);
 CREATE INDEX idx_user_ingredient_expiry ON user_ingredient(expiry_date);
 CREATE INDEX idx_nutritional_info_recipe ON nutritional_info(recipe_id);
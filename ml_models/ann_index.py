@@ -0,0 +1,158 @@
+import numpy as np
+from scipy.sparse import issparse, vstack
+
+try:
+    from ml_models.ranking import top_k_indices
+except ImportError:  # ejecución directa desde ml_models/
+    from ranking import top_k_indices
+
+
+def _as_rows(vectors):
+    """Asegura una matriz 2D (densa float32 o dispersa CSR)"""
+    if issparse(vectors):
+        return vectors.tocsr()
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors.reshape(1, -1) if vectors.ndim == 1 else vectors
+
+
+def _stack(first, second):
+    if issparse(first) or issparse(second):
+        return vstack([first, second]).tocsr()
+    return np.vstack([first, second])
+
+
+class ExactIndex:
+    """Índice exacto: producto punto contra todos los vectores (referencia para el ANN)"""
+
+    def __init__(self):
+        self.vectors = None
+
+    def __len__(self):
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def build(self, vectors):
+        """Indexa los vectores (filas con norma 1: el producto punto es el coseno)"""
+        self.vectors = _as_rows(vectors)
+        return self
+
+    def add(self, vectors):
+        """Agrega vectores al final; devuelve sus filas"""
+        vectors = _as_rows(vectors)
+        start = len(self)
+        self.vectors = vectors if self.vectors is None else _stack(self.vectors, vectors)
+        return np.arange(start, len(self))
+
+    def scores(self, rows, query):
+        """Producto punto exacto entre la consulta y las filas dadas"""
+        query = _as_rows(query)
+        result = self.vectors[rows] @ query.T
+        return np.asarray(result.toarray() if issparse(result) else result, dtype=np.float32).ravel()
+
+    def query(self, query, k=10):
+        """(filas, scores) de los k vectores más similares"""
+        rows = np.arange(len(self))
+        scores = self.scores(rows, query)
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+
+class RandomProjectionLSH(ExactIndex):
+    """
+    LSH por proyecciones aleatorias (hiperplanos) para similitud coseno.
+    Cada tabla asigna a cada vector un código de n_bits signos; los códigos se guardan
+    ordenados para encontrar un bucket con búsqueda binaria. La consulta junta los
+    buckets de todas las tablas (y, con probes=1, los vecinos a un bit de distancia)
+    y reordena solo esos candidatos con el producto punto exacto.
+    """
+
+    def __init__(self, n_tables=16, n_bits=None, probes=1, batch_size=100000, random_state=42):
+        super().__init__()
+        self.n_tables = n_tables
+        self.n_bits = n_bits  # None: se elige al construir según el tamaño
+        self.probes = probes
+        self.batch_size = batch_size
+        self.random_state = random_state
+        self.planes = None
+        self.codes = None          # uint32 (vectores x tablas)
+        self._sorted = None        # por tabla: (códigos ordenados, filas)
+
+    def build(self, vectors):
+        vectors = _as_rows(vectors)
+        if self.n_bits is None:
+            # Buckets de ~64 vectores por tabla: 14 bits para 1M, menos en catálogos chicos
+            self.n_bits = int(np.clip(np.log2(max(vectors.shape[0], 2)) - 6, 4, 16))
+        rng = np.random.default_rng(self.random_state)
+        self.planes = rng.standard_normal((vectors.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+        self.vectors = vectors
+        self.codes = self._hash(vectors)
+        self._sorted = None
+        return self
+
+    def add(self, vectors):
+        vectors = _as_rows(vectors)
+        if self.planes is None:
+            self.build(vectors)
+            return np.arange(len(self))
+        rows = super().add(vectors)
+        self.codes = np.vstack([self.codes, self._hash(vectors)])
+        self._sorted = None  # se reordena en la próxima consulta
+        return rows
+
+    def _hash(self, vectors):
+        """Códigos por tabla: bits de signo de las proyecciones, empaquetados en uint32"""
+        weights = (np.uint32(1) << np.arange(self.n_bits, dtype=np.uint32))
+        codes = np.empty((vectors.shape[0], self.n_tables), dtype=np.uint32)
+        for start in range(0, vectors.shape[0], self.batch_size):
+            chunk = vectors[start:start + self.batch_size]
+            projected = np.asarray(chunk @ self.planes)
+            bits = (projected > 0).reshape(-1, self.n_tables, self.n_bits).astype(np.uint32)
+            codes[start:start + len(bits)] = (bits * weights).sum(axis=2, dtype=np.uint32)
+        return codes
+
+    def _sorted_tables(self):
+        if self._sorted is None:
+            self._sorted = []
+            for table in range(self.n_tables):
+                order = np.argsort(self.codes[:, table], kind='stable')
+                self._sorted.append((self.codes[order, table], order))
+        return self._sorted
+
+    def candidates(self, query):
+        """Filas que comparten bucket con la consulta en alguna tabla"""
+        query_codes = self._hash(_as_rows(query))[0]
+        flips = [np.uint32(0)]
+        if self.probes:
+            flips += [np.uint32(1) << np.uint32(bit) for bit in range(self.n_bits)]
+        flips = np.asarray(flips, dtype=np.uint32)
+
+        found = []
+        for (sorted_codes, order), code in zip(self._sorted_tables(), query_codes):
+            probe_codes = code ^ flips
+            starts = np.searchsorted(sorted_codes, probe_codes, side='left')
+            ends = np.searchsorted(sorted_codes, probe_codes, side='right')
+            found.extend(order[start:end] for start, end in zip(starts, ends) if end > start)
+
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def query(self, query, k=10):
+        rows = self.candidates(query)
+        if len(rows) < min(k, len(self)):
+            # Consulta aislada (buckets casi vacíos): mejor el recorrido exacto que un resultado corto
+            return super().query(query, k)
+        scores = self.scores(rows, query)
+        top = top_k_indices(scores, k)
+        return rows[top], scores[top]
+
+
+# Implementaciones disponibles para ContentBasedFilter (ann_backend)
+ANN_INDEXES = {
+    'exact': ExactIndex,
+    'lsh': RandomProjectionLSH,
+}
+
+
+def create_ann_index(kind='lsh', **params):
+    """Crea un índice de vecinos por nombre"""
+    return ANN_INDEXES[kind](**params)
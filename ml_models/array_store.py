@@ -0,0 +1,73 @@
+"""
+Arrays de los modelos guardados como .npy junto al pickle del modelo
+(<modelo>.<nombre>.npy). Se abren con np.load(mmap_mode='r'): los workers de un
+nodo comparten las páginas del archivo en la caché del sistema operativo en vez de
+deserializar cada uno su propia copia. El pickle conserva solo los objetos pequeños
+(vectorizador, escaladores, índices) y el esquema de los arrays.
+"""
+import os
+
+import numpy as np
+
+CSR_PARTS = ('data', 'indices', 'indptr')
+
+
+def array_path(filepath, name):
+    """Ruta del .npy de un array del modelo guardado en filepath"""
+    return f"{os.path.splitext(filepath)[0]}.{name}.npy"
+
+
+def _save(path, array):
+    # Archivo nuevo + os.replace: un proceso que tenga mapeado el anterior sigue leyéndolo
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+    os.replace(tmp_path, path)
+
+
+def save_arrays(filepath, arrays):
+    """Guarda cada array (denso o CSR) junto al modelo; devuelve el esquema que va en el pickle"""
+    from scipy.sparse import issparse
+
+    layout = {}
+    for name, value in arrays.items():
+        if value is None:
+            continue
+        if issparse(value):
+            value = value.tocsr()
+            for part in CSR_PARTS:
+                _save(array_path(filepath, f"{name}.{part}"), getattr(value, part))
+            layout[name] = {'kind': 'csr', 'shape': list(value.shape)}
+        else:
+            value = np.asarray(value)
+            _save(array_path(filepath, name), value)
+            layout[name] = {'kind': 'dense', 'shape': list(value.shape)}
+    return layout
+
+
+def load_arrays(filepath, layout, mmap_mode='r'):
+    """
+    Abre los arrays descritos por save_arrays. mmap_mode='r' los deja de solo lectura;
+    'c' (copia en escritura) para modelos que modifican filas en memoria.
+    """
+    from scipy.sparse import csr_matrix
+
+    arrays = {}
+    for name, info in layout.items():
+        if info['kind'] == 'csr':
+            data, indices, indptr = (np.load(array_path(filepath, f"{name}.{part}"), mmap_mode=mmap_mode)
+                                     for part in CSR_PARTS)
+            arrays[name] = csr_matrix((data, indices, indptr), shape=tuple(info['shape']), copy=False)
+        else:
+            arrays[name] = np.load(array_path(filepath, name), mmap_mode=mmap_mode)
+    return arrays
+
+
+def artifact_files(filepath):
+    """El pickle del modelo y sus .npy (para copiarlos juntos)"""
+    directory, name = os.path.split(filepath)
+    stem = os.path.splitext(name)[0]
+    if not os.path.isdir(directory or '.'):
+        return []
+    return sorted(os.path.join(directory, candidate) for candidate in os.listdir(directory or '.')
+                  if candidate == name or (candidate.startswith(f"{stem}.") and candidate.endswith('.npy')))
@@ -4,8 +4,48 @@ from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
 import pickle
-import matplotlib.pyplot as plt
 import os
+from collections.abc import Mapping
+
+try:
+    from ml_models.array_store import save_arrays, load_arrays
+except ImportError:  # ejecución directa desde ml_models/
+    from array_store import save_arrays, load_arrays
+
+
+class ClusterLabels(Mapping):
+    """Etiqueta de cluster por id de receta sobre dos arrays ordenados por id (mapeables en memoria)"""
+    
+    def __init__(self, recipe_ids, labels):
+        self.recipe_ids = recipe_ids
+        self.labels = labels
+    
+    @classmethod
+    def from_dict(cls, cluster_labels):
+        """None si algún id no es entero (se guarda entonces como dict en el pickle)"""
+        if not all(isinstance(recipe_id, (int, np.integer)) for recipe_id in cluster_labels):
+            return None
+        recipe_ids = np.fromiter(cluster_labels.keys(), dtype=np.int64, count=len(cluster_labels))
+        labels = np.fromiter(cluster_labels.values(), dtype=np.int32, count=len(cluster_labels))
+        order = np.argsort(recipe_ids, kind='stable')
+        return cls(recipe_ids[order], labels[order])
+    
+    def __getitem__(self, recipe_id):
+        if isinstance(recipe_id, (int, np.integer)):
+            row = np.searchsorted(self.recipe_ids, recipe_id)
+            if row < len(self.recipe_ids) and self.recipe_ids[row] == recipe_id:
+                return int(self.labels[row])
+        raise KeyError(recipe_id)
+    
+    def __iter__(self):
+        return iter(self.recipe_ids.tolist())
+    
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def items(self):
+        return list(zip(self.recipe_ids.tolist(), self.labels.tolist()))
+
 
 class RecipeClustering:
     def __init__(self, n_clusters=8):
@@ -316,6 +356,7 @@ class RecipeClustering:
         
         # Asignar etiquetas de cluster a recetas
         cluster_labels = self.kmeans.labels_
+        self.cluster_labels = {}
         for recipe_id, label in zip(recipe_ids, cluster_labels):
             self.cluster_labels[recipe_id] = label
         
@@ -423,11 +464,18 @@ class RecipeClustering:
         """
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
+        # Etiquetas como .npy si los ids son enteros
+        labels = self.cluster_labels if isinstance(self.cluster_labels, ClusterLabels) \
+            else ClusterLabels.from_dict(self.cluster_labels)
+        arrays = save_arrays(filepath, {'cluster_recipe_ids': labels.recipe_ids,
+                                        'cluster_label_values': labels.labels}) if labels is not None else {}
+        
         model_data = {
             'kmeans': self.kmeans,
             'scaler': self.scaler,
             'pca': self.pca,
-            'cluster_labels': self.cluster_labels,
+            'cluster_labels': self.cluster_labels if labels is None else None,
+            'arrays': arrays,
             'cluster_descriptions': self.cluster_descriptions,
             'feature_names': self.feature_names,
             'n_clusters': self.n_clusters
@@ -449,7 +497,11 @@ class RecipeClustering:
             self.kmeans = model_data['kmeans']
             self.scaler = model_data['scaler']
             self.pca = model_data['pca']
-            self.cluster_labels = model_data['cluster_labels']
+            if model_data.get('arrays'):
+                arrays = load_arrays(filepath, model_data['arrays'])
+                self.cluster_labels = ClusterLabels(arrays['cluster_recipe_ids'], arrays['cluster_label_values'])
+            else:
+                self.cluster_labels = model_data['cluster_labels']
             self.cluster_descriptions = model_data['cluster_descriptions']
             self.feature_names = model_data['feature_names']
             self.n_clusters = model_data['n_clusters']
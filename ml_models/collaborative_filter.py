@@ -0,0 +1,230 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+import threading
+import pickle
+import os
+
+try:
+    from ml_models.array_store import save_arrays, load_arrays
+except ImportError:  # ejecución directa desde ml_models/
+    from array_store import save_arrays, load_arrays
+
+
+class CollaborativeFilter:
+    """
+    Filtrado colaborativo por factorización de matrices (ALS) sobre la matriz dispersa
+    usuario x receta de RecipeRating. Los ratings se centran en la media global y se
+    alternan mínimos cuadrados regularizados para usuarios y recetas. Un usuario nuevo
+    se proyecta con sus ratings (fold-in) sin reentrenar. Puntuar todo el catálogo es
+    un solo producto matriz-vector en float32. update_user / update_item actualizan un
+    vector tras cada rating nuevo; el reentrenamiento completo queda para la compactación.
+    Factores e índices se publican juntos en una tupla: una actualización arma copias y
+    las reemplaza de una vez, sin escribir sobre arrays que otra petición esté leyendo.
+    """
+
+    def __init__(self, n_factors=16, regularization=0.1, n_iterations=10, random_state=42):
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.n_iterations = n_iterations
+        self.random_state = random_state
+        self.global_mean = 0.0
+        # (factores de usuarios, factores de recetas, id de usuario -> fila, id de receta -> fila);
+        # los factores son float32 (filas x factores)
+        self._factors = (None, None, {}, {})
+        self.is_trained = False
+        self.online_updates = 0    # actualizaciones incrementales desde el último entrenamiento
+        self._update_lock = threading.Lock()
+
+    def train(self, ratings_data):
+        """Entrena con dicts {'user_id', 'recipe_id', 'rating'}"""
+        ratings_data = [r for r in ratings_data if r.get('user_id') is not None and r.get('recipe_id') is not None]
+        if not ratings_data:
+            print("⚠️ Sin ratings para el filtrado colaborativo.")
+            return False
+
+        user_index, item_index = {}, {}
+        for rating in ratings_data:
+            user_index.setdefault(rating['user_id'], len(user_index))
+            item_index.setdefault(rating['recipe_id'], len(item_index))
+
+        users = np.array([user_index[r['user_id']] for r in ratings_data])
+        items = np.array([item_index[r['recipe_id']] for r in ratings_data])
+        values = np.array([r['rating'] for r in ratings_data], dtype=np.float64)
+        self.global_mean = float(values.mean())
+
+        # Ratings repetidos del mismo usuario y receta: queda el último
+        shape = (len(user_index), len(item_index))
+        last = {}
+        for position, key in enumerate(zip(users.tolist(), items.tolist())):
+            last[key] = position
+        keep = np.fromiter(last.values(), dtype=np.int64)
+        ratings = csr_matrix((values[keep] - self.global_mean, (users[keep], items[keep])), shape=shape)
+
+        rng = np.random.default_rng(self.random_state)
+        user_factors = rng.normal(0, 0.1, (shape[0], self.n_factors))
+        item_factors = rng.normal(0, 0.1, (shape[1], self.n_factors))
+        by_item = ratings.T.tocsr()
+
+        for _ in range(self.n_iterations):
+            user_factors = self._solve_rows(ratings, item_factors)
+            item_factors = self._solve_rows(by_item, user_factors)
+
+        self._factors = (user_factors.astype(np.float32), item_factors.astype(np.float32), user_index, item_index)
+        self.is_trained = True
+        self.online_updates = 0
+        print(f"✅ Filtrado colaborativo entrenado: {shape[0]} usuarios x {shape[1]} recetas, {ratings.nnz} ratings")
+        return True
+
+    @property
+    def user_factors(self):
+        return self._factors[0]
+
+    @property
+    def item_factors(self):
+        return self._factors[1]
+
+    @property
+    def user_index(self):
+        return self._factors[2]
+
+    @property
+    def item_index(self):
+        return self._factors[3]
+
+    def _solve_rows(self, ratings, fixed):
+        """Mínimos cuadrados regularizados de cada fila de la matriz contra los factores fijos"""
+        solved = np.zeros((ratings.shape[0], self.n_factors))
+        for row in range(ratings.shape[0]):
+            start, end = ratings.indptr[row], ratings.indptr[row + 1]
+            if start < end:
+                solved[row] = self._solve(fixed[ratings.indices[start:end]], ratings.data[start:end])
+        return solved
+
+    def _solve(self, factors, centered_ratings):
+        """(FᵀF + λ·n·I)⁻¹ Fᵀr: regularización proporcional al número de ratings"""
+        gram = factors.T @ factors + self.regularization * len(centered_ratings) * np.eye(self.n_factors)
+        return np.linalg.solve(gram, factors.T @ centered_ratings)
+
+    def fold_in(self, user_ratings, factors=None):
+        """Vector de un usuario a partir de {id de receta: rating}, con los factores de recetas fijos"""
+        _, item_factors, _, item_index = factors or self._factors
+        known = [(item_index[recipe_id], rating) for recipe_id, rating in user_ratings.items()
+                 if recipe_id in item_index]
+        if not self.is_trained or not known:
+            return None
+        rows, values = zip(*known)
+        centered = np.asarray(values, dtype=np.float64) - self.global_mean
+        return self._solve(item_factors[list(rows)].astype(np.float64), centered).astype(np.float32)
+
+    def update_user(self, user_id, user_ratings):
+        """Recalcula el vector de un usuario con todos sus ratings (agrega la fila si es nuevo)"""
+        with self._update_lock:
+            user_factors, item_factors, user_index, item_index = self._factors
+            vector = self.fold_in(user_ratings, self._factors)
+            if vector is None:
+                return False
+            user_factors, user_index = self._with_row(user_factors, user_index, user_id, vector)
+            self._factors = (user_factors, item_factors, user_index, item_index)
+            self.online_updates += 1
+        return True
+
+    def update_item(self, recipe_id, recipe_ratings):
+        """Recalcula el vector de una receta con los ratings de usuarios ya factorizados"""
+        if not self.is_trained:
+            return False
+        with self._update_lock:
+            user_factors, item_factors, user_index, item_index = self._factors
+            known = [(user_index[user_id], rating) for user_id, rating in recipe_ratings.items()
+                     if user_id in user_index]
+            if not known:
+                return False
+            rows, values = zip(*known)
+            centered = np.asarray(values, dtype=np.float64) - self.global_mean
+            vector = self._solve(user_factors[list(rows)].astype(np.float64), centered).astype(np.float32)
+            item_factors, item_index = self._with_row(item_factors, item_index, recipe_id, vector)
+            self._factors = (user_factors, item_factors, user_index, item_index)
+            self.online_updates += 1
+        return True
+
+    @staticmethod
+    def _with_row(factors, index, key, vector):
+        """Copias de la matriz y del índice con la fila de key escrita (agregada si es nueva)"""
+        row = index.get(key)
+        if row is None:
+            index = dict(index)
+            index[key] = len(factors)
+            return np.vstack([factors, vector[np.newaxis, :]]), index
+        factors = np.array(factors)
+        factors[row] = vector
+        return factors, index
+
+    def user_vector(self, user_id=None, user_ratings=None, factors=None):
+        """Factores del usuario entrenado o, si es nuevo, proyectados con sus ratings"""
+        if not self.is_trained:
+            return None
+        factors = factors or self._factors
+        row = factors[2].get(user_id)
+        if row is not None:
+            return factors[0][row]
+        return self.fold_in(user_ratings, factors) if user_ratings else None
+
+    def predict_catalog(self, user_vector, factors=None):
+        """Rating predicho para todas las recetas del modelo (un producto matriz-vector)"""
+        return (factors or self._factors)[1] @ user_vector + np.float32(self.global_mean)
+
+    def predict(self, recipe_ids, user_id=None, user_ratings=None):
+        """
+        Ratings predichos (1-5) alineados con recipe_ids, o None si no hay vector de usuario.
+        Las recetas sin ratings en el entrenamiento reciben la media global.
+        """
+        factors = self._factors  # una sola versión de factores e índices para toda la predicción
+        vector = self.user_vector(user_id, user_ratings, factors)
+        if vector is None:
+            return None
+
+        catalog_scores = self.predict_catalog(vector, factors)
+        item_index = factors[3]
+        rows = np.array([item_index.get(recipe_id, -1) for recipe_id in recipe_ids], dtype=np.int64)
+        predictions = np.full(len(rows), self.global_mean, dtype=np.float32)
+        known = rows >= 0
+        predictions[known] = catalog_scores[rows[known]]
+        return np.clip(predictions, 1, 5)
+
+    def save_model(self, filepath):
+        """Guardar índices; los factores van como .npy"""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+        try:
+            model_data = {
+                'n_factors': self.n_factors,
+                'regularization': self.regularization,
+                'global_mean': self.global_mean,
+                'user_index': self.user_index,
+                'item_index': self.item_index,
+                'arrays': save_arrays(filepath, {'user_factors': self.user_factors, 'item_factors': self.item_factors})
+            }
+            with open(filepath, 'wb') as f:
+                pickle.dump(model_data, f)
+            print(f"✅ Filtrado colaborativo guardado en {filepath}")
+        except Exception as e:
+            print(f"❌ Error guardando filtrado colaborativo: {e}")
+
+    def load_model(self, filepath):
+        """Cargar factores e índices"""
+        try:
+            with open(filepath, 'rb') as f:
+                model_data = pickle.load(f)
+            if 'arrays' in model_data:
+                # Solo lectura: las actualizaciones en línea trabajan sobre copias
+                model_data.update(load_arrays(filepath, model_data['arrays']))
+
+            self.n_factors = model_data['n_factors']
+            self.regularization = model_data['regularization']
+            self.global_mean = model_data['global_mean']
+            self._factors = (model_data.get('user_factors'), model_data.get('item_factors'),
+                             model_data['user_index'], model_data['item_index'])
+            self.is_trained = self.item_factors is not None
+            return True
+        except Exception as e:
+            print(f"❌ Error cargando filtrado colaborativo: {e}")
+            return False
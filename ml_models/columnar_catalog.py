@@ -0,0 +1,123 @@
+import numpy as np
+
+try:
+    from ml_models.ingredient_index import IngredientIndex
+except ImportError:  # ejecución directa desde ml_models/
+    from ingredient_index import IngredientIndex
+
+try:
+    from ml_models.dietary_rules import RESTRICTION_BITS, NUTRITION_LIMITS, ingredient_conflicts, required_mask
+except ImportError:  # ejecución directa desde ml_models/
+    from dietary_rules import RESTRICTION_BITS, NUTRITION_LIMITS, ingredient_conflicts, required_mask
+
+NUTRITION_COLUMNS = ['calories_per_serving', 'protein', 'carbs', 'fat', 'fiber', 'sugar', 'sodium']
+
+
+class ColumnarCatalog:
+    """
+    Catálogo de recetas en formato columnar (un array NumPy por atributo).
+    Las reglas del sistema experto se evalúan como máscaras booleanas sobre
+    estas columnas en lugar de recorrer objetos receta uno por uno.
+    """
+
+    def __init__(self):
+        from scipy.sparse import csr_matrix  # scipy se importa al construir el catálogo, no al iniciar
+
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.total_time = np.zeros(0, dtype=np.int32)
+        self.difficulty = np.zeros(0, dtype=np.int16)
+        self.cuisine = np.zeros(0, dtype=np.int16)
+        self.servings = np.zeros(0, dtype=np.int16)
+        self.nutrition = np.zeros((0, len(NUTRITION_COLUMNS)), dtype=np.float32)
+        self.restriction_conflicts = np.zeros(0, dtype=np.int64)
+        self.ingredient_matrix = csr_matrix((0, 0), dtype=np.float32)
+        self.ingredient_index = None
+
+        self.difficulty_codes = {}
+        self.cuisine_codes = {}
+        self.ingredient_vocabulary = {}
+        self.recipe_positions = {}
+
+    @classmethod
+    def from_recipes(cls, recipes_data):
+        """Construye el catálogo columnar a partir de diccionarios de recetas"""
+        catalog = cls()
+        n_recipes = len(recipes_data)
+
+        catalog.recipe_ids = np.fromiter((r['id'] for r in recipes_data), dtype=np.int64, count=n_recipes)
+        catalog.total_time = np.fromiter(
+            (r.get('total_time', (r.get('prep_time') or 0) + (r.get('cook_time') or 0)) for r in recipes_data),
+            dtype=np.int32, count=n_recipes
+        )
+        catalog.servings = np.fromiter((r.get('servings') or 0 for r in recipes_data), dtype=np.int16, count=n_recipes)
+        catalog.difficulty = catalog._encode(recipes_data, 'difficulty', catalog.difficulty_codes)
+        catalog.cuisine = catalog._encode(recipes_data, 'cuisine_type', catalog.cuisine_codes)
+
+        # Columnas nutricionales (NaN si la receta no tiene información)
+        catalog.nutrition = np.full((n_recipes, len(NUTRITION_COLUMNS)), np.nan, dtype=np.float32)
+        for row, recipe in enumerate(recipes_data):
+            nutrition = recipe.get('nutritional_info')
+            if nutrition:
+                catalog.nutrition[row] = [nutrition.get(column, np.nan) for column in NUTRITION_COLUMNS]
+
+        # Matriz CSR receta x ingrediente compartida con el índice invertido
+        catalog.ingredient_index = IngredientIndex.from_recipes(recipes_data)
+        catalog.ingredient_matrix = catalog.ingredient_index.ingredient_matrix
+        catalog.ingredient_vocabulary = vocabulary = catalog.ingredient_index.vocabulary
+
+        # Conflictos por receta = OR de los conflictos de sus ingredientes + límites nutricionales
+        term_conflicts = np.fromiter((ingredient_conflicts(name) for name in vocabulary), dtype=np.int64, count=len(vocabulary))
+        conflicts = np.zeros(n_recipes, dtype=np.int64)
+        for bit in RESTRICTION_BITS.values():
+            has_conflict = catalog.ingredient_matrix @ ((term_conflicts & bit) != 0).astype(np.float32)
+            conflicts[has_conflict > 0] |= bit
+        for restriction, (field, limit) in NUTRITION_LIMITS.items():
+            with np.errstate(invalid='ignore'):
+                over_limit = catalog.nutrition[:, NUTRITION_COLUMNS.index(field)] > limit
+            conflicts[over_limit] |= RESTRICTION_BITS[restriction]
+
+        # La máscara guardada en la BD (calculada al escribir) tiene prioridad; None = sin calcular
+        stored = np.fromiter(
+            (-1 if r.get('restriction_conflicts') is None else r['restriction_conflicts'] for r in recipes_data),
+            dtype=np.int64, count=n_recipes
+        )
+        catalog.restriction_conflicts = np.where(stored >= 0, stored, conflicts)
+
+        catalog.recipe_positions = {recipe_id: row for row, recipe_id in enumerate(catalog.recipe_ids.tolist())}
+        return catalog
+
+    def _encode(self, recipes_data, field, codes):
+        """Codifica un atributo categórico como enteros"""
+        return np.fromiter(
+            (codes.setdefault(r.get(field), len(codes)) for r in recipes_data),
+            dtype=np.int16, count=len(recipes_data)
+        )
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def positions(self, recipe_ids):
+        """Convierte ids de receta en filas del catálogo (-1 si no existe)"""
+        return np.fromiter((self.recipe_positions.get(rid, -1) for rid in recipe_ids), dtype=np.int64, count=len(recipe_ids))
+
+    def time_mask(self, rows, max_time):
+        """Máscara de recetas cuyo tiempo total no supera max_time"""
+        return self.total_time[rows] <= max_time
+
+    def difficulty_mask(self, rows, difficulty):
+        """Máscara de recetas con la dificultad indicada"""
+        code = self.difficulty_codes.get(difficulty)
+        if code is None:
+            return np.zeros(len(rows), dtype=bool)
+        return self.difficulty[rows] == code
+
+    def cuisine_mask(self, rows, cuisine_type):
+        """Máscara de recetas del tipo de cocina indicado"""
+        code = self.cuisine_codes.get(cuisine_type)
+        if code is None:
+            return np.zeros(len(rows), dtype=bool)
+        return self.cuisine[rows] == code
+
+    def restriction_mask(self, rows, restriction_names):
+        """Máscara de recetas compatibles con todas las restricciones (las desconocidas no filtran)"""
+        return (self.restriction_conflicts[rows] & required_mask(restriction_names)) == 0
@@ -3,9 +3,23 @@ import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import MinMaxScaler
+from scipy.sparse import csr_matrix, hstack
 import pickle
 import os
 
+try:
+    from ml_models.ranking import top_k_indices
+    from ml_models.ann_index import create_ann_index
+    from ml_models.array_store import save_arrays, load_arrays
+except ImportError:  # ejecución directa desde ml_models/
+    from ranking import top_k_indices
+    from ann_index import create_ann_index
+    from array_store import save_arrays, load_arrays
+
+# Pesos de la similitud combinada entre recetas
+CONTENT_WEIGHT = 0.7
+FEATURE_WEIGHT = 0.3
+
 class ContentBasedFilter:
     def __init__(self):
         self.tfidf_vectorizer = TfidfVectorizer(
@@ -18,8 +32,21 @@ class ContentBasedFilter:
         self.recipe_content_matrix = None
         self.scaler = MinMaxScaler()
         self.recipe_ids = []
+        self.recipe_index = {}  # id de receta -> fila de las matrices
         self.feature_names = []
         
+        # Tabla de vecinos precalculada: receta -> top-K ids y scores de similitud
+        self.n_neighbors = 10
+        self.neighbor_ids = None     # int32 (recetas x K), -1 si no hay vecino
+        self.neighbor_scores = None  # float32 (recetas x K)
+        self._unit_features = None
+        
+        # Índices de vecinos aproximados (ANN) para catálogos grandes; no se persisten
+        self.ann_backend = 'lsh'
+        self.ann_threshold = 50000  # desde cuántas recetas se usa el ANN en vez del cálculo exacto
+        self.content_ann = None     # consultas por ingredientes (solo TF-IDF)
+        self.combined_ann = None    # receta contra receta (contenido + características)
+        
     def train(self, recipes_data=None):
         """Entrenar el filtro basado en contenido"""
         if recipes_data is None:
@@ -47,12 +74,18 @@ class ContentBasedFilter:
         
         # Entrenar TF-IDF en contenido textual
         self.recipe_content_matrix = self.tfidf_vectorizer.fit_transform(recipe_texts)
+        self._build_recipe_index()
         
         # Normalizar características numéricas
         features_df = pd.DataFrame(recipe_features)
         features_df = features_df.fillna(0)
         self.feature_names = features_df.columns.tolist()
         self.recipe_features_matrix = self.scaler.fit_transform(features_df)
+        self._unit_features = None
+        
+        # Vecinos más similares de cada receta, para servirlos sin recalcular
+        self._build_ann_indexes()
+        self._build_neighbor_table()
         
         print(f"✅ Filtro de contenido entrenado con {len(recipes_data)} recetas.")
     
@@ -299,66 +332,150 @@ class ContentBasedFilter:
         
         return categories
     
+    def _build_recipe_index(self):
+        """Construir el índice id de receta -> fila de las matrices"""
+        self.recipe_index = {recipe_id: row for row, recipe_id in enumerate(self.recipe_ids)}
+    
     def calculate_similarity(self, query_ingredients, recipe_id):
         """Calcular similitud entre ingredientes de consulta y una receta"""
+        return self.calculate_similarities(query_ingredients, [recipe_id])[0]
+    
+    def calculate_similarities(self, query_ingredients, recipe_ids):
+        """Calcular en lote la similitud entre ingredientes de consulta y varias recetas"""
+        similarities = np.zeros(len(recipe_ids))
         if self.recipe_content_matrix is None:
-            return 0.0
-        
-        try:
-            # Encontrar índice de la receta
-            recipe_idx = self.recipe_ids.index(recipe_id)
-        except ValueError:
-            return 0.0
+            return similarities
         
-        # Crear texto de consulta con ingredientes
+        # Vectorizar consulta una sola vez
         query_text = ' '.join(query_ingredients).lower()
-        
-        # Vectorizar consulta
         query_vector = self.tfidf_vectorizer.transform([query_text])
         
-        # Calcular similitud coseno con contenido textual
-        recipe_vector = self.recipe_content_matrix[recipe_idx]
-        content_similarity = cosine_similarity(query_vector, recipe_vector)[0][0]
+        # Filas TF-IDF normalizadas (L2): coseno = producto matriz-vector disperso
+        all_similarities = (self.recipe_content_matrix @ query_vector.T).toarray().ravel()
+        
+        # Recetas desconocidas conservan similitud 0
+        rows = np.array([self.recipe_index.get(recipe_id, -1) for recipe_id in recipe_ids], dtype=int)
+        known = rows >= 0
+        similarities[known] = all_similarities[rows[known]]
         
-        return content_similarity
+        return similarities
     
-    def find_similar_recipes(self, target_recipe_id, recipes_data, n_recommendations=5):
-        """Encontrar recetas similares a una receta objetivo"""
+    def _normalized_features(self):
+        """Características con norma 1: el coseno pasa a ser un producto punto"""
+        if self._unit_features is None:
+            norms = np.linalg.norm(self.recipe_features_matrix, axis=1, keepdims=True)
+            self._unit_features = np.divide(
+                self.recipe_features_matrix, norms,
+                out=np.zeros_like(self.recipe_features_matrix, dtype=float), where=norms > 0
+            )
+        return self._unit_features
+    
+    def _similarity_rows(self, rows):
+        """Similitud combinada (70% contenido, 30% características) de varias filas contra todo el catálogo"""
+        unit_features = self._normalized_features()
+        
+        # Las filas TF-IDF ya están normalizadas (L2)
+        content_similarities = (self.recipe_content_matrix[rows] @ self.recipe_content_matrix.T).toarray()
+        feature_similarities = unit_features[rows] @ unit_features.T
+        return CONTENT_WEIGHT * content_similarities + FEATURE_WEIGHT * feature_similarities
+    
+    def _combined_vectors(self):
+        """Vectores [√0.7·TF-IDF, √0.3·características]: su producto punto es la similitud combinada"""
+        return hstack([
+            np.sqrt(CONTENT_WEIGHT) * self.recipe_content_matrix,
+            csr_matrix(np.sqrt(FEATURE_WEIGHT) * self._normalized_features())
+        ]).tocsr()
+    
+    def _build_ann_indexes(self):
+        """Construye los índices ANN si el catálogo supera ann_threshold"""
+        self.content_ann = None
+        self.combined_ann = None
+        if self.recipe_content_matrix is None or len(self.recipe_ids) < self.ann_threshold:
+            return
+        
+        print(f"🔎 Construyendo índices ANN ({self.ann_backend}) para {len(self.recipe_ids)} recetas...")
+        self.content_ann = create_ann_index(self.ann_backend).build(self.recipe_content_matrix)
+        if self.recipe_features_matrix is not None:
+            self.combined_ann = create_ann_index(self.ann_backend).build(self._combined_vectors())
+    
+    def _ann_neighbor_rows(self, row, n):
+        """Vecinos aproximados de una fila: (filas, scores) sin incluirla"""
+        rows, scores = self.combined_ann.query(self.combined_ann.vectors[row], n + 1)
+        keep = rows != row
+        return rows[keep][:n], scores[keep][:n]
+    
+    def _top_neighbor_rows(self, similarities, row, n):
+        """Filas de las n recetas más similares a una fila, sin incluirla"""
+        similarities[row] = -np.inf
+        top = top_k_indices(similarities, n)
+        return top[top != row]
+    
+    def _build_neighbor_table(self, batch_size=512):
+        """Precalcula los K vecinos más similares de cada receta (por bloques de filas)"""
+        n_recipes = len(self.recipe_ids)
+        k = min(self.n_neighbors, max(n_recipes - 1, 0))
+        recipe_ids = np.asarray(self.recipe_ids, dtype=np.int32)
+        
+        neighbor_ids = np.full((n_recipes, self.n_neighbors), -1, dtype=np.int32)
+        neighbor_scores = np.zeros((n_recipes, self.n_neighbors), dtype=np.float32)
+        
+        if self.combined_ann is not None:
+            # Catálogo grande: consultar el ANN en vez de la matriz de similitud completa (O(N²))
+            for row in range(n_recipes):
+                top, scores = self._ann_neighbor_rows(row, k)
+                neighbor_ids[row, :len(top)] = recipe_ids[top]
+                neighbor_scores[row, :len(top)] = scores
+        else:
+            for start in range(0, n_recipes, batch_size):
+                rows = np.arange(start, min(start + batch_size, n_recipes))
+                similarities = self._similarity_rows(rows)
+                for offset, row in enumerate(rows):
+                    top = self._top_neighbor_rows(similarities[offset], row, k)
+                    neighbor_ids[row, :len(top)] = recipe_ids[top]
+                    neighbor_scores[row, :len(top)] = similarities[offset, top]
+        
+        self.neighbor_ids = neighbor_ids
+        self.neighbor_scores = neighbor_scores
+    
+    def neighbors(self, recipe_id, n_recommendations=5):
+        """
+        Vecinos precalculados de una receta: (ids, scores) en O(1).
+        Devuelve None si no hay tabla, la receta no estaba en el entrenamiento o se piden más de K.
+        """
+        row = self.recipe_index.get(recipe_id)
+        if self.neighbor_ids is None or row is None or n_recommendations > self.neighbor_ids.shape[1]:
+            return None
+        
+        ids = self.neighbor_ids[row, :n_recommendations]
+        valid = ids >= 0
+        return ids[valid].tolist(), self.neighbor_scores[row, :n_recommendations][valid].tolist()
+    
+    def similar_recipe_ids(self, target_recipe_id, n_recommendations=5):
+        """Ids de las recetas más similares, desde la tabla de vecinos o calculados al vuelo"""
+        precomputed = self.neighbors(target_recipe_id, n_recommendations)
+        if precomputed is not None:
+            return precomputed[0]
+        
         if self.recipe_content_matrix is None or self.recipe_features_matrix is None:
             return []
         
-        try:
-            target_idx = self.recipe_ids.index(target_recipe_id)
-        except ValueError:
+        target_idx = self.recipe_index.get(target_recipe_id)
+        if target_idx is None:
             return []
         
-        # Combinar similitud de contenido y características
-        target_content = self.recipe_content_matrix[target_idx]
-        target_features = self.recipe_features_matrix[target_idx].reshape(1, -1)
-        
-        # Calcular similitudes
-        content_similarities = cosine_similarity(target_content, self.recipe_content_matrix)[0]
-        feature_similarities = cosine_similarity(target_features, self.recipe_features_matrix)[0]
+        if self.combined_ann is not None:
+            return [self.recipe_ids[idx] for idx in self._ann_neighbor_rows(target_idx, n_recommendations)[0]]
         
-        # Combinar similitudes (70% contenido, 30% características)
-        combined_similarities = 0.7 * content_similarities + 0.3 * feature_similarities
-        
-        # Obtener índices de recetas más similares (excluyendo la receta objetivo)
-        similar_indices = np.argsort(combined_similarities)[::-1]
-        similar_indices = [idx for idx in similar_indices if idx != target_idx][:n_recommendations]
-        
-        # Obtener IDs de recetas similares
-        similar_recipe_ids = [self.recipe_ids[idx] for idx in similar_indices]
-        
-        # Filtrar recetas de los datos
-        similar_recipes = [recipe for recipe in recipes_data 
-                          if recipe.get('id') in similar_recipe_ids]
-        
-        # Ordenar según el orden de similitud
-        recipe_order = {recipe_id: i for i, recipe_id in enumerate(similar_recipe_ids)}
-        similar_recipes.sort(key=lambda r: recipe_order.get(r.get('id'), float('inf')))
+        similarities = self._similarity_rows([target_idx])[0]
+        return [self.recipe_ids[idx] for idx in self._top_neighbor_rows(similarities, target_idx, n_recommendations)]
+    
+    def find_similar_recipes(self, target_recipe_id, recipes_data, n_recommendations=5):
+        """Encontrar recetas similares a una receta objetivo"""
+        similar_recipe_ids = self.similar_recipe_ids(target_recipe_id, n_recommendations)
         
-        return similar_recipes
+        # Devolver los diccionarios en el orden de similitud
+        recipes_by_id = {recipe.get('id'): recipe for recipe in recipes_data}
+        return [recipes_by_id[recipe_id] for recipe_id in similar_recipe_ids if recipe_id in recipes_by_id]
     
     def recommend_by_ingredients(self, ingredients_list, user_preferences=None, n_recommendations=10):
         """Recomendar recetas basadas en lista de ingredientes"""
@@ -369,35 +486,40 @@ class ContentBasedFilter:
         query_text = ' '.join(ingredients_list).lower()
         query_vector = self.tfidf_vectorizer.transform([query_text])
         
-        # Calcular similitudes con todas las recetas
-        similarities = cosine_similarity(query_vector, self.recipe_content_matrix)[0]
+        if self.content_ann is not None:
+            # Catálogo grande: solo se puntúan los candidatos del índice ANN
+            top_indices, top_similarities = self.content_ann.query(query_vector, n_recommendations)
+        else:
+            # Calcular similitudes con todas las recetas
+            similarities = cosine_similarity(query_vector, self.recipe_content_matrix)[0]
+            
+            # Obtener índices de recetas más similares (top-k sin ordenar todo el vector)
+            top_indices = top_k_indices(similarities, n_recommendations)
+            top_similarities = similarities[top_indices]
         
         # Aplicar filtros de preferencias del usuario si se proporcionan
         if user_preferences:
-            similarities = self._apply_user_preferences(similarities, user_preferences)
-        
-        # Obtener índices de recetas más similares
-        top_indices = np.argsort(similarities)[::-1][:n_recommendations]
+            top_similarities = self._apply_user_preferences(top_similarities, user_preferences)
         
         # Obtener IDs de recetas recomendadas
-        recommended_recipe_ids = [self.recipe_ids[idx] for idx in top_indices if similarities[idx] > 0.1]
+        recommended_recipe_ids = [self.recipe_ids[idx] for idx, similarity in zip(top_indices, top_similarities)
+                                  if similarity > 0.1]
         
         return recommended_recipe_ids
     
     def _apply_user_preferences(self, similarities, user_preferences):
         """Aplicar preferencias del usuario para ajustar similitudes"""
-        adjusted_similarities = similarities.copy()
+        adjusted_similarities = np.array(similarities, dtype=float)
         
         # Ejemplo de aplicación de preferencias
         # Esto se puede expandir según las necesidades
-        for i, recipe_id in enumerate(self.recipe_ids):
-            # Penalizar según tiempo máximo
-            if user_preferences.get('max_prep_time'):
-                max_time = user_preferences['max_prep_time']
-                # Aquí necesitaríamos acceso a los datos de la receta
-                # Por simplicidad, aplicamos un factor general
-                if max_time < 30:
-                    adjusted_similarities[i] *= 0.8
+        # Penalizar según tiempo máximo
+        if user_preferences.get('max_prep_time'):
+            max_time = user_preferences['max_prep_time']
+            # Aquí necesitaríamos acceso a los datos de la receta
+            # Por simplicidad, aplicamos un factor general
+            if max_time < 30:
+                adjusted_similarities *= 0.8
         
         return adjusted_similarities
     
@@ -406,9 +528,8 @@ class ContentBasedFilter:
         if self.recipe_features_matrix is None:
             return {}
         
-        try:
-            recipe_idx = self.recipe_ids.index(recipe_id)
-        except ValueError:
+        recipe_idx = self.recipe_index.get(recipe_id)
+        if recipe_idx is None:
             return {}
         
         recipe_features = self.recipe_features_matrix[recipe_idx]
@@ -421,19 +542,24 @@ class ContentBasedFilter:
         return features_dict
     
     def save_model(self, filepath):
-        """Guardar el modelo del filtro de contenido"""
+        """Guardar el modelo del filtro de contenido (matrices y tabla de vecinos como .npy)"""
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         
-        model_data = {
-            'tfidf_vectorizer': self.tfidf_vectorizer,
-            'recipe_content_matrix': self.recipe_content_matrix,
-            'recipe_features_matrix': self.recipe_features_matrix,
-            'scaler': self.scaler,
-            'recipe_ids': self.recipe_ids,
-            'feature_names': self.feature_names
-        }
-        
         try:
+            arrays = save_arrays(filepath, {
+                'recipe_content_matrix': self.recipe_content_matrix,
+                'recipe_features_matrix': self.recipe_features_matrix,
+                'unit_features': self._normalized_features() if self.recipe_features_matrix is not None else None,
+                'neighbor_ids': self.neighbor_ids,
+                'neighbor_scores': self.neighbor_scores
+            })
+            model_data = {
+                'tfidf_vectorizer': self.tfidf_vectorizer,
+                'scaler': self.scaler,
+                'recipe_ids': self.recipe_ids,
+                'feature_names': self.feature_names,
+                'arrays': arrays
+            }
             with open(filepath, 'wb') as f:
                 pickle.dump(model_data, f)
             print(f"✅ Modelo de filtro de contenido guardado en {filepath}")
@@ -445,13 +571,25 @@ class ContentBasedFilter:
         try:
             with open(filepath, 'rb') as f:
                 model_data = pickle.load(f)
+            if 'arrays' in model_data:
+                # Arrays mapeados en memoria: compartidos entre procesos
+                model_data.update(load_arrays(filepath, model_data['arrays']))
             
             self.tfidf_vectorizer = model_data['tfidf_vectorizer']
-            self.recipe_content_matrix = model_data['recipe_content_matrix']
-            self.recipe_features_matrix = model_data['recipe_features_matrix']
+            self.recipe_content_matrix = model_data.get('recipe_content_matrix')
+            self.recipe_features_matrix = model_data.get('recipe_features_matrix')
             self.scaler = model_data['scaler']
             self.recipe_ids = model_data['recipe_ids']
             self.feature_names = model_data['feature_names']
+            self._build_recipe_index()
+            self._unit_features = model_data.get('unit_features')
+            self._build_ann_indexes()
+            
+            self.neighbor_ids = model_data.get('neighbor_ids')
+            self.neighbor_scores = model_data.get('neighbor_scores')
+            if self.neighbor_ids is None and self.recipe_features_matrix is not None:
+                # Modelos guardados antes de la tabla de vecinos
+                self._build_neighbor_table()
             
             print(f"✅ Modelo de filtro de contenido cargado desde {filepath}")
             return True
@@ -0,0 +1,74 @@
+import re
+
+# Ingredientes prohibidos por restricción dietética. Cada entrada es un fragmento
+# de expresión regular que se busca dentro del nombre del ingrediente en minúsculas
+# (una palabra sola equivale a la búsqueda por subcadena de siempre).
+RESTRICTION_KEYWORDS = {
+    'vegetariano': ['pollo', 'carne', 'pescado', 'cerdo', 'pavo', 'cordero'],
+    'vegano': ['pollo', 'carne', 'pescado', 'huevo', 'leche', 'queso', 'mantequilla', 'crema'],
+    'sin gluten': ['harina', 'trigo', 'avena', 'cebada', 'centeno', 'pan', 'pasta'],
+    'sin lactosa': ['leche', 'queso', 'mantequilla', 'crema', 'yogurt'],
+    'diabético': ['azúcar', 'miel', 'jarabe', 'caramelo', 'dulce de leche', 'leche condensada'],
+    'bajo sodio': [r'\bsal\b', 'salsa de soja', 'jamón', 'tocino', 'embutido', 'chorizo', 'cubito', 'caldo en cubo'],
+    'paleo': ['harina', 'trigo', 'arroz', 'pasta', 'pan', 'avena', 'maíz', 'frijol', 'lenteja', 'garbanzo',
+              'soja', 'leche', 'queso', 'yogurt', 'mantequilla', 'crema', 'azúcar'],
+    'keto': ['azúcar', 'miel', 'harina', 'arroz', 'pasta', 'pan', 'papa', 'patata', 'maíz', 'avena',
+             'frijol', 'lenteja', 'garbanzo', 'plátano'],
+}
+
+# Límites por porción cuando la receta tiene información nutricional
+NUTRITION_LIMITS = {
+    'diabético': ('sugar', 15.0),
+    'bajo sodio': ('sodium', 600.0),
+    'keto': ('carbs', 20.0),
+}
+
+# Posición fija de cada bit: solo se agregan nombres al final (las máscaras se guardan en la BD)
+RESTRICTION_ORDER = ['vegetariano', 'vegano', 'sin gluten', 'sin lactosa',
+                     'diabético', 'bajo sodio', 'paleo', 'keto']
+RESTRICTION_BITS = {name: 1 << bit for bit, name in enumerate(RESTRICTION_ORDER)}
+
+# Bit aparte para recetas con algún ingrediente marcado como alérgeno común
+ALLERGEN_BIT = 1 << 30
+ALLERGEN_RESTRICTION = 'sin alérgenos comunes'
+
+_RESTRICTION_PATTERNS = {
+    name: re.compile('|'.join(RESTRICTION_KEYWORDS[name])) for name in RESTRICTION_ORDER
+}
+
+
+def ingredient_conflicts(ingredient_name):
+    """Máscara de restricciones que viola un ingrediente"""
+    name = ingredient_name.lower()
+    mask = 0
+    for restriction, pattern in _RESTRICTION_PATTERNS.items():
+        if pattern.search(name):
+            mask |= RESTRICTION_BITS[restriction]
+    return mask
+
+
+def recipe_conflicts(ingredient_names, nutrition=None, has_allergen=False):
+    """Máscara de restricciones que viola una receta (bit activo = incompatible)"""
+    mask = 0
+    for name in ingredient_names:
+        mask |= ingredient_conflicts(name)
+
+    if nutrition:
+        for restriction, (field, limit) in NUTRITION_LIMITS.items():
+            value = nutrition.get(field)
+            if value is not None and value > limit:
+                mask |= RESTRICTION_BITS[restriction]
+
+    if has_allergen:
+        mask |= ALLERGEN_BIT
+
+    return mask
+
+
+def required_mask(restriction_names):
+    """Bits que una receta no debe tener para cumplir las restricciones (las desconocidas no filtran)"""
+    mask = 0
+    for name in restriction_names:
+        name = name.lower().strip()
+        mask |= ALLERGEN_BIT if name == ALLERGEN_RESTRICTION else RESTRICTION_BITS.get(name, 0)
+    return mask
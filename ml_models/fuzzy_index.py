@@ -0,0 +1,112 @@
+from collections import defaultdict
+
+
+def bounded_distance(a, b, max_distance):
+    """Distancia de Levenshtein entre a y b, o max_distance + 1 si la supera (corta en cuanto lo sabe)"""
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+
+    # El prefijo y el sufijo comunes no cambian la distancia
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return min(len(a), too_far)
+
+    # Solo la banda de la diagonal |i - j| <= max_distance puede quedar dentro del límite
+    previous_row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - max_distance), min(len(b), i + max_distance)
+        current_row = [too_far] * (len(b) + 1)
+        current_row[0] = min(i, too_far)
+        c1 = a[i - 1]
+        for j in range(low, high + 1):
+            current_row[j] = min(previous_row[j] + 1, current_row[j - 1] + 1, previous_row[j - 1] + (c1 != b[j - 1]))
+        if min(current_row[low - 1:high + 1]) > max_distance:
+            return too_far
+        previous_row = current_row
+    return min(previous_row[-1], too_far)
+
+
+class FuzzyIndex:
+    """
+    Índice de borrados al estilo SymSpell para búsquedas tolerantes a errores de tipeo.
+    Cada texto se registra con todas las variantes de su prefijo a las que se llega
+    borrando hasta max_distance caracteres; una consulta genera los borrados de su
+    propio prefijo y solo verifica con Levenshtein los textos que comparten alguno,
+    sin recorrer todo el vocabulario.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.terms = []                   # id de término -> texto en minúsculas
+        self.term_ids = {}                # texto -> id de término
+        self.term_keys = []               # id de término -> claves con ese texto
+        self.deletes = defaultdict(list)  # borrado del prefijo -> ids de término
+
+    @classmethod
+    def from_items(cls, items, max_distance=2, prefix_length=7):
+        """Construye el índice a partir de pares (clave, texto)"""
+        index = cls(max_distance, prefix_length)
+        for key, text in items:
+            index.add(key, text)
+        return index
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _deletes(self, text, max_distance):
+        """El prefijo del texto y sus variantes con hasta max_distance caracteres borrados"""
+        prefix = text[:self.prefix_length]
+        variants = {prefix}
+        level = [prefix]
+        for _ in range(max_distance):
+            next_level = []
+            for variant in level:
+                for i in range(len(variant)):
+                    deleted = variant[:i] + variant[i + 1:]
+                    if deleted not in variants:
+                        variants.add(deleted)
+                        next_level.append(deleted)
+            level = next_level
+        return variants
+
+    def add(self, key, text):
+        """Agrega un texto (varias claves pueden compartirlo)"""
+        text = text.lower().strip()
+        term_id = self.term_ids.get(text)
+        if term_id is None:
+            term_id = self.term_ids[text] = len(self.terms)
+            self.terms.append(text)
+            self.term_keys.append([])
+            for variant in self._deletes(text, self.max_distance):
+                self.deletes[variant].append(term_id)
+        self.term_keys[term_id].append(key)
+
+    def lookup(self, query, max_distance=None, limit=None):
+        """[(clave, texto, distancia)] a distancia <= max_distance, los más cercanos primero"""
+        query = query.lower().strip()
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+
+        candidates = set()
+        for variant in self._deletes(query, max_distance):
+            candidates.update(self.deletes.get(variant, ()))
+
+        found = []
+        for term_id in candidates:
+            distance = bounded_distance(query, self.terms[term_id], max_distance)
+            if distance <= max_distance:
+                found.append((distance, term_id))
+        found.sort()
+
+        results = [(key, self.terms[term_id], distance) for distance, term_id in found for key in self.term_keys[term_id]]
+        return results[:limit] if limit is not None else results
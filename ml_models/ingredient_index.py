@@ -0,0 +1,189 @@
+import numpy as np
+
+try:
+    from ml_models.ngram_index import TrigramIndex
+except ImportError:  # ejecución directa desde ml_models/
+    from ngram_index import TrigramIndex
+
+
+class PantryMatch:
+    """Resultado de cruzar una despensa con todas las recetas del índice"""
+
+    def __init__(self, index, pantry, matched_counts):
+        self.index = index
+        self.pantry = pantry
+        self.matched_counts = matched_counts
+        self.ingredient_counts = index.ingredient_counts
+        self.coverage = np.divide(
+            matched_counts, self.ingredient_counts,
+            out=np.zeros(len(matched_counts)), where=self.ingredient_counts > 0
+        )
+
+    def missing(self, row):
+        """Ingredientes de la receta (en su orden) que no están en la despensa"""
+        return self.index.missing_for(row, self.pantry)
+
+
+class IngredientIndex:
+    """
+    Índice invertido ingrediente -> recetas sobre una matriz dispersa receta x ingrediente.
+    Una despensa se convierte en un vector sobre el vocabulario y la cobertura de
+    todas las recetas sale de un único producto matriz-vector.
+    """
+
+    def __init__(self, recipes, ingredient_matrix, vocabulary, recipe_ingredients):
+        self.recipes = recipes
+        self.ingredient_matrix = ingredient_matrix
+        self.vocabulary = vocabulary  # nombre en minúsculas -> columna
+        self.recipe_ingredients = recipe_ingredients  # nombres por receta, sin duplicados
+        self.ingredient_counts = np.diff(ingredient_matrix.indptr).astype(np.int32)
+        self.ratings = np.fromiter((recipe.get('avg_rating') or 0 for recipe in recipes), dtype=np.float32, count=len(recipes))
+        self.recipe_positions = {recipe.get('id'): row for row, recipe in enumerate(recipes)}
+        self._inverted = None
+        self._bitsets = None
+        self._last_pantry = None
+        self._name_index = None  # trigramas del vocabulario, para la coincidencia parcial
+
+    @classmethod
+    def from_recipes(cls, recipes_data):
+        """Construye el índice a partir de diccionarios de recetas"""
+        from scipy.sparse import csr_matrix  # se importa al construir, no al iniciar la app
+
+        vocabulary = {}
+        recipe_ingredients = []
+        indptr = [0]
+        indices = []
+
+        for recipe in recipes_data:
+            names = list(dict.fromkeys(ing.lower() for ing in recipe.get('ingredients', [])))
+            recipe_ingredients.append(names)
+            indices.extend(vocabulary.setdefault(name, len(vocabulary)) for name in names)
+            indptr.append(len(indices))
+
+        matrix = csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(recipes_data), len(vocabulary))
+        )
+        matrix.sort_indices()
+        return cls(recipes_data, matrix, vocabulary, recipe_ingredients)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def positions(self, recipe_ids):
+        """Convierte ids de receta en filas del índice (-1 si no existe)"""
+        return np.fromiter((self.recipe_positions.get(rid, -1) for rid in recipe_ids), dtype=np.int64, count=len(recipe_ids))
+
+    def rows_for(self, recipes):
+        """Filas de las recetas dadas, o None si alguna no es la misma receta indexada"""
+        rows = self.positions([recipe.get('id') for recipe in recipes])
+        if (rows < 0).any():
+            return None
+        if any(self.recipes[row] is not recipe for row, recipe in zip(rows.tolist(), recipes)):
+            return None
+        return rows
+
+    def pantry_vector(self, available_ingredients, partial=False):
+        """
+        Vector 0/1 sobre el vocabulario con los ingredientes disponibles.
+        Con partial=True un ingrediente cuenta si uno de los nombres contiene al otro;
+        se resuelve con el índice de trigramas y las subcadenas de lo disponible, sin
+        recorrer todo el vocabulario.
+        """
+        available = frozenset(ing.lower().strip() for ing in available_ingredients if ing and ing.strip())
+
+        # Las páginas repiten la misma despensa para varias recetas: reutilizar el último vector
+        cache_key = (available, partial)
+        last_pantry = self._last_pantry
+        if last_pantry is not None and last_pantry[0] == cache_key:
+            return last_pantry[1]
+
+        pantry = np.zeros(len(self.vocabulary), dtype=np.float32)
+
+        if partial:
+            name_index, max_name_length = self._get_name_index()
+            for item in available:
+                # Nombres que contienen lo disponible ('arroz' -> 'arroz integral')
+                pantry[name_index.search(item)] = 1.0
+                # Nombres contenidos en lo disponible ('aceite de oliva' -> 'aceite')
+                for start in range(len(item)):
+                    for end in range(start + 1, min(len(item), start + max_name_length) + 1):
+                        column = self.vocabulary.get(item[start:end])
+                        if column is not None:
+                            pantry[column] = 1.0
+        else:
+            for item in available:
+                column = self.vocabulary.get(item)
+                if column is not None:
+                    pantry[column] = 1.0
+
+        pantry.setflags(write=False)
+        self._last_pantry = (cache_key, pantry)
+        return pantry
+
+    def _get_name_index(self):
+        """(TrigramIndex columna -> nombre, longitud del nombre más largo), construido en el primer uso"""
+        if self._name_index is None:
+            self._name_index = (TrigramIndex.from_items((column, name) for name, column in self.vocabulary.items()),
+                                max(map(len, self.vocabulary), default=0))
+        return self._name_index
+
+    def missing_for(self, row, pantry):
+        """Ingredientes de una receta (en su orden) ausentes del vector de despensa"""
+        vocabulary = self.vocabulary
+        return [name for name in self.recipe_ingredients[row] if not pantry[vocabulary[name]]]
+
+    def match_pantry(self, available_ingredients, partial=False):
+        """Coincidencias, cobertura y faltantes de todas las recetas para una despensa"""
+        pantry = self.pantry_vector(available_ingredients, partial)
+        matched_counts = (self.ingredient_matrix @ pantry).astype(np.int32)
+        return PantryMatch(self, pantry, matched_counts)
+
+    def recipes_with(self, ingredient_name):
+        """Filas de las recetas que usan un ingrediente (lista invertida)"""
+        column = self.vocabulary.get(ingredient_name.lower().strip())
+        if column is None:
+            return np.zeros(0, dtype=np.int32)
+
+        if self._inverted is None:
+            self._inverted = self.ingredient_matrix.tocsc()
+        start, end = self._inverted.indptr[column], self._inverted.indptr[column + 1]
+        return self._inverted.indices[start:end]
+
+    def _recipe_bitsets(self):
+        """Bitsets empaquetados (uint64) con los ingredientes de cada receta; se calculan una vez"""
+        if self._bitsets is None:
+            n_words = max(1, (len(self.vocabulary) + 63) // 64)
+            bitsets = np.zeros((len(self.recipes), n_words), dtype=np.uint64)
+            rows = np.repeat(np.arange(len(self.recipes)), self.ingredient_counts)
+            columns = self.ingredient_matrix.indices.astype(np.uint64)
+            np.bitwise_or.at(bitsets, (rows, (columns // 64).astype(np.int64)), np.left_shift(np.uint64(1), columns % 64))
+            self._bitsets = bitsets
+        return self._bitsets
+
+    def _pantry_bitset(self, pantry):
+        """Empaqueta un vector de despensa en el mismo formato que los bitsets de receta"""
+        bitsets = self._recipe_bitsets()
+        words = np.zeros(bitsets.shape[1], dtype=np.uint64)
+        columns = np.flatnonzero(pantry).astype(np.uint64)
+        np.bitwise_or.at(words, (columns // 64).astype(np.int64), np.left_shift(np.uint64(1), columns % 64))
+        return words
+
+    def missing_counts(self, pantry):
+        """Número de ingredientes que le faltan a cada receta (AND NOT + popcount)"""
+        bitsets = self._recipe_bitsets()
+        missing_bits = bitsets & ~self._pantry_bitset(pantry)
+        return np.bitwise_count(missing_bits).sum(axis=1, dtype=np.int32)
+
+    def cookable(self, pantry, max_missing=0):
+        """
+        Recetas a las que les faltan como mucho max_missing ingredientes.
+        Devuelve (filas, faltantes) ordenadas por faltantes y luego por rating descendente.
+        """
+        missing_counts = self.missing_counts(pantry)
+        rows = np.flatnonzero((missing_counts <= max_missing) & (self.ingredient_counts > 0))
+
+        # lexsort es estable y usa la última clave como principal
+        order = np.lexsort((-self.ratings[rows], missing_counts[rows]))
+        rows = rows[order]
+        return rows, missing_counts[rows]
@@ -0,0 +1,210 @@
+"""
+Resolución de ingredientes: texto libre -> ids canónicos de Ingredient.
+Las cantidades, unidades y puntuación se quitan con expresiones regulares
+precompiladas; las raíces salen de un stemmer en español memoizado y de la tabla
+de sinónimos. El resultado de cada frase normalizada queda en una cache LRU, así
+que el trabajo de NLP se hace una vez por frase. NLPProcessor, el sistema experto y
+las rutas comparten estas funciones.
+"""
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+# Stop words en español
+SPANISH_STOPWORDS = frozenset([
+    'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'es', 'se', 'no', 'te', 'lo', 'le',
+    'da', 'su', 'por', 'son', 'con', 'no', 'me', 'uno', 'todo', 'también', 'muy',
+    'una', 'del', 'al', 'para', 'como', 'pero', 'sus', 'las', 'si', 'ya', 'porque',
+    'cuando', 'sin', 'sobre', 'este', 'ser', 'tiene', 'le', 'ha', 'estos', 'está',
+    'entre', 'durante', 'tres', 'dos', 'cuatro', 'cinco', 'donde', 'cual', 'quien'
+])
+
+# Diccionario de sinónimos de ingredientes
+INGREDIENT_SYNONYMS = {
+    'jitomate': 'tomate',
+    'elote': 'maíz',
+    'chícharo': 'guisante',
+    'frijol': 'alubia',
+    'ejote': 'judía verde',
+    'betabel': 'remolacha',
+    'apio': 'celery',
+    'chile': 'pimiento',
+    'calabacita': 'calabacín',
+    'papa': 'patata',
+    'camote': 'boniato',
+    'col': 'repollo',
+    'cilantro': 'culantro',
+    'puerco': 'cerdo',
+    'res': 'carne de res',
+    'pollo': 'carne de pollo'
+}
+
+# Unidades de medida comunes
+MEASUREMENT_UNITS = frozenset({
+    'kg', 'kilogramo', 'kilogramos', 'kilo', 'kilos',
+    'g', 'gramo', 'gramos', 'gr',
+    'l', 'litro', 'litros',
+    'ml', 'mililitro', 'mililitros',
+    'taza', 'tazas', 'cup', 'cups',
+    'cucharada', 'cucharadas', 'cda', 'tbsp',
+    'cucharadita', 'cucharaditas', 'cdita', 'tsp',
+    'pizca', 'pizcas',
+    'rebanada', 'rebanadas',
+    'pieza', 'piezas', 'pza',
+    'diente', 'dientes',
+    'rama', 'ramas',
+    'hoja', 'hojas'
+})
+
+_QUANTITY_PATTERN = re.compile(r'\d+(?:[.,/]\d+)*|[¼½¾⅓⅔⅛]')
+_PUNCTUATION_PATTERN = re.compile(r'[^\w\s]|_')
+_UNIT_PATTERN = re.compile(r'\b(?:%s)\b' % '|'.join(sorted(MEASUREMENT_UNITS, key=len, reverse=True)))
+_PHRASE_SEPARATOR_PATTERN = re.compile(r'[,;\n]+')
+
+
+def normalize_phrase(text):
+    """Minúsculas, sin cantidades, puntuación ni unidades y con espacios simples"""
+    text = _QUANTITY_PATTERN.sub(' ', text.lower())
+    text = _PUNCTUATION_PATTERN.sub(' ', text)
+    return ' '.join(_UNIT_PATTERN.sub(' ', text).split())
+
+
+@lru_cache(maxsize=None)
+def _get_stemmer():
+    try:
+        from nltk.stem import SnowballStemmer  # se importa al primer uso, no al iniciar la app
+        return SnowballStemmer('spanish')
+    except ImportError:
+        return None
+
+
+@lru_cache(maxsize=65536)
+def stem(token):
+    """Raíz en español del token (memoizada); sin NLTK se devuelve el token"""
+    stemmer = _get_stemmer()
+    return stemmer.stem(token) if stemmer else token
+
+
+def _content_tokens(tokens):
+    return [token for token in tokens
+            if len(token) > 2 and token not in SPANISH_STOPWORDS and token not in MEASUREMENT_UNITS
+            and not _QUANTITY_PATTERN.fullmatch(token)]
+
+
+@lru_cache(maxsize=None)
+def _synonym_tables():
+    """(raíz -> raíz) para sinónimos de una palabra y (raíces -> raíces) para los de varias"""
+    token_synonyms, phrase_synonyms = {}, {}
+    for word, synonym in INGREDIENT_SYNONYMS.items():
+        synonym_stems = tuple(stem(token) for token in _content_tokens(synonym.split()))
+        if len(synonym_stems) == 1:
+            token_synonyms[stem(word)] = synonym_stems[0]
+        else:
+            # 'carne de res' es 'res': la frase larga se reduce a la palabra
+            phrase_synonyms[synonym_stems] = (stem(word),)
+    return token_synonyms, phrase_synonyms
+
+
+def _stems(tokens):
+    token_synonyms = _synonym_tables()[0]
+    return tuple(token_synonyms.get(token_stem, token_stem) for token_stem in map(stem, _content_tokens(tokens)))
+
+
+def _canonical(stems):
+    return _synonym_tables()[1].get(stems, stems)
+
+
+def ingredient_key(tokens):
+    """Raíces canónicas de un ingrediente ya tokenizado (sin cantidades, unidades ni stop words, con sinónimos)"""
+    return _canonical(_stems(tokens))
+
+
+class IngredientResolver:
+    """
+    Vocabulario de ingredientes (id, nombre) indexado por sus raíces canónicas.
+    Una frase resuelve a los ingredientes con su misma clave o, si no hay ninguno,
+    a los que contienen todas sus raíces ('frijol' -> frijol negro, frijol pinto).
+    """
+
+    def __init__(self, ingredients, cache_size=4096):
+        self.names = {}                   # id -> nombre en la BD
+        self.keys = defaultdict(list)     # raíces canónicas -> ids
+        self.postings = defaultdict(set)  # raíz -> ids
+        self._stem_counts = {}
+        self.max_phrase_length = 0
+
+        for ingredient_id, name in ingredients:
+            stems = _stems(normalize_phrase(name).split())
+            key = _canonical(stems)
+            if not key:
+                continue
+            # Las raíces originales también cuentan: 'carne' encuentra 'carne de res'
+            all_stems = set(stems) | set(key)
+            self.names[ingredient_id] = name
+            self.keys[key].append(ingredient_id)
+            for ingredient_stem in all_stems:
+                self.postings[ingredient_stem].add(ingredient_id)
+            self._stem_counts[ingredient_id] = len(all_stems)
+            self.max_phrase_length = max(self.max_phrase_length, len(stems))
+
+        self._resolve_normalized = lru_cache(maxsize=cache_size)(self._match)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _match(self, phrase):
+        """ids de una frase ya normalizada (el resultado queda en la cache LRU)"""
+        key = ingredient_key(phrase.split())
+        if not key:
+            return ()
+        exact = self.keys.get(key)
+        if exact:
+            return tuple(exact)
+        return self._containing(key)
+
+    def _containing(self, key):
+        """ids de los ingredientes con todas las raíces de la clave, los más cortos primero"""
+        candidates = set.intersection(*(self.postings.get(key_stem, set()) for key_stem in key))
+        return tuple(sorted(candidates, key=lambda ingredient_id: (self._stem_counts[ingredient_id], self.names[ingredient_id])))
+
+    def resolve_phrase(self, phrase):
+        """ids de los ingredientes que corresponden a una frase ('2 tazas de arroz')"""
+        return self._resolve_normalized(normalize_phrase(phrase))
+
+    def resolve_phrases(self, text):
+        """[(frase normalizada, ids)] por cada ingrediente de una lista o de un texto separado por comas, punto y coma o saltos de línea"""
+        phrases = _PHRASE_SEPARATOR_PATTERN.split(text) if isinstance(text, str) else text
+        resolved = []
+        for phrase in phrases:
+            normalized = normalize_phrase(str(phrase))
+            if normalized:
+                resolved.append((normalized, self._resolve_normalized(normalized)))
+        return resolved
+
+    def resolve(self, text):
+        """ids canónicos (en orden, sin repetir) de los ingredientes de un texto libre"""
+        return list(dict.fromkeys(ingredient_id for _, ids in self.resolve_phrases(text) for ingredient_id in ids))
+
+    def extract(self, message):
+        """
+        ids de los ingredientes mencionados en un mensaje: en cada posición la frase
+        exacta más larga o, si no hay, los ingredientes que contienen esa palabra ('arroz')
+        """
+        stems = _stems(normalize_phrase(message).split())
+        found = []
+        position = 0
+        while position < len(stems):
+            for length in range(min(self.max_phrase_length, len(stems) - position), 0, -1):
+                ids = self.keys.get(_canonical(stems[position:position + length]))
+                if ids:
+                    found.extend(ids)
+                    position += length
+                    break
+            else:
+                found.extend(self._containing((stems[position],)))
+                position += 1
+        return list(dict.fromkeys(found))
+
+    def cache_info(self):
+        """Aciertos y fallos de la cache de frases"""
+        return self._resolve_normalized.cache_info()
@@ -0,0 +1,169 @@
+from collections.abc import Mapping
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+
+# Artefactos de cada versión (relativos a su directorio)
+ENGINE_DIR = 'recommendation_engine'
+CLUSTERING_FILE = 'clustering_model.pkl'
+CONTENT_FILTER_FILE = 'content_filter_model.pkl'
+
+
+def read_json(path):
+    """Lee un JSON; None si no existe o está incompleto"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    """Escritura atómica: archivo temporal + os.replace"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """
+    Registro de modelos versionado. Cada entrenamiento escribe sus artefactos en un
+    directorio de preparación; publish calcula los checksums, escribe el manifiesto,
+    renombra el directorio a versions/<versión> y cambia el puntero CURRENT con un
+    os.replace. Una versión publicada no se modifica nunca.
+    """
+
+    def __init__(self, root='ml_models/trained_models/registry'):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+
+    def new_version(self):
+        """(versión, directorio de preparación) para un entrenamiento nuevo"""
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        staging_dir = os.path.join(self.versions_dir, f".staging-{version}")
+        os.makedirs(staging_dir)
+        return version, staging_dir
+
+    def publish(self, version, staging_dir, feature_schema=None, metadata=None, make_current=True):
+        """Sella la versión (manifiesto con checksums) y opcionalmente la hace la actual"""
+        files = {}
+        for directory, _, names in os.walk(staging_dir):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, staging_dir).replace(os.sep, '/')
+                files[relative] = {'sha256': file_checksum(path), 'size': os.path.getsize(path)}
+
+        manifest = {
+            'version': version,
+            'created_at': time.time(),
+            'files': files,
+            'feature_schema': feature_schema or {},
+            'metadata': metadata or {}
+        }
+        write_json(os.path.join(staging_dir, MANIFEST_FILE), manifest)
+        os.replace(staging_dir, self.version_dir(version))
+
+        if make_current:
+            self.set_current(version)
+        print(f"✅ Versión de modelos {version} publicada ({len(files)} artefactos)")
+        return manifest
+
+    def set_current(self, version):
+        """Apunta CURRENT a una versión publicada (cambio atómico)"""
+        if self.manifest(version) is None:
+            raise ValueError(f"Versión de modelos desconocida: {version}")
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+
+    def current_version(self):
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, os.path.basename(version))
+
+    def manifest(self, version):
+        return read_json(os.path.join(self.version_dir(version), MANIFEST_FILE))
+
+    def verify(self, version):
+        """Artefactos cuyo checksum no coincide con el manifiesto (lista vacía si todo está bien)"""
+        manifest = self.manifest(version)
+        if manifest is None:
+            return [MANIFEST_FILE]
+        mismatched = []
+        for relative, info in manifest['files'].items():
+            path = os.path.join(self.version_dir(version), relative)
+            if not os.path.exists(path) or file_checksum(path) != info['sha256']:
+                mismatched.append(relative)
+        return mismatched
+
+    def versions(self):
+        """Versiones publicadas, de la más antigua a la más nueva"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        created = {}
+        for name in os.listdir(self.versions_dir):
+            manifest = self.manifest(name) if not name.startswith('.') else None
+            if manifest is not None:
+                created[name] = manifest.get('created_at', 0)
+        return sorted(created, key=lambda name: (created[name], name))
+
+    def prune(self, keep=5):
+        """Borra versiones antiguas conservando las últimas keep y la actual"""
+        current = self.current_version()
+        removed = []
+        for version in self.versions()[:-keep] if keep else self.versions():
+            if version != current:
+                shutil.rmtree(self.version_dir(version), ignore_errors=True)
+                removed.append(version)
+        return removed
+
+
+class ModelBundle(Mapping):
+    """
+    Conjunto inmutable de modelos de una versión ('recommendation_engine', 'clustering',
+    'content_filter'). Se reemplaza completo al cambiar de versión; una petición
+    conserva el mismo conjunto de principio a fin. La inmutabilidad es superficial:
+    qué modelos forman el conjunto no cambia, pero las actualizaciones en línea
+    reescriben en el lugar filas del filtrado colaborativo del motor (bajo su propio
+    lock), así que todas las peticiones que comparten la versión ven los vectores nuevos.
+    """
+
+    def __init__(self, models, version=None, manifest=None):
+        self._models = dict(models)
+        self.version = version
+        self.manifest = manifest or {}
+
+    def __getitem__(self, name):
+        return self._models[name]
+
+    def __iter__(self):
+        return iter(self._models)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __repr__(self):
+        return f"ModelBundle(version={self.version!r}, models={sorted(self._models)})"
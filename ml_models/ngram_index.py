@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+
+class TrigramIndex:
+    """
+    Índice de n-gramas (trigramas por defecto) para búsquedas por subcadena.
+    Equivalente en memoria a un índice GIN de pg_trgm: los trigramas de la consulta
+    acotan los candidatos y solo esos se verifican con la subcadena completa.
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.postings = defaultdict(set)  # n-grama -> claves
+        self.texts = {}                   # clave -> texto en minúsculas
+
+    @classmethod
+    def from_items(cls, items, n=3):
+        """Construye el índice a partir de pares (clave, texto)"""
+        index = cls(n)
+        for key, text in items:
+            index.add(key, text)
+        return index
+
+    def __len__(self):
+        return len(self.texts)
+
+    def _grams(self, text):
+        return {text[i:i + self.n] for i in range(len(text) - self.n + 1)}
+
+    def add(self, key, text):
+        """Agrega o reemplaza el texto de una clave"""
+        if key in self.texts:
+            self.remove(key)
+        text = text.lower()
+        self.texts[key] = text
+        for gram in self._grams(text):
+            self.postings[gram].add(key)
+
+    def remove(self, key):
+        """Elimina una clave del índice"""
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        for gram in self._grams(text):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def search(self, query):
+        """Claves cuyo texto contiene la consulta (sin distinguir mayúsculas)"""
+        query = query.lower().strip()
+        if not query:
+            return []
+
+        if len(query) < self.n:
+            # Consulta más corta que un n-grama: no hay nada que intersecar
+            return [key for key, text in self.texts.items() if query in text]
+
+        # Intersecar listas de menor a mayor para acotar rápido
+        posting_lists = sorted((self.postings.get(gram, set()) for gram in self._grams(query)), key=len)
+        candidates = set(posting_lists[0])
+        for keys in posting_lists[1:]:
+            candidates &= keys
+            if not candidates:
+                return []
+
+        return [key for key in candidates if query in self.texts[key]]
@@ -1,86 +1,172 @@
-import nltk
+import os
 import re
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import SnowballStemmer
 import string
 
 try:
     import nltk
     from nltk.tokenize import word_tokenize
-    from nltk.stem import SnowballStemmer
     NLTK_AVAILABLE = True
-    
-    # Intentar descargar datos si no están disponibles
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        nltk.download('punkt', quiet=True)
-        nltk.download('punkt_tab', quiet=True)
-        
-    try:
-        nltk.data.find('corpora/stopwords')
-    except LookupError:
-        nltk.download('stopwords', quiet=True)
-        
 except ImportError:
     NLTK_AVAILABLE = False
     print("⚠️ NLTK no disponible - usando procesamiento básico")
 
+try:
+    from ml_models.ingredient_resolver import (SPANISH_STOPWORDS, INGREDIENT_SYNONYMS, MEASUREMENT_UNITS,
+                                               ingredient_key)
+    from ml_models.fuzzy_index import FuzzyIndex
+    from ml_models.ngram_index import TrigramIndex
+except ImportError:  # ejecución directa desde ml_models/
+    from ingredient_resolver import SPANISH_STOPWORDS, INGREDIENT_SYNONYMS, MEASUREMENT_UNITS, ingredient_key
+    from fuzzy_index import FuzzyIndex
+    from ngram_index import TrigramIndex
+
+# Datos de NLTK que usa word_tokenize (punkt_tab en NLTK >= 3.8.2, punkt en versiones anteriores)
+NLTK_RESOURCES = {
+    'punkt_tab': 'tokenizers/punkt_tab/spanish/',
+    'punkt': 'tokenizers/punkt/spanish.pickle',
+}
+NLTK_INSTALL_HINT = "python -m nltk.downloader -d nltk_data punkt_tab punkt"
+
+_nltk_resources = None  # resultado del último preflight
+
+
+def preflight_nltk_resources(data_path=None):
+    """
+    Comprueba qué datos de NLTK están instalados, sin descargar nada (los nodos de
+    producción no tienen red). Devuelve {recurso: instalado}. Los que falten se
+    instalan aparte con NLTK_INSTALL_HINT desde una máquina con red. Sin data_path se
+    usa la variable NLTK_DATA (create_app la fija con NLTK_DATA_PATH), aunque NLTK ya
+    se haya importado antes de fijarla.
+    """
+    global _nltk_resources
+    if not NLTK_AVAILABLE:
+        _nltk_resources = {name: False for name in NLTK_RESOURCES}
+        return dict(_nltk_resources)
+    
+    paths = [data_path] if data_path else os.environ.get('NLTK_DATA', '').split(os.pathsep)
+    for path in reversed([os.path.abspath(path) for path in paths if path]):
+        if path not in nltk.data.path:
+            nltk.data.path.insert(0, path)
+    
+    status = {}
+    for name, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+            status[name] = True
+        except LookupError:
+            status[name] = False
+    _nltk_resources = status
+    return dict(status)
+
+
+def punkt_available():
+    """Si word_tokenize puede usarse (hace el preflight la primera vez)"""
+    if _nltk_resources is None:
+        preflight_nltk_resources()
+        if NLTK_AVAILABLE and not any(_nltk_resources.values()):
+            print(f"⚠️ Datos punkt de NLTK no instalados, se usa la tokenización básica. Instalar con: {NLTK_INSTALL_HINT}")
+    return any(_nltk_resources.values())
+
+
+# Tokenizador rápido. En texto sin puntuación ASCII (como queda el texto de ingredientes
+# tras limpiarlo) punkt no divide oraciones y de las reglas Treebank de word_tokenize solo
+# aplican estas: separar comillas tipográficas y guiones U+2012-U+2015, y dividir las
+# contracciones inglesas sin apóstrofo. Se aplican igual que en NLTK, así que el resultado
+# es el mismo sin cargar punkt.
+_ASCII_PUNCTUATION_PATTERN = re.compile(f"[{re.escape(string.punctuation)}]")
+_SEPARATOR_PATTERN = re.compile("([«“‘„»”’\u2012-\u2015])")
+_CONTRACTIONS_PATTERN = re.compile(
+    r"(?i)\b(can)(not)\b|\b(gim)(me)\b|\b(gon)(na)\b|\b(got)(ta)\b|\b(lem)(me)\b|\b(wan)(na)(?=\s)"
+)
+
+
+def _split_contraction(match):
+    return " " + " ".join(group for group in match.groups() if group) + " "
+
+
+def tokenize_ingredient_text(text):
+    """Tokens de un texto sin puntuación ASCII, idénticos a los de word_tokenize"""
+    text = " " + _SEPARATOR_PATTERN.sub(r" \1 ", text) + " "
+    if _CONTRACTIONS_PATTERN.search(text):
+        text = _CONTRACTIONS_PATTERN.sub(_split_contraction, text)
+    return text.split()
+
+
+class IngredientMatchIndex:
+    """
+    Índices sobre una lista de ingredientes para enhance_ingredient_matching: nombres
+    exactos, trigramas para subcadenas y FuzzyIndex (nombres y sinónimos) para errores
+    de tipeo hasta max_distance. Una consulta solo visita los candidatos de cada índice.
+    """
+
+    def __init__(self, database_ingredients, max_distance=2):
+        self.source = database_ingredients
+        self.ingredients = list(database_ingredients)
+        self.names = [ingredient.name.lower() for ingredient in self.ingredients]
+        self.exact = {}  # nombre -> posiciones
+        for position, name in enumerate(self.names):
+            self.exact.setdefault(name, []).append(position)
+        self.max_name_length = max(map(len, self.names), default=0)
+        self.substrings = TrigramIndex.from_items(enumerate(self.names))
+
+        # Sinónimos como nombres alternativos ('jitomate' -> tomate, 'res' -> carne de res)
+        aliases = []
+        for word, synonym in INGREDIENT_SYNONYMS.items():
+            aliases.extend((position, synonym) for position in self.exact.get(word, ()))
+            aliases.extend((position, word) for position in self.exact.get(synonym, ()))
+        self.aliases = {}
+        for position, alias in aliases:
+            self.aliases.setdefault(alias, []).append(position)
+        self.fuzzy = FuzzyIndex.from_items(list(enumerate(self.names)) + aliases, max_distance=max_distance)
+
+    def match(self, user_ingredient, limit=5, max_distance=None):
+        """[(ingrediente, similitud)] con las mismas puntuaciones que el recorrido completo"""
+        user_ingredient = user_ingredient.lower().strip()
+        if not user_ingredient:
+            return []
+        scores = {}  # posición -> similitud; exacta, luego parcial, luego Levenshtein
+        
+        # Coincidencia exacta (nombre o sinónimo)
+        for position in self.exact.get(user_ingredient, []) + self.aliases.get(user_ingredient, []):
+            scores[position] = 1.0
+        
+        # Coincidencia parcial: el nombre contiene lo escrito o lo escrito contiene el nombre
+        partial = set(self.substrings.search(user_ingredient))
+        length = len(user_ingredient)
+        for start in range(length):
+            for end in range(start + 1, min(length, start + self.max_name_length) + 1):
+                partial.update(self.exact.get(user_ingredient[start:end], ()))
+        for position in partial:
+            if position not in scores:
+                name = self.names[position]
+                similarity = max(len(user_ingredient), len(name)) / min(len(user_ingredient), len(name))
+                scores[position] = similarity * 0.8
+        
+        # Errores de tipeo acotados por la distancia de edición
+        for position, text, distance in self.fuzzy.lookup(user_ingredient, max_distance):
+            similarity = 1.0 - distance / max(len(user_ingredient), len(text))
+            if similarity > 0.6 and position not in scores:
+                scores[position] = similarity * 0.6
+        
+        # Ordenar por similitud descendente (empates en el orden de la lista)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.ingredients[position], similarity) for position, similarity in ranked[:limit]]
+
+
 class NLPProcessor:
     def __init__(self):
-        # Configurar NLTK para español
-        self.stemmer = SnowballStemmer('spanish')
-        
-        # Stop words en español
-        self.spanish_stopwords = set([
-            'el', 'la', 'de', 'que', 'y', 'a', 'en', 'un', 'es', 'se', 'no', 'te', 'lo', 'le',
-            'da', 'su', 'por', 'son', 'con', 'no', 'me', 'uno', 'todo', 'también', 'muy',
-            'una', 'del', 'al', 'para', 'como', 'pero', 'sus', 'las', 'si', 'ya', 'porque',
-            'cuando', 'sin', 'sobre', 'este', 'ser', 'tiene', 'le', 'ha', 'estos', 'está',
-            'entre', 'durante', 'tres', 'dos', 'cuatro', 'cinco', 'donde', 'cual', 'quien'
-        ])
-        
-        # Diccionario de sinónimos de ingredientes
-        self.ingredient_synonyms = {
-            'jitomate': 'tomate',
-            'elote': 'maíz',
-            'chícharo': 'guisante',
-            'frijol': 'alubia',
-            'ejote': 'judía verde',
-            'betabel': 'remolacha',
-            'apio': 'celery',
-            'chile': 'pimiento',
-            'calabacita': 'calabacín',
-            'papa': 'patata',
-            'camote': 'boniato',
-            'col': 'repollo',
-            'cilantro': 'culantro',
-            'puerco': 'cerdo',
-            'res': 'carne de res',
-            'pollo': 'carne de pollo'
-        }
-        
-        # Unidades de medida comunes
-        self.measurement_units = {
-            'kg', 'kilogramo', 'kilogramos', 'kilo', 'kilos',
-            'g', 'gramo', 'gramos', 'gr',
-            'l', 'litro', 'litros',
-            'ml', 'mililitro', 'mililitros',
-            'taza', 'tazas', 'cup', 'cups',
-            'cucharada', 'cucharadas', 'cda', 'tbsp',
-            'cucharadita', 'cucharaditas', 'cdita', 'tsp',
-            'pizca', 'pizcas',
-            'rebanada', 'rebanadas',
-            'pieza', 'piezas', 'pza',
-            'diente', 'dientes',
-            'rama', 'ramas',
-            'hoja', 'hojas'
-        }
+        # Tablas compartidas con IngredientResolver (que también tiene el stemmer memoizado)
+        self.spanish_stopwords = SPANISH_STOPWORDS
+        self.ingredient_synonyms = INGREDIENT_SYNONYMS
+        self.measurement_units = MEASUREMENT_UNITS
+        self._match_index = None  # IngredientMatchIndex de la última lista de ingredientes
     
     def _tokenize_safe(self, text):
-        """Tokenización segura con fallback si NLTK no está disponible"""
-        if NLTK_AVAILABLE and self.stemmer:
+        """Tokenización: expresión regular sin puntuación ASCII, punkt si está instalado, o básica"""
+        if not _ASCII_PUNCTUATION_PATTERN.search(text):
+            return tokenize_ingredient_text(text)
+        
+        if NLTK_AVAILABLE and punkt_available():
             try:
                 return word_tokenize(text, language='spanish')
             except:
@@ -124,34 +210,8 @@ class NLPProcessor:
         # Tokenizar de forma segura
         tokens = self._tokenize_safe(ingredient_text)
         
-        # Remover números y unidades de medida
-        cleaned_tokens = []
-        for token in tokens:
-            if not self._is_number(token) and token not in self.measurement_units:
-                cleaned_tokens.append(token)
-        
-        # Remover stop words
-        filtered_tokens = [token for token in cleaned_tokens 
-                          if token not in self.spanish_stopwords and len(token) > 2]
-        
-        # Aplicar stemming si está disponible
-        final_ingredients = []
-        for token in filtered_tokens:
-            # Aplicar sinónimos
-            if token in self.ingredient_synonyms:
-                token = self.ingredient_synonyms[token]
-            
-            # Stemming si está disponible
-            if self.stemmer:
-                try:
-                    stemmed_token = self.stemmer.stem(token)
-                    final_ingredients.append(stemmed_token)
-                except:
-                    final_ingredients.append(token)
-            else:
-                final_ingredients.append(token)
-        
-        return final_ingredients
+        # Sin números, unidades ni stop words; sinónimos y raíces como en IngredientResolver
+        return list(ingredient_key(tokens))
     
     def _is_number(self, text):
         """
@@ -238,34 +298,16 @@ class NLPProcessor:
     
     def enhance_ingredient_matching(self, user_ingredient, database_ingredients):
         """
-        Mejora el matching de ingredientes usando similaridad fonética y léxica
+        Mejora el matching de ingredientes usando similaridad léxica. database_ingredients
+        es un IngredientMatchIndex ya construido (la app comparte el del catálogo) o una
+        lista, cuyos índices se reutilizan mientras se pase la misma; los errores de
+        tipeo se buscan hasta distancia de edición 2
         """
-        user_ingredient = user_ingredient.lower().strip()
-        matches = []
-        
-        for db_ingredient in database_ingredients:
-            db_name = db_ingredient.name.lower()
-            
-            # Coincidencia exacta
-            if user_ingredient == db_name:
-                matches.append((db_ingredient, 1.0))
-                continue
-            
-            # Coincidencia parcial
-            if user_ingredient in db_name or db_name in user_ingredient:
-                similarity = max(len(user_ingredient), len(db_name)) / \
-                           min(len(user_ingredient), len(db_name))
-                matches.append((db_ingredient, similarity * 0.8))
-                continue
-            
-            # Similitud de Levenshtein simplificada
-            similarity = self._calculate_string_similarity(user_ingredient, db_name)
-            if similarity > 0.6:
-                matches.append((db_ingredient, similarity * 0.6))
-        
-        # Ordenar por similitud descendente
-        matches.sort(key=lambda x: x[1], reverse=True)
-        return matches[:5]  # Top 5 matches
+        if isinstance(database_ingredients, IngredientMatchIndex):
+            return database_ingredients.match(user_ingredient)
+        if self._match_index is None or self._match_index.source is not database_ingredients:
+            self._match_index = IngredientMatchIndex(database_ingredients)
+        return self._match_index.match(user_ingredient)  # Top 5 matches
     
     def _calculate_string_similarity(self, str1, str2):
         """
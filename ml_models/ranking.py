@@ -0,0 +1,25 @@
+import numpy as np
+
+
+def top_k_indices(scores, k=None):
+    """
+    Índices de los k scores más altos, de mayor a menor.
+    Los empates conservan el orden original (igual que un sort estable), pero solo se
+    ordenan los k seleccionados: O(N) para seleccionar + O(k log k) para ordenar.
+    Con k=None se devuelve el orden completo.
+    """
+    scores = np.asarray(scores, dtype=float)
+    n = len(scores)
+    if k is None or k >= n:
+        return np.argsort(-scores, kind='stable')
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+
+    # Umbral = k-ésimo score más alto; argpartition no garantiza qué empates quedan dentro
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    above = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate((above, tied))
+
+    # lexsort usa la última clave como principal: score descendente y luego posición
+    return selected[np.lexsort((selected, -scores[selected]))]
@@ -2,18 +2,39 @@ import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.preprocessing import StandardScaler
 import pickle
 import os
 
+try:
+    from ml_models.ingredient_index import IngredientIndex
+    from ml_models.dietary_rules import recipe_conflicts, required_mask
+    from ml_models.ranking import top_k_indices
+    from ml_models.substitution_graph import SubstitutionGraph
+    from ml_models.collaborative_filter import CollaborativeFilter
+    from ml_models.array_store import save_arrays, load_arrays
+except ImportError:  # ejecución directa desde ml_models/
+    from ingredient_index import IngredientIndex
+    from dietary_rules import recipe_conflicts, required_mask
+    from ranking import top_k_indices
+    from substitution_graph import SubstitutionGraph
+    from collaborative_filter import CollaborativeFilter
+    from array_store import save_arrays, load_arrays
+
+# Peso del término de filtrado colaborativo en rank_recipes (se suma si hay vector de usuario)
+COLLABORATIVE_WEIGHT = 0.3
+
 class RecommendationEngine:
-    def __init__(self):
+    def __init__(self, model_path='ml_models/trained_models/'):
         self.content_filter = ContentBasedFilter()
         self.rating_predictor = RandomForestRegressor(n_estimators=100, random_state=42)
+        self.collaborative_filter = CollaborativeFilter()
         self.scaler = StandardScaler()
-        self.model_path = 'ml_models/trained_models/'
+        self.model_path = model_path
         self.is_trained = False
+        self.model_version = 0  # aumenta en cada entrenamiento
+        self.ingredient_index = None  # índice del último catálogo recibido
+        self.substitution_graph = SubstitutionGraph()  # reglas genéricas; la app pasa el grafo con la BD en cada llamada
         
         # Cargar modelos entrenados si existen
         self.load_models()
@@ -25,6 +46,7 @@ class RecommendationEngine:
         # Usar datos de ejemplo si no se proporcionan
         if recipes_data is None:
             recipes_data = self._generate_sample_recipes()
+        real_ratings = ratings_data is not None
         if ratings_data is None:
             ratings_data = self._generate_sample_ratings()
         
@@ -38,9 +60,17 @@ class RecommendationEngine:
         # Entrenar filtro basado en contenido
         self.content_filter.train(recipes_data)
         
+        # Filtrado colaborativo solo con ratings reales (los de ejemplo usan ids de usuarios reales).
+        # Se entrena aparte y se reemplaza al final para no mezclar con actualizaciones en línea
+        if real_ratings:
+            collaborative_filter = CollaborativeFilter()
+            if collaborative_filter.train(ratings_data):
+                self.collaborative_filter = collaborative_filter
+        
         # Guardar modelos
         self.save_models()
         self.is_trained = True
+        self.model_version += 1
         print("✅ Modelos entrenados y guardados exitosamente.")
     
     def _generate_sample_recipes(self):
@@ -206,8 +236,9 @@ class RecommendationEngine:
             print("⚠️ Insuficientes datos de rating para entrenar el modelo.")
             return
         
-        # Preparar características para entrenamiento
-        feature_columns = [col for col in ratings_data.columns if col != 'rating']
+        # Preparar características para entrenamiento (mismo esquema que en predicción)
+        feature_columns = [col for col in ratings_data.columns 
+                         if col not in ['recipe_id', 'user_id', 'rating']]
         X = ratings_data[feature_columns].fillna(0)
         y = ratings_data['rating']
         
@@ -221,57 +252,46 @@ class RecommendationEngine:
         score = self.rating_predictor.score(X_scaled, y)
         print(f"✅ Accuracy del modelo de rating: {score:.3f}")
     
-    def rank_recipes(self, recipes, user_profile, available_ingredients):
-        """Rankea recetas usando machine learning"""
+    def rank_recipes(self, recipes, user_profile, available_ingredients, k=None):
+        """Rankea recetas usando machine learning (solo las k mejores si se indica k)"""
         if not recipes:
             return []
         
         if not self.is_trained:
             print("⚠️ Modelos no entrenados. Usando ranking básico.")
-            return self._basic_ranking(recipes, available_ingredients)
-        
-        scored_recipes = []
+            return self._basic_ranking(recipes, available_ingredients, k)
+        
+        # Scores de todas las candidatas en lote (una matriz, una predicción)
+        content_scores = self._calculate_content_scores(recipes, available_ingredients)
+        predicted_ratings = self._predict_user_ratings(user_profile, recipes)
+        coverage_scores = self._calculate_ingredient_coverages(recipes, available_ingredients)
+        
+        # Score combinado (ponderado)
+        combined_scores = (
+            0.4 * content_scores +
+            0.3 * predicted_ratings / 5.0 +  # Normalizar rating a 0-1
+            0.3 * coverage_scores
+        )
         
-        for recipe in recipes:
-            # Calcular score basado en contenido
-            content_score = self._calculate_content_score(recipe, available_ingredients)
-            
-            # Predecir rating del usuario para esta receta
-            predicted_rating = self._predict_user_rating(user_profile, recipe)
-            
-            # Calcular score de cobertura de ingredientes
-            coverage_score = self._calculate_ingredient_coverage(recipe, available_ingredients)
-            
-            # Score combinado (ponderado)
-            combined_score = (
-                0.4 * content_score +
-                0.3 * predicted_rating / 5.0 +  # Normalizar rating a 0-1
-                0.3 * coverage_score
-            )
-            
-            scored_recipes.append((recipe, combined_score))
+        # Término colaborativo: usuarios con factores entrenados o con ratings para el fold-in
+        collaborative_ratings = self._predict_collaborative_ratings(user_profile, recipes)
+        if collaborative_ratings is not None:
+            combined_scores = combined_scores + COLLABORATIVE_WEIGHT * collaborative_ratings / 5.0
         
-        # Ordenar por score descendente
-        scored_recipes.sort(key=lambda x: x[1], reverse=True)
+        # Top-k por score descendente (estable: los empates conservan el orden original)
+        order = top_k_indices(combined_scores, k)
         
-        return [recipe for recipe, score in scored_recipes]
+        return [recipes[idx] for idx in order]
     
-    def _basic_ranking(self, recipes, available_ingredients):
+    def _basic_ranking(self, recipes, available_ingredients, k=None):
         """Ranking básico cuando los modelos ML no están disponibles"""
-        scored_recipes = []
+        coverages = self._calculate_ingredient_coverages(recipes, available_ingredients)
+        ratings = np.array([recipe.get('avg_rating', 3.0) for recipe in recipes], dtype=float)
         
-        for recipe in recipes:
-            # Score simple basado en cobertura de ingredientes y rating
-            coverage = self._calculate_ingredient_coverage(recipe, available_ingredients)
-            rating = recipe.get('avg_rating', 3.0)
-            
-            # Score combinado simple
-            score = 0.6 * coverage + 0.4 * (rating / 5.0)
-            scored_recipes.append((recipe, score))
+        # Score combinado simple basado en cobertura de ingredientes y rating
+        scores = 0.6 * coverages + 0.4 * (ratings / 5.0)
         
-        # Ordenar por score descendente
-        scored_recipes.sort(key=lambda x: x[1], reverse=True)
-        return [recipe for recipe, score in scored_recipes]
+        return [recipes[idx] for idx in top_k_indices(scores, k)]
     
     def _calculate_content_score(self, recipe, available_ingredients):
         """Calcula score basado en similitud de contenido"""
@@ -284,77 +304,173 @@ class RecommendationEngine:
             intersection = recipe_ingredients.intersection(available_set)
             return len(intersection) / len(recipe_ingredients) if recipe_ingredients else 0
     
+    def _calculate_content_scores(self, recipes, available_ingredients):
+        """Calcula el score de contenido de varias recetas como array"""
+        try:
+            recipe_ids = [recipe.get('id', 0) for recipe in recipes]
+            return self.content_filter.calculate_similarities(available_ingredients, recipe_ids)
+        except Exception:
+            return np.array([self._calculate_content_score(recipe, available_ingredients)
+                             for recipe in recipes], dtype=float)
+    
     def _predict_user_rating(self, user_profile, recipe):
         """Predice el rating que un usuario daría a una receta"""
+        return float(self._predict_user_ratings(user_profile, [recipe])[0])
+    
+    def _predict_user_ratings(self, user_profile, recipes):
+        """Predice en lote los ratings que un usuario daría a varias recetas"""
+        predicted_ratings = np.full(len(recipes), 3.0)  # Rating neutral por defecto
+        
         try:
-            # Extraer características
-            recipe_features = self._extract_recipe_features(recipe)
             user_features = self._extract_user_features(user_profile)
-            
-            # Combinar características
-            combined_features = {**recipe_features, **user_features}
-            
-            # Crear DataFrame con las características
-            feature_df = pd.DataFrame([combined_features])
+        except Exception as e:
+            print(f"⚠️ Error prediciendo rating: {e}")
+            return predicted_ratings
+        
+        # Una fila de características por receta
+        rows = []
+        positions = []
+        for position, recipe in enumerate(recipes):
+            try:
+                recipe_features = self._extract_recipe_features(recipe)
+                rows.append({**recipe_features, **user_features})
+                positions.append(position)
+            except Exception as e:
+                print(f"⚠️ Error prediciendo rating: {e}")
+        
+        if not rows:
+            return predicted_ratings
+        
+        if not hasattr(self.rating_predictor, 'feature_importances_'):
+            # Si no hay modelo entrenado, usar rating promedio de la receta
+            predicted_ratings[positions] = [recipes[p].get('avg_rating', 3.0) for p in positions]
+            return predicted_ratings
+        
+        try:
+            # Crear un único DataFrame con todas las recetas
+            feature_df = pd.DataFrame(rows)
             
             # Remover columnas de ID y rating si existen
             feature_columns = [col for col in feature_df.columns 
                              if col not in ['recipe_id', 'user_id', 'rating']]
             X = feature_df[feature_columns].fillna(0)
             
-            # Predecir si el modelo está entrenado
-            if hasattr(self.rating_predictor, 'feature_importances_'):
-                X_scaled = self.scaler.transform(X)
-                predicted_rating = self.rating_predictor.predict(X_scaled)[0]
-                return max(1, min(5, predicted_rating))  # Asegurar que esté entre 1-5
-            else:
-                # Si no hay modelo entrenado, usar rating promedio de la receta
-                return recipe.get('avg_rating', 3.0)
-                
+            # Una sola transformación y una sola predicción del bosque
+            X_scaled = self.scaler.transform(X)
+            predictions = self.rating_predictor.predict(X_scaled)
+            predicted_ratings[positions] = np.clip(predictions, 1, 5)  # Asegurar que esté entre 1-5
         except Exception as e:
             print(f"⚠️ Error prediciendo rating: {e}")
-            return 3.0  # Rating neutral por defecto
-    
-    def _calculate_ingredient_coverage(self, recipe, available_ingredients):
-        """Calcula qué porcentaje de ingredientes de la receta están disponibles"""
-        recipe_ingredients = recipe.get('ingredients', [])
-        if not recipe_ingredients:
-            return 0.0
         
-        available_set = set(ing.lower().strip() for ing in available_ingredients)
-        recipe_ingredients_set = set(ing.lower() for ing in recipe_ingredients)
-        
-        if not recipe_ingredients_set:
-            return 0.0
+        return predicted_ratings
+    
+    def update_rating(self, user_id, recipe_id, user_ratings, recipe_ratings):
+        """
+        Actualización en línea tras un rating nuevo: recalcula el vector de la receta y el
+        del usuario sin reentrenar. Devuelve False si aún no hay modelo colaborativo.
+        """
+        collaborative_filter = self.collaborative_filter
+        if not collaborative_filter.is_trained:
+            return False
         
-        intersection = available_set.intersection(recipe_ingredients_set)
-        return len(intersection) / len(recipe_ingredients_set)
+        # Primero la receta (con los usuarios conocidos) y luego el usuario con la receta ya actualizada
+        collaborative_filter.update_item(recipe_id, recipe_ratings)
+        return collaborative_filter.update_user(user_id, user_ratings)
+    
+    def _predict_collaborative_ratings(self, user_profile, recipes):
+        """Ratings del filtrado colaborativo para las recetas, o None si el usuario no tiene vector"""
+        try:
+            return self.collaborative_filter.predict(
+                [recipe.get('id') for recipe in recipes],
+                user_profile.get('user_id'),
+                user_profile.get('ratings')
+            )
+        except Exception as e:
+            print(f"⚠️ Error en filtrado colaborativo: {e}")
+            return None
     
-    def get_recommendations(self, user_profile, available_ingredients, recipes_data=None, n_recommendations=10):
-        """Obtiene recomendaciones personalizadas para un usuario"""
+    def _calculate_ingredient_coverage(self, recipe, available_ingredients):
+        """Calcula qué porcentaje de ingredientes de la receta están disponibles"""
+        return float(self._calculate_ingredient_coverages([recipe], available_ingredients)[0])
+    
+    def _calculate_ingredient_coverages(self, recipes, available_ingredients):
+        """Calcula la cobertura de ingredientes de varias recetas como array"""
+        match, rows = self._match_pantry(recipes, available_ingredients)
+        return match.coverage[rows]
+    
+    def _match_pantry(self, recipes, available_ingredients):
+        """Cruza la despensa con el índice invertido; devuelve el resultado y las filas de las recetas"""
+        index = self.ingredient_index
+        rows = index.rows_for(recipes) if index is not None else None
+        
+        if rows is None:
+            # Recetas fuera del catálogo indexado: índice temporal solo para ellas
+            index = IngredientIndex.from_recipes(recipes)
+            rows = np.arange(len(recipes))
+        
+        return index.match_pantry(available_ingredients), rows
+    
+    def index_recipes(self, recipes_data):
+        """Indexa el catálogo por ingrediente (se reutiliza mientras sea la misma lista)"""
+        if self.ingredient_index is None or self.ingredient_index.recipes is not recipes_data:
+            self.ingredient_index = IngredientIndex.from_recipes(recipes_data)
+        return self.ingredient_index
+    
+    def get_recommendations(self, user_profile, available_ingredients, recipes_data=None, n_recommendations=10,
+                            substitution_graph=None):
+        """Obtiene recomendaciones personalizadas para un usuario (substitution_graph: grafo de sustituciones a usar)"""
         if recipes_data is None:
             recipes_data = self._generate_sample_recipes()
         
+        self.index_recipes(recipes_data)
+        
         # Filtrar recetas por restricciones dietéticas
         filtered_recipes = self._apply_dietary_filters(recipes_data, user_profile)
         
-        # Rankear recetas
-        ranked_recipes = self.rank_recipes(filtered_recipes, user_profile, available_ingredients)
+        # Rankear recetas (solo se ordenan las n mejores)
+        top_recipes = self.rank_recipes(filtered_recipes, user_profile, available_ingredients, k=n_recommendations)
         
         # Agregar información adicional a cada recomendación
+        match, rows = self._match_pantry(top_recipes, available_ingredients)
+        predicted_ratings = self._predict_user_ratings(user_profile, top_recipes)
+        
         enhanced_recommendations = []
-        for recipe in ranked_recipes[:n_recommendations]:
+        for position, recipe in enumerate(top_recipes):
+            missing_ingredients = match.missing(rows[position])
             recommendation = {
                 'recipe': recipe,
-                'ingredient_coverage': self._calculate_ingredient_coverage(recipe, available_ingredients),
-                'predicted_rating': self._predict_user_rating(user_profile, recipe),
-                'missing_ingredients': self._get_missing_ingredients(recipe, available_ingredients),
-                'substitution_suggestions': self._get_substitution_suggestions(recipe, available_ingredients)
+                'ingredient_coverage': float(match.coverage[rows[position]]),
+                'predicted_rating': float(predicted_ratings[position]),
+                'missing_ingredients': missing_ingredients,
+                'substitution_suggestions': self._get_substitution_suggestions(
+                    recipe, available_ingredients, missing_ingredients, substitution_graph
+                )
             }
             enhanced_recommendations.append(recommendation)
         
         return enhanced_recommendations
     
+    def what_can_i_cook(self, available_ingredients, recipes_data=None, max_missing=2, limit=50):
+        """
+        Recetas cocinables con la despensa: primero las completas y luego las que
+        necesitan 1, 2 ... max_missing ingredientes más, cada grupo por rating
+        """
+        if recipes_data is None:
+            recipes_data = self._generate_sample_recipes()
+        
+        index = self.index_recipes(recipes_data)
+        pantry = index.pantry_vector(available_ingredients)
+        rows, missing_counts = index.cookable(pantry, max_missing)
+        
+        return [
+            {
+                'recipe': index.recipes[row],
+                'missing_count': int(missing_count),
+                'missing_ingredients': index.missing_for(row, pantry)
+            }
+            for row, missing_count in zip(rows[:limit].tolist(), missing_counts[:limit].tolist())
+        ]
+    
     def _apply_dietary_filters(self, recipes, user_profile):
         """Aplica filtros de restricciones dietéticas"""
         dietary_restrictions = user_profile.get('dietary_restrictions', [])
@@ -362,73 +478,35 @@ class RecommendationEngine:
         if not dietary_restrictions:
             return recipes
         
-        filtered_recipes = []
-        for recipe in recipes:
-            is_compatible = True
-            
-            for restriction in dietary_restrictions:
-                if not self._recipe_meets_restriction(recipe, restriction):
-                    is_compatible = False
-                    break
-            
-            if is_compatible:
-                filtered_recipes.append(recipe)
-        
-        return filtered_recipes
+        # Un AND de bits por receta contra la máscara de restricciones
+        required = required_mask(dietary_restrictions)
+        return [recipe for recipe in recipes if not self._recipe_conflicts(recipe) & required]
     
     def _recipe_meets_restriction(self, recipe, restriction):
         """Verifica si una receta cumple con una restricción dietética"""
-        recipe_ingredients = [ing.lower() for ing in recipe.get('ingredients', [])]
-        ingredients_text = ' '.join(recipe_ingredients)
-        
-        if restriction == 'vegetariano':
-            forbidden = ['pollo', 'carne', 'pescado', 'cerdo', 'pavo']
-            return not any(item in ingredients_text for item in forbidden)
-        
-        elif restriction == 'vegano':
-            forbidden = ['pollo', 'carne', 'pescado', 'huevo', 'leche', 'queso', 'mantequilla']
-            return not any(item in ingredients_text for item in forbidden)
-        
-        elif restriction == 'sin gluten':
-            forbidden = ['harina', 'trigo', 'pan', 'pasta']
-            return not any(item in ingredients_text for item in forbidden)
-        
-        elif restriction == 'sin lactosa':
-            forbidden = ['leche', 'queso', 'mantequilla', 'crema', 'yogurt']
-            return not any(item in ingredients_text for item in forbidden)
-        
-        return True
+        return not self._recipe_conflicts(recipe) & required_mask([restriction])
+    
+    def _recipe_conflicts(self, recipe):
+        """Máscara de restricciones precalculada de la receta, o calculada si no la trae"""
+        conflicts = recipe.get('restriction_conflicts')
+        if conflicts is None:
+            conflicts = recipe_conflicts(recipe.get('ingredients', []), recipe.get('nutritional_info'))
+        return conflicts
     
     def _get_missing_ingredients(self, recipe, available_ingredients):
         """Obtiene lista de ingredientes faltantes"""
-        available_set = set(ing.lower().strip() for ing in available_ingredients)
-        recipe_ingredients = set(ing.lower() for ing in recipe.get('ingredients', []))
-        
-        missing = recipe_ingredients - available_set
-        return list(missing)
+        match, rows = self._match_pantry([recipe], available_ingredients)
+        return match.missing(rows[0])
     
-    def _get_substitution_suggestions(self, recipe, available_ingredients):
+    def _get_substitution_suggestions(self, recipe, available_ingredients, missing_ingredients=None, substitution_graph=None):
         """Obtiene sugerencias de sustitución para ingredientes faltantes"""
-        missing_ingredients = self._get_missing_ingredients(recipe, available_ingredients)
-        
-        # Sustituciones básicas
-        substitutions = {
-            'leche': ['leche de almendra', 'leche de soja'],
-            'mantequilla': ['aceite de oliva', 'margarina'],
-            'huevo': ['linaza molida + agua', 'aquafaba'],
-            'queso': ['levadura nutricional', 'queso vegano'],
-            'pollo': ['tofu', 'seitán', 'tempeh'],
-            'carne': ['lentejas', 'frijoles', 'quinoa'],
-            'harina de trigo': ['harina de arroz', 'harina de almendra'],
-            'azúcar': ['stevia', 'miel', 'jarabe de maple']
-        }
-        
-        suggestions = {}
-        for ingredient in missing_ingredients:
-            if ingredient in substitutions:
-                suggestions[ingredient] = substitutions[ingredient]
+        if missing_ingredients is None:
+            missing_ingredients = self._get_missing_ingredients(recipe, available_ingredients)
         
-        return suggestions
+        # Grafo recibido (sustituciones de la receta y reglas genéricas) o el genérico del motor
+        graph = substitution_graph if substitution_graph is not None else self.substitution_graph
+        substitutions = graph.for_ingredients(missing_ingredients, recipe.get('id'))
+        return {ingredient: [sub['substitute'] for sub in subs] for ingredient, subs in substitutions.items()}
     
     def save_models(self):
         """Guarda los modelos entrenados"""
@@ -447,6 +525,10 @@ class RecommendationEngine:
         # Guardar filtro de contenido
         self.content_filter.save_model(f"{self.model_path}content_filter.pkl")
         
+        # Guardar filtrado colaborativo
+        if self.collaborative_filter.is_trained:
+            self.collaborative_filter.save_model(f"{self.model_path}collaborative_filter.pkl")
+        
         print(f"✅ Modelos guardados en: {self.model_path}")
     
     def load_models(self):
@@ -472,6 +554,12 @@ class RecommendationEngine:
                 if self.content_filter.load_model(content_path):
                     print("✅ Content filter cargado")
                     self.is_trained = True
+            
+            # Cargar filtrado colaborativo
+            collaborative_path = f"{self.model_path}collaborative_filter.pkl"
+            if os.path.exists(collaborative_path):
+                if self.collaborative_filter.load_model(collaborative_path):
+                    print("✅ Filtrado colaborativo cargado")
                     
         except Exception as e:
             print(f"⚠️ Error cargando modelos: {e}")
@@ -511,6 +599,7 @@ class ContentBasedFilter:
         self.recipe_tfidf_matrix = None
         self.recipe_texts = {}
         self.recipe_ids = []
+        self.recipe_index = {}  # id de receta -> fila de la matriz TF-IDF
     
     def train(self, recipes_data):
         """Entrena el filtro basado en contenido"""
@@ -530,6 +619,7 @@ class ContentBasedFilter:
         
         # Entrenar TF-IDF
         self.recipe_tfidf_matrix = self.tfidf_vectorizer.fit_transform(recipe_documents)
+        self._build_recipe_index()
         print(f"✅ Filtro de contenido entrenado con {len(recipes_data)} recetas.")
     
     def _create_recipe_text(self, recipe):
@@ -557,39 +647,47 @@ class ContentBasedFilter:
         
         return ' '.join(text_parts).lower()
     
+    def _build_recipe_index(self):
+        """Construye el índice id de receta -> fila de la matriz"""
+        self.recipe_index = {recipe_id: row for row, recipe_id in enumerate(self.recipe_ids)}
+    
     def calculate_similarity(self, available_ingredients, recipe_id):
         """Calcula similitud entre receta e ingredientes disponibles"""
-        if self.recipe_tfidf_matrix is None:
-            return 0.0
-        
         try:
-            # Crear texto de ingredientes disponibles
-            ingredients_text = ' '.join(available_ingredients).lower()
-            
-            # Vectorizar ingredientes disponibles
-            ingredients_vector = self.tfidf_vectorizer.transform([ingredients_text])
-            
-            # Encontrar índice de la receta
-            recipe_idx = self.recipe_ids.index(recipe_id)
-            
-            # Calcular similitud coseno
-            recipe_vector = self.recipe_tfidf_matrix[recipe_idx]
-            similarity = cosine_similarity(ingredients_vector, recipe_vector)[0][0]
-            
-            return similarity
-            
+            return self.calculate_similarities(available_ingredients, [recipe_id])[0]
         except Exception as e:
             return 0.0
     
+    def calculate_similarities(self, available_ingredients, recipe_ids):
+        """Calcula en lote la similitud de varias recetas con los ingredientes disponibles"""
+        similarities = np.zeros(len(recipe_ids))
+        if self.recipe_tfidf_matrix is None:
+            return similarities
+        
+        # Vectorizar los ingredientes disponibles una sola vez
+        ingredients_text = ' '.join(available_ingredients).lower()
+        ingredients_vector = self.tfidf_vectorizer.transform([ingredients_text])
+        
+        # Las filas TF-IDF ya están normalizadas (L2): el coseno es un producto punto,
+        # así que basta un único producto matriz-vector disperso
+        all_similarities = (self.recipe_tfidf_matrix @ ingredients_vector.T).toarray().ravel()
+        
+        # Recetas desconocidas conservan similitud 0
+        rows = np.array([self.recipe_index.get(recipe_id, -1) for recipe_id in recipe_ids], dtype=int)
+        known = rows >= 0
+        similarities[known] = all_similarities[rows[known]]
+        
+        return similarities
+    
     def save_model(self, filepath):
         """Guarda el modelo de filtro de contenido"""
         try:
             os.makedirs(os.path.dirname(filepath), exist_ok=True)
             model_data = {
                 'vectorizer': self.tfidf_vectorizer,
-                'tfidf_matrix': self.recipe_tfidf_matrix,
                 'recipe_texts': self.recipe_texts,
-                'recipe_ids': self.recipe_ids
+                'recipe_ids': self.recipe_ids,
+                'arrays': save_arrays(filepath, {'tfidf_matrix': self.recipe_tfidf_matrix})
             }
             with open(filepath, 'wb') as f:
                 pickle.dump(model_data, f)
@@ -602,11 +700,14 @@ class ContentBasedFilter:
         try:
             with open(filepath, 'rb') as f:
                 model_data = pickle.load(f)
+            if 'arrays' in model_data:
+                model_data.update(load_arrays(filepath, model_data['arrays']))
             
             self.tfidf_vectorizer = model_data['vectorizer']
-            self.recipe_tfidf_matrix = model_data['tfidf_matrix']
+            self.recipe_tfidf_matrix = model_data.get('tfidf_matrix')
             self.recipe_texts = model_data['recipe_texts']
             self.recipe_ids = model_data['recipe_ids']
+            self._build_recipe_index()
             
             return True
         except Exception as e:
@@ -0,0 +1,88 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class ResultCache:
+    """
+    Cache LRU con expiración (TTL) para resultados de recomendaciones.
+    Cada entrada recuerda a qué usuario pertenece para poder invalidarla
+    cuando ese usuario califica recetas. Lleva contadores de aciertos,
+    fallos y expulsiones.
+    """
+
+    def __init__(self, max_entries=512, ttl_seconds=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # clave -> (expira_en, usuario, valor)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Devuelve el valor guardado o None si no existe o expiró"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, _, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, user_id=None):
+        """Guarda un valor, expulsando el menos usado si se supera el tamaño"""
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, user_id, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        """Elimina las entradas calculadas para un usuario"""
+        with self._lock:
+            keys = [key for key, (_, owner, _) in self._entries.items() if owner == user_id]
+            for key in keys:
+                del self._entries[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """Vacía el cache (los contadores se conservan)"""
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self.invalidations += removed
+            return removed
+
+    def stats(self):
+        """Contadores actuales del cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
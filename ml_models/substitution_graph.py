@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+# Reglas genéricas: la primera clave contenida en el nombre del ingrediente gana
+GENERIC_SUBSTITUTIONS = {
+    # Lácteos
+    'leche': [
+        {'substitute': 'leche de almendra', 'ratio': '1:1', 'notes': 'Para personas sin lactosa'},
+        {'substitute': 'leche de coco', 'ratio': '1:1', 'notes': 'Sabor más dulce'},
+        {'substitute': 'leche de soja', 'ratio': '1:1', 'notes': 'Rica en proteína'}
+    ],
+    'mantequilla': [
+        {'substitute': 'aceite de coco', 'ratio': '1:1', 'notes': 'Opción vegana'},
+        {'substitute': 'margarina', 'ratio': '1:1', 'notes': 'Sin lactosa'},
+        {'substitute': 'aceite de oliva', 'ratio': '3:4', 'notes': 'Para saltear y hornear salado'}
+    ],
+    'queso': [
+        {'substitute': 'queso vegano', 'ratio': '1:1', 'notes': 'Opción sin lactosa'},
+        {'substitute': 'levadura nutricional', 'ratio': '1:4', 'notes': 'Sabor similar al queso'}
+    ],
+
+    # Huevos
+    'huevo': [
+        {'substitute': 'linaza molida + agua', 'ratio': '1 tbsp linaza + 3 tbsp agua por huevo', 'notes': 'Opción vegana'},
+        {'substitute': 'aquafaba', 'ratio': '3 tbsp por huevo', 'notes': 'Líquido de garbanzos'}
+    ],
+
+    # Harinas y endulzantes
+    'harina': [
+        {'substitute': 'harina de arroz', 'ratio': '1:1', 'notes': 'Sin gluten'},
+        {'substitute': 'harina de almendra', 'ratio': '1:1', 'notes': 'Baja en carbohidratos'}
+    ],
+    'azúcar': [
+        {'substitute': 'stevia', 'ratio': '1:8', 'notes': 'Mucho más dulce'},
+        {'substitute': 'miel', 'ratio': '3:4', 'notes': 'Opción natural'},
+        {'substitute': 'jarabe de maple', 'ratio': '3:4', 'notes': 'Aporta sabor caramelizado'}
+    ],
+
+    # Carnes
+    'pollo': [
+        {'substitute': 'tofu', 'ratio': '1:1', 'notes': 'Opción vegetariana'},
+        {'substitute': 'setas portobello', 'ratio': '1:1', 'notes': 'Textura similar'},
+        {'substitute': 'seitán', 'ratio': '1:1', 'notes': 'Alto en proteína'},
+        {'substitute': 'tempeh', 'ratio': '1:1', 'notes': 'Proteína fermentada'}
+    ],
+    'carne': [
+        {'substitute': 'lentejas', 'ratio': '1:1', 'notes': 'Rica en proteína'},
+        {'substitute': 'frijoles negros', 'ratio': '1:1', 'notes': 'Opción vegetariana'},
+        {'substitute': 'quinoa', 'ratio': '1:1', 'notes': 'Proteína completa'}
+    ]
+}
+
+
+class SubstitutionGraph:
+    """
+    Grafo de sustituciones en memoria: reglas genéricas por ingrediente más las
+    sustituciones específicas de cada receta (tabla IngredientSubstitution), que
+    tienen prioridad. Se construye una vez y responde sin consultas.
+    """
+
+    def __init__(self, generic_rules=None):
+        self.generic_rules = list((generic_rules or GENERIC_SUBSTITUTIONS).items())
+        self.recipe_overrides = defaultdict(dict)  # id de receta -> ingrediente -> sustitutos
+        self._generic_cache = {}
+
+    @classmethod
+    def from_rows(cls, rows, generic_rules=None):
+        """Construye el grafo con filas (receta, original, sustituto, proporción, notas)"""
+        graph = cls(generic_rules)
+        for recipe_id, original, substitute, ratio, notes in rows:
+            graph.add_override(recipe_id, original, substitute, ratio, notes)
+        return graph
+
+    def add_override(self, recipe_id, original, substitute, ratio=None, notes=None):
+        """Agrega una sustitución específica de una receta"""
+        self.recipe_overrides[recipe_id].setdefault(original.lower().strip(), []).append({
+            'substitute': substitute,
+            'ratio': ratio,
+            'notes': notes
+        })
+
+    def generic_substitutes(self, ingredient_name):
+        """Sustitutos genéricos por coincidencia parcial del nombre (memoizado)"""
+        name = ingredient_name.lower().strip()
+        cached = self._generic_cache.get(name)
+        if cached is None:
+            cached = next((subs for key, subs in self.generic_rules if key in name), [])
+            self._generic_cache[name] = cached
+        return cached
+
+    def substitutes(self, ingredient_name, recipe_id=None):
+        """Sustitutos de un ingrediente: los de la receta si existen, si no los genéricos"""
+        overrides = self.recipe_overrides.get(recipe_id)
+        if overrides:
+            specific = overrides.get(ingredient_name.lower().strip())
+            if specific:
+                return specific
+        return self.generic_substitutes(ingredient_name)
+
+    def for_ingredients(self, ingredient_names, recipe_id=None):
+        """Diccionario ingrediente -> sustitutos, solo para los que tienen alguno"""
+        result = {}
+        for name in ingredient_names:
+            subs = self.substitutes(name, recipe_id)
+            if subs:
+                result[name] = subs
+        return result
@@ -7,6 +7,9 @@ Ejecuta de forma independiente sin dependencias de Flask
 import os
 import sys
 import time
+from types import SimpleNamespace
+
+import numpy as np
 
 # Agregar el directorio actual al path para importar los módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -15,7 +18,20 @@ try:
     from clustering import RecipeClustering
     from content_filter import ContentBasedFilter
     from recommendation_engine import RecommendationEngine
-    from nlp_processor import NLPProcessor
+    from nlp_processor import NLPProcessor, IngredientMatchIndex, tokenize_ingredient_text
+    from columnar_catalog import ColumnarCatalog
+    from dietary_rules import RESTRICTION_KEYWORDS, RESTRICTION_BITS, recipe_conflicts, required_mask
+    from ingredient_index import IngredientIndex
+    from ngram_index import TrigramIndex
+    from ranking import top_k_indices
+    from result_cache import ResultCache
+    from ann_index import ExactIndex, RandomProjectionLSH
+    from substitution_graph import SubstitutionGraph
+    from collaborative_filter import CollaborativeFilter
+    from model_registry import ModelRegistry, ModelBundle, read_json, write_json
+    from training_job import run_job, INPUT_FILE, STATE_FILE
+    from ingredient_resolver import IngredientResolver
+    from fuzzy_index import FuzzyIndex
 except ImportError as e:
     print(f"❌ Error importando módulos: {e}")
     print("Asegúrate de que todos los archivos estén en el directorio ml_models/")
@@ -204,6 +220,59 @@ def create_test_data():
     
     return recipes_data, ratings_data
 
+def create_large_test_data(n_recipes):
+    """Replica las recetas de prueba hasta formar un catálogo de n_recipes"""
+    base_recipes, ratings_data = create_test_data()
+    recipes_data = []
+    
+    for i in range(n_recipes):
+        recipe = dict(base_recipes[i % len(base_recipes)])
+        recipe['id'] = i + 1
+        recipe['name'] = f"{recipe['name']} {i + 1}"
+        recipe['prep_time'] = recipe['prep_time'] + (i % 7)
+        recipe['avg_rating'] = round(3.0 + (i % 20) / 10.0, 1)
+        recipes_data.append(recipe)
+    
+    return recipes_data, ratings_data
+
+def predict_rating_single_row(rec_engine, user_profile, recipe):
+    """Rating predicho con una fila de características por receta (fórmula anterior al lote)"""
+    import pandas as pd
+    
+    features = {**rec_engine._extract_recipe_features(recipe), **rec_engine._extract_user_features(user_profile)}
+    feature_df = pd.DataFrame([features])
+    feature_columns = [col for col in feature_df.columns if col not in ['recipe_id', 'user_id', 'rating']]
+    X = feature_df[feature_columns].fillna(0)
+    if not hasattr(rec_engine.rating_predictor, 'feature_importances_'):
+        return recipe.get('avg_rating', 3.0)
+    return max(1, min(5, rec_engine.rating_predictor.predict(rec_engine.scaler.transform(X))[0]))
+
+def rank_recipes_loop(rec_engine, recipes, user_profile, available_ingredients):
+    """Ranking receta por receta, con las fórmulas de antes del scoring en lote"""
+    from sklearn.metrics.pairwise import cosine_similarity
+    
+    content_filter = rec_engine.content_filter
+    ingredients_vector = content_filter.tfidf_vectorizer.transform([' '.join(available_ingredients).lower()])
+    available_set = set(ing.lower().strip() for ing in available_ingredients)
+    scored_recipes = []
+    
+    for recipe in recipes:
+        recipe_vector = content_filter.recipe_tfidf_matrix[content_filter.recipe_ids.index(recipe['id'])]
+        content_score = cosine_similarity(ingredients_vector, recipe_vector)[0][0]
+        predicted_rating = predict_rating_single_row(rec_engine, user_profile, recipe)
+        recipe_ingredients = set(ing.lower() for ing in recipe.get('ingredients', []))
+        coverage_score = len(available_set & recipe_ingredients) / len(recipe_ingredients) if recipe_ingredients else 0.0
+        
+        combined_score = (
+            0.4 * content_score +
+            0.3 * predicted_rating / 5.0 +
+            0.3 * coverage_score
+        )
+        scored_recipes.append((recipe, combined_score))
+    
+    scored_recipes.sort(key=lambda x: x[1], reverse=True)
+    return [recipe for recipe, score in scored_recipes]
+
 def test_nlp_processor():
     """Prueba el procesador de NLP"""
     print("\n🧠 PROBANDO NLP PROCESSOR")
@@ -377,6 +446,699 @@ def test_recommendation_engine():
     
     print("\n✅ Recommendation Engine funcionando correctamente")
 
+def test_batch_ranking_matches_loop():
+    """Verifica que el ranking en lote devuelve el mismo orden que el bucle"""
+    print("\n📐 PROBANDO RANKING EN LOTE")
+    print("=" * 50)
+    
+    recipes_data, ratings_data = create_large_test_data(60)
+    
+    rec_engine = RecommendationEngine()
+    rec_engine.train_models(recipes_data, ratings_data)
+    
+    user_profile = {'dietary_restrictions': [], 'avg_rating_given': 4.0}
+    ingredients = ['pollo', 'arroz', 'tomate', 'cebolla']
+    
+    batch_ranking = rec_engine.rank_recipes(recipes_data, user_profile, ingredients)
+    loop_ranking = rank_recipes_loop(rec_engine, recipes_data, user_profile, ingredients)
+    
+    assert [r['id'] for r in batch_ranking] == [r['id'] for r in loop_ranking]
+    
+    # Los ratings predichos en lote coinciden con la predicción de una fila por receta
+    batch_ratings = rec_engine._predict_user_ratings(user_profile, recipes_data)
+    single_ratings = [predict_rating_single_row(rec_engine, user_profile, recipe) for recipe in recipes_data]
+    assert np.allclose(batch_ratings, single_ratings)
+    print(f"✅ Mismo ranking para {len(recipes_data)} recetas")
+
+def test_content_similarities_match_per_recipe():
+    """Verifica que la similitud en lote coincide con el coseno receta por receta"""
+    print("\n📏 PROBANDO SIMILITUD DE CONTENIDO EN LOTE")
+    print("=" * 50)
+    
+    from sklearn.metrics.pairwise import cosine_similarity
+    
+    recipes_data, ratings_data = create_large_test_data(60)
+    
+    rec_engine = RecommendationEngine()
+    rec_engine.train_models(recipes_data, ratings_data)
+    content_filter = rec_engine.content_filter
+    
+    ingredients = ['pollo', 'arroz', 'tomate', 'cebolla']
+    recipe_ids = [recipes_data[0]['id'], recipes_data[17]['id'], recipes_data[42]['id'], -1]
+    batch = content_filter.calculate_similarities(ingredients, recipe_ids)
+    
+    # Cálculo anterior: un coseno por receta contra su fila TF-IDF
+    ingredients_vector = content_filter.tfidf_vectorizer.transform([' '.join(ingredients).lower()])
+    for recipe_id, similarity in zip(recipe_ids, batch):
+        if recipe_id not in content_filter.recipe_ids:
+            assert similarity == 0.0
+            continue
+        recipe_vector = content_filter.recipe_tfidf_matrix[content_filter.recipe_ids.index(recipe_id)]
+        expected = cosine_similarity(ingredients_vector, recipe_vector)[0][0]
+        assert np.isclose(similarity, expected)
+        assert np.isclose(content_filter.calculate_similarity(ingredients, recipe_id), expected)
+    
+    print(f"✅ Misma similitud para {len(recipe_ids)} recetas")
+
+def test_top_k_matches_full_sort():
+    """Verifica que la selección top-k coincide con el prefijo del orden completo estable"""
+    print("\n🏅 PROBANDO SELECCIÓN TOP-K")
+    print("=" * 50)
+    
+    # Scores con muchos empates para ejercitar el desempate en el umbral
+    rng = np.random.default_rng(7)
+    scores = np.round(rng.random(5000), 2)
+    full_order = np.argsort(-scores, kind='stable')
+    
+    for k in (0, 1, 10, 137, 4999, 5000, 6000):
+        assert top_k_indices(scores, k).tolist() == full_order[:k].tolist()
+    
+    recipes_data, ratings_data = create_large_test_data(60)
+    rec_engine = RecommendationEngine()
+    user_profile = {'dietary_restrictions': [], 'avg_rating_given': 4.0}
+    ingredients = ['pollo', 'arroz', 'tomate', 'cebolla']
+    
+    # Ranking básico (sin entrenar) y ranking ML deben devolver el prefijo del ranking completo
+    basic_full = rec_engine.rank_recipes(recipes_data, user_profile, ingredients)
+    basic_top = rec_engine.rank_recipes(recipes_data, user_profile, ingredients, k=10)
+    assert [r['id'] for r in basic_top] == [r['id'] for r in basic_full[:10]]
+    
+    rec_engine.train_models(recipes_data, ratings_data)
+    ml_full = rec_engine.rank_recipes(recipes_data, user_profile, ingredients)
+    ml_top = rec_engine.rank_recipes(recipes_data, user_profile, ingredients, k=10)
+    assert [r['id'] for r in ml_top] == [r['id'] for r in ml_full[:10]]
+    print("✅ Top-k igual al prefijo del orden completo")
+
+def test_neighbor_table_matches_on_the_fly():
+    """Verifica que la tabla de vecinos precalculada coincide con la similitud calculada al vuelo"""
+    print("\n🧭 PROBANDO TABLA DE VECINOS")
+    print("=" * 50)
+    
+    from sklearn.metrics.pairwise import cosine_similarity
+    
+    recipes_data, _ = create_large_test_data(80)
+    content_filter = ContentBasedFilter()
+    content_filter.train(recipes_data)
+    
+    assert content_filter.neighbor_ids.dtype == np.int32
+    assert content_filter.neighbor_scores.dtype == np.float32
+    
+    # Referencia: coseno de sklearn combinado 70/30, como se calculaba antes
+    combined = (0.7 * cosine_similarity(content_filter.recipe_content_matrix) +
+                0.3 * cosine_similarity(content_filter.recipe_features_matrix))
+    
+    for row, recipe_id in enumerate(content_filter.recipe_ids):
+        ids, scores = content_filter.neighbors(recipe_id, 5)
+        reference = np.delete(combined[row], row)
+        assert recipe_id not in ids
+        assert np.allclose(scores, np.sort(reference)[::-1][:5], atol=1e-5)
+        assert np.allclose(scores, [combined[row, content_filter.recipe_index[rid]] for rid in ids], atol=1e-5)
+    
+    # Más vecinos que K: se calcula al vuelo con el mismo criterio
+    many = content_filter.similar_recipe_ids(recipes_data[0]['id'], 15)
+    assert many[:5] == content_filter.neighbors(recipes_data[0]['id'], 5)[0]
+    
+    # Catálogo más chico que K: filas rellenadas con -1 que no se devuelven
+    small_filter = ContentBasedFilter()
+    small_filter.train(recipes_data[:3])
+    assert len(small_filter.neighbors(recipes_data[0]['id'], 10)[0]) == 2
+    
+    # La tabla se persiste con el modelo
+    path = "ml_models/trained_models/test_neighbors.pkl"
+    content_filter.save_model(path)
+    loaded_filter = ContentBasedFilter()
+    assert loaded_filter.load_model(path)
+    assert np.array_equal(loaded_filter.neighbor_ids, content_filter.neighbor_ids)
+    print(f"✅ Tabla de vecinos consistente para {len(recipes_data)} recetas")
+
+def create_clustered_vectors(n_vectors, dim=64, n_clusters=None, seed=0):
+    """Vectores sintéticos con norma 1 agrupados alrededor de centros (como recetas parecidas)"""
+    rng = np.random.default_rng(seed)
+    n_clusters = n_clusters or max(1, n_vectors // 100)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, n_clusters, n_vectors)]
+    vectors += 0.5 * rng.standard_normal((n_vectors, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def ann_recall(exact_index, ann_index, queries, k=10):
+    """Recall@k promedio y latencias medias (exacto, ANN) en milisegundos"""
+    recalls, exact_times, ann_times = [], [], []
+    for query in queries:
+        start_time = time.time()
+        exact_rows, _ = exact_index.query(query, k)
+        exact_times.append(time.time() - start_time)
+        
+        start_time = time.time()
+        ann_rows, _ = ann_index.query(query, k)
+        ann_times.append(time.time() - start_time)
+        
+        recalls.append(len(set(exact_rows.tolist()) & set(ann_rows.tolist())) / k)
+    return float(np.mean(recalls)), 1000 * float(np.mean(exact_times)), 1000 * float(np.mean(ann_times))
+
+def test_ann_index_recall():
+    """Verifica el recall del índice LSH frente al índice exacto, incluyendo vectores agregados"""
+    print("\n🛰️ PROBANDO ÍNDICE ANN (LSH)")
+    print("=" * 50)
+    
+    vectors = create_clustered_vectors(5000)
+    exact_index = ExactIndex().build(vectors)
+    lsh_index = RandomProjectionLSH(n_tables=16, n_bits=12).build(vectors[:4000])
+    lsh_index.add(vectors[4000:])
+    assert len(lsh_index) == len(exact_index) == 5000
+    
+    # El propio vector siempre es su vecino más cercano
+    rows, scores = lsh_index.query(vectors[4321], 1)
+    assert rows.tolist() == [4321] and np.isclose(scores[0], 1.0, atol=1e-5)
+    
+    recall, _, _ = ann_recall(exact_index, lsh_index, vectors[::100])
+    assert recall >= 0.9, recall
+    
+    # Con el filtro de contenido forzado a usar ANN, las recomendaciones coinciden con el cálculo exacto
+    recipes_data, _ = create_large_test_data(300)
+    exact_filter = ContentBasedFilter()
+    exact_filter.train(recipes_data)
+    ann_filter = ContentBasedFilter()
+    ann_filter.ann_threshold = 0
+    ann_filter.train(recipes_data)
+    assert ann_filter.content_ann is not None and ann_filter.combined_ann is not None
+    
+    query = ['pollo', 'arroz', 'tomate']
+    exact_ids = exact_filter.recommend_by_ingredients(query, n_recommendations=10)
+    ann_ids = ann_filter.recommend_by_ingredients(query, n_recommendations=10)
+    assert len(set(exact_ids) & set(ann_ids)) >= 0.8 * len(exact_ids)
+    print(f"✅ Recall@10 del LSH: {recall:.3f}")
+
+def test_columnar_rules_match_loop():
+    """Verifica que las máscaras columnares filtran igual que las reglas receta por receta"""
+    print("\n🧮 PROBANDO CATÁLOGO COLUMNAR")
+    print("=" * 50)
+    
+    recipes_data, _ = create_large_test_data(120)
+    catalog = ColumnarCatalog.from_recipes(recipes_data)
+    rows = catalog.positions([r['id'] for r in recipes_data])
+    
+    for restriction in RESTRICTION_KEYWORDS:
+        required = required_mask([restriction])
+        expected = [not recipe_conflicts(r['ingredients'], r.get('nutritional_info')) & required
+                    for r in recipes_data]
+        assert catalog.restriction_mask(rows, [restriction]).tolist() == expected
+    
+    # La máscara precalculada (la que llega desde la BD) tiene prioridad
+    stored = [dict(r, restriction_conflicts=RESTRICTION_BITS['vegano']) for r in recipes_data[:5]]
+    stored_catalog = ColumnarCatalog.from_recipes(stored)
+    assert not stored_catalog.restriction_mask(np.arange(5), ['vegano']).any()
+    assert stored_catalog.restriction_mask(np.arange(5), ['vegetariano']).all()
+    
+    # Sin máscara guardada (NULL en la BD) se usa la calculada
+    unknown = [dict(r, restriction_conflicts=None) for r in recipes_data]
+    unknown_catalog = ColumnarCatalog.from_recipes(unknown)
+    assert (unknown_catalog.restriction_conflicts == catalog.restriction_conflicts).all()
+    
+    expected_time = [r['prep_time'] + r['cook_time'] <= 40 for r in recipes_data]
+    assert catalog.time_mask(rows, 40).tolist() == expected_time
+    
+    expected_difficulty = [r['difficulty'] == 'fácil' for r in recipes_data]
+    assert catalog.difficulty_mask(rows, 'fácil').tolist() == expected_difficulty
+    assert not catalog.difficulty_mask(rows, 'imposible').any()
+    
+    print(f"✅ Máscaras columnares coinciden para {len(recipes_data)} recetas")
+
+def test_ingredient_index_matches_loops():
+    """Verifica cobertura, coincidencias y faltantes del índice invertido contra los bucles originales"""
+    print("\n🗂️ PROBANDO ÍNDICE INVERTIDO DE INGREDIENTES")
+    print("=" * 50)
+    
+    recipes_data, _ = create_large_test_data(120)
+    index = IngredientIndex.from_recipes(recipes_data)
+    available = ['Pollo', 'arroz ', 'tomate', 'aceite', 'queso']
+    available_set = set(ing.lower().strip() for ing in available)
+    
+    exact = index.match_pantry(available)
+    partial = index.match_pantry(available, partial=True)
+    
+    for row, recipe in enumerate(recipes_data):
+        recipe_set = set(ing.lower() for ing in recipe['ingredients'])
+        assert exact.matched_counts[row] == len(recipe_set & available_set)
+        assert abs(exact.coverage[row] - len(recipe_set & available_set) / len(recipe_set)) < 1e-9
+        assert set(exact.missing(row)) == recipe_set - available_set
+        
+        substring_matches = sum(1 for name in recipe_set
+                                if any(a in name or name in a for a in available_set))
+        assert partial.matched_counts[row] == substring_matches
+    
+    rows_with_pollo = set(index.recipes_with('pollo').tolist())
+    assert rows_with_pollo == {row for row, r in enumerate(recipes_data) if 'pollo' in r['ingredients']}
+    
+    # Coincidencia parcial por trigramas y subcadenas contra el recorrido del vocabulario
+    names = [ingredient.name for ingredient in create_ingredient_names(2000)]
+    large_index = IngredientIndex.from_recipes([{'id': i, 'ingredients': names[i::50]} for i in range(50)])
+    for pantry_items in (available, ['aceite de oliva extra', 'ce'], ['pollo camo', 'Leche'], ['xyz']):
+        items = {item.lower().strip() for item in pantry_items}
+        expected = np.zeros(len(large_index.vocabulary), dtype=np.float32)
+        for name, column in large_index.vocabulary.items():
+            if any(item in name or name in item for item in items):
+                expected[column] = 1.0
+        assert np.array_equal(large_index.pantry_vector(pantry_items, partial=True), expected), pantry_items
+    
+    print(f"✅ Índice invertido coincide con los bucles para {len(recipes_data)} recetas")
+
+def test_cookable_matches_brute_force():
+    """Verifica las recetas cocinables con k faltantes contra un recorrido completo"""
+    print("\n🥘 PROBANDO 'QUÉ PUEDO COCINAR'")
+    print("=" * 50)
+    
+    recipes_data, ratings_data = create_large_test_data(150)
+    rec_engine = RecommendationEngine()
+    available = ['pollo', 'arroz', 'cebolla', 'tomate', 'ajo', 'aceite', 'sal', 'pasta']
+    max_missing = 2
+    
+    results = rec_engine.what_can_i_cook(available, recipes_data, max_missing=max_missing, limit=len(recipes_data))
+    
+    expected = []
+    for position, recipe in enumerate(recipes_data):
+        missing = [ing for ing in recipe['ingredients'] if ing.lower() not in available]
+        if len(missing) <= max_missing:
+            expected.append((len(missing), -recipe['avg_rating'], position, recipe['id']))
+    expected.sort()
+    
+    assert [r['recipe']['id'] for r in results] == [item[3] for item in expected]
+    for result in results:
+        assert result['missing_count'] == len(result['missing_ingredients'])
+    
+    print(f"✅ {len(results)} recetas cocinables con hasta {max_missing} faltantes")
+
+def test_trigram_index_matches_scan():
+    """Verifica que el índice de trigramas devuelve lo mismo que un recorrido por subcadena"""
+    print("\n🔤 PROBANDO ÍNDICE DE TRIGRAMAS")
+    print("=" * 50)
+    
+    recipes_data, _ = create_test_data()
+    names = sorted({ing for recipe in recipes_data for ing in recipe['ingredients']})
+    items = list(enumerate(names))
+    index = TrigramIndex.from_items(items)
+    
+    for query in ['pollo', 'Tomate', 'ce', 'de', 'queso parmesano', 'xyz', 'aceite de oliva']:
+        expected = {key for key, name in items if query.lower() in name.lower()}
+        assert set(index.search(query)) == expected, query
+    
+    # Actualizaciones incrementales
+    index.add(len(items), 'pollo asado')
+    assert len(items) in index.search('asado')
+    index.remove(len(items))
+    assert not index.search('asado')
+    
+    print(f"✅ Índice de trigramas coincide con el recorrido para {len(names)} ingredientes")
+
+def scan_ingredient_matches(nlp, user_ingredient, database_ingredients, max_distance=None):
+    """Recorrido completo previo a IngredientMatchIndex (Levenshtein contra cada ingrediente)"""
+    user_ingredient = user_ingredient.lower().strip()
+    matches = []
+    for db_ingredient in database_ingredients:
+        db_name = db_ingredient.name.lower()
+        if user_ingredient == db_name:
+            matches.append((db_ingredient, 1.0))
+            continue
+        if user_ingredient in db_name or db_name in user_ingredient:
+            similarity = max(len(user_ingredient), len(db_name)) / min(len(user_ingredient), len(db_name))
+            matches.append((db_ingredient, similarity * 0.8))
+            continue
+        similarity = nlp._calculate_string_similarity(user_ingredient, db_name)
+        distance = round((1.0 - similarity) * max(len(user_ingredient), len(db_name)))
+        if similarity > 0.6 and (max_distance is None or distance <= max_distance):
+            matches.append((db_ingredient, similarity * 0.6))
+    matches.sort(key=lambda x: x[1], reverse=True)
+    return matches[:5]
+
+def add_typos(text, n_typos, rng):
+    """Aplica n_typos borrados, inserciones o sustituciones aleatorias"""
+    for _ in range(n_typos):
+        position = int(rng.integers(0, len(text)))
+        letter = 'abcdeilmnoprstu'[int(rng.integers(0, 15))]
+        operation = int(rng.integers(0, 3))
+        if operation == 0 and len(text) > 3:
+            text = text[:position] + text[position + 1:]
+        elif operation == 1:
+            text = text[:position] + letter + text[position:]
+        else:
+            text = text[:position] + letter + text[position + 1:]
+    return text
+
+def create_ingredient_names(n_names, seed=7):
+    """Nombres de ingredientes sintéticos únicos: nombre base + variedad inventada"""
+    recipes_data, _ = create_test_data()
+    bases = sorted({ing for recipe in recipes_data for ing in recipe['ingredients']})
+    syllables = ['ca', 'mo', 'ri', 'ta', 'lu', 'pe', 'na', 'so', 've', 'di', 'ro', 'que']
+    rng = np.random.default_rng(seed)
+    names = dict.fromkeys(bases)
+    while len(names) < n_names:
+        variety = ''.join(syllables[i] for i in rng.integers(0, len(syllables), int(rng.integers(2, 5))))
+        names[f"{bases[int(rng.integers(0, len(bases)))]} {variety}"] = None
+    return [SimpleNamespace(id=i, name=name) for i, name in enumerate(list(names)[:n_names])]
+
+def test_fuzzy_ingredient_matching():
+    """IngredientMatchIndex devuelve lo mismo que el recorrido con Levenshtein (distancia <= 2)"""
+    print("\n🔡 PROBANDO ÍNDICE DIFUSO DE INGREDIENTES")
+    print("=" * 50)
+    
+    # El índice de borrados encuentra exactamente los textos a distancia <= 2
+    words = ['tomate', 'tomillo', 'papa', 'pollo', 'pimienta', 'pimiento', 'ajo', 'azúcar']
+    fuzzy = FuzzyIndex.from_items(enumerate(words))
+    nlp = NLPProcessor()
+    for query in ['tomtae', 'polo', 'pimineto', 'aj', 'azucar', 'xyz']:
+        expected = sorted((round((1 - nlp._calculate_string_similarity(query, word)) * max(len(query), len(word))), key)
+                          for key, word in enumerate(words))
+        expected = [(key, distance) for distance, key in expected if distance <= 2]
+        assert [(key, distance) for key, _, distance in fuzzy.lookup(query)] == expected, query
+    
+    ingredients = create_ingredient_names(500)
+    rng = np.random.default_rng(3)
+    queries = ['pollo', 'ajo', 'aceite de oliva', 'cebolla morada', 'ceboll', 'pimienta negra y sal']
+    queries += [add_typos(ingredients[int(i)].name, int(rng.integers(1, 3)), rng) for i in rng.integers(0, len(ingredients), 30)]
+    for query in queries:
+        indexed = nlp.enhance_ingredient_matching(query, ingredients)
+        expected = scan_ingredient_matches(nlp, query, ingredients, max_distance=2)
+        assert [(ing.id, round(score, 9)) for ing, score in indexed] == \
+               [(ing.id, round(score, 9)) for ing, score in expected], query
+    
+    # Los sinónimos son nombres alternativos
+    index = IngredientMatchIndex([SimpleNamespace(id=1, name='tomate'), SimpleNamespace(id=2, name='carne de res')])
+    assert [ing.id for ing, _ in index.match('jitomate')] == [1]
+    assert [ing.id for ing, _ in index.match('jitomat')] == [1]
+    assert index.match('res')[0][0].id == 2
+    print(f"✅ Índice difuso coincide con el recorrido en {len(queries)} consultas")
+
+
+def test_result_cache_lru_ttl():
+    """Verifica expulsión LRU, expiración por TTL e invalidación por usuario del cache de resultados"""
+    print("\n🗄️ PROBANDO CACHE DE RESULTADOS")
+    print("=" * 50)
+    
+    now = [0.0]
+    cache = ResultCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+    
+    cache.put('a', [1], user_id=1)
+    cache.put('b', [2], user_id=2)
+    assert cache.get('a') == [1]          # 'a' pasa a ser la más reciente
+    cache.put('c', [3], user_id=1)        # expulsa 'b'
+    assert cache.get('b') is None
+    assert cache.evictions == 1
+    
+    assert cache.invalidate_user(1) == 2
+    assert cache.get('a') is None and cache.get('c') is None
+    
+    cache.put('d', [4], user_id=3)
+    now[0] = 10.0
+    assert cache.get('d') is None
+    assert cache.expirations == 1
+    
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 4 and stats['entries'] == 0
+    print(f"✅ Cache LRU/TTL correcto: {stats}")
+
+
+def test_substitution_graph():
+    """Verifica prioridad de sustituciones por receta sobre las reglas genéricas"""
+    print("\n🔁 PROBANDO GRAFO DE SUSTITUCIONES")
+    print("=" * 50)
+    
+    graph = SubstitutionGraph.from_rows([
+        (1, 'Leche entera', 'bebida de avena', '1:1', None),
+    ])
+    
+    # La receta 1 usa su sustitución; otras recetas caen en la regla genérica 'leche'
+    assert [s['substitute'] for s in graph.substitutes('leche entera', 1)] == ['bebida de avena']
+    assert graph.substitutes('Leche entera', 2)[0]['substitute'] == 'leche de almendra'
+    assert graph.substitutes('sal', 1) == []
+    
+    result = graph.for_ingredients(['Harina de trigo', 'sal', 'Huevos'])
+    assert set(result) == {'Harina de trigo', 'Huevos'}
+    
+    # El grafo se pasa por llamada: el motor compartido no cambia
+    engine = RecommendationEngine.__new__(RecommendationEngine)
+    engine.substitution_graph = SubstitutionGraph()
+    engine.ingredient_index = None
+    recipe = {'id': 1, 'ingredients': [{'name': 'Leche entera'}]}
+    suggestions = engine._get_substitution_suggestions(recipe, [], ['Leche entera'], graph)
+    assert suggestions == {'Leche entera': ['bebida de avena']}
+    assert engine._get_substitution_suggestions(recipe, [], ['Leche entera'])['Leche entera'][0] == 'leche de almendra'
+    print(f"✅ Grafo de sustituciones correcto: {sorted(result)}")
+
+
+def create_low_rank_ratings(n_users=200, n_recipes=100, n_factors=3, density=0.3, seed=0):
+    """Ratings 1-5 generados por factores latentes, para probar el filtrado colaborativo"""
+    rng = np.random.default_rng(seed)
+    users = rng.normal(0, 1, (n_users, n_factors))
+    recipes = rng.normal(0, 1, (n_recipes, n_factors))
+    true_ratings = np.clip(3 + users @ recipes.T / np.sqrt(n_factors), 1, 5)
+    
+    ratings = []
+    for user, recipe in zip(*np.nonzero(rng.random((n_users, n_recipes)) < density)):
+        ratings.append({'user_id': int(user), 'recipe_id': int(recipe), 'rating': float(true_ratings[user, recipe])})
+    return ratings, true_ratings
+
+
+def test_collaborative_filter():
+    """Verifica que ALS mejora a la media global y que el fold-in reproduce al usuario entrenado"""
+    print("\n👥 PROBANDO FILTRADO COLABORATIVO (ALS)")
+    print("=" * 50)
+    
+    ratings, true_ratings = create_low_rank_ratings()
+    rng = np.random.default_rng(1)
+    held_out = rng.random(len(ratings)) < 0.1
+    train = [r for r, h in zip(ratings, held_out) if not h]
+    test = [r for r, h in zip(ratings, held_out) if h]
+    
+    cf = CollaborativeFilter(n_factors=8, regularization=0.05, n_iterations=10)
+    assert cf.train(train)
+    
+    predictions = np.array([cf.predict([r['recipe_id']], r['user_id'])[0] for r in test])
+    actual = np.array([r['rating'] for r in test])
+    rmse = np.sqrt(np.mean((predictions - actual) ** 2))
+    baseline = np.sqrt(np.mean((cf.global_mean - actual) ** 2))
+    assert rmse < 0.8 * baseline, (rmse, baseline)
+    
+    # Un usuario "nuevo" con los mismos ratings que el usuario 0 recibe casi el mismo ranking
+    user_ratings = {r['recipe_id']: r['rating'] for r in train if r['user_id'] == 0}
+    recipe_ids = list(range(true_ratings.shape[1]))
+    trained = cf.predict(recipe_ids, 0)
+    folded = cf.predict(recipe_ids, 'nuevo', user_ratings)
+    assert folded.dtype == np.float32
+    assert np.corrcoef(trained, folded)[0, 1] > 0.95
+    assert cf.predict(recipe_ids, 'desconocido') is None
+    
+    # Actualización en línea: el usuario nuevo obtiene su fila y una receta nueva la suya,
+    # sin tocar los arrays ni los índices que ya tenía un lector
+    user_factors, item_factors = cf.user_factors, cf.item_factors
+    snapshot = user_factors.copy()
+    item_index = cf.item_index
+    assert cf.update_user('nuevo', user_ratings)
+    assert np.allclose(cf.predict(recipe_ids, 'nuevo'), folded)
+    assert cf.update_item('receta nueva', {0: 5.0, 1: 4.0})
+    assert cf.predict(['receta nueva'], 0)[0] > cf.global_mean
+    assert cf.online_updates == 2
+    assert cf.update_user(0, {0: 1.0, 1: 1.0})
+    assert np.array_equal(user_factors, snapshot) and cf.user_factors is not user_factors
+    assert 'receta nueva' not in item_index and len(item_factors) == len(item_index)
+    assert len(cf.item_factors) == len(cf.item_index)
+    print(f"✅ RMSE {rmse:.3f} vs media global {baseline:.3f}; fold-in consistente")
+
+
+def test_model_registry():
+    """Verifica publicación atómica, checksums, puntero CURRENT y limpieza de versiones"""
+    import tempfile
+    print("\n🗂️ PROBANDO REGISTRO DE MODELOS")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as root:
+        registry = ModelRegistry(root)
+        assert registry.current_version() is None
+        
+        published = []
+        for i in range(3):
+            version, staging_dir = registry.new_version()
+            with open(os.path.join(staging_dir, 'modelo.pkl'), 'wb') as f:
+                f.write(bytes([i]) * 100)
+            manifest = registry.publish(version, staging_dir, feature_schema={'modelo': {'features': ['a']}})
+            assert registry.current_version() == version
+            assert manifest['files']['modelo.pkl']['size'] == 100
+            published.append(version)
+        
+        assert registry.versions() == published
+        assert registry.verify(published[-1]) == []
+        with open(os.path.join(registry.version_dir(published[-1]), 'modelo.pkl'), 'ab') as f:
+            f.write(b'alterado')
+        assert registry.verify(published[-1]) == ['modelo.pkl']
+        
+        # La versión actual se conserva aunque sea más antigua que las que se borran
+        registry.set_current(published[0])
+        assert sorted(registry.prune(keep=1)) == [published[1]]
+        assert registry.versions() == [published[0], published[2]]
+    
+    bundle = ModelBundle({'clustering': 'modelo'}, version='v1')
+    assert bundle['clustering'] == 'modelo' and bundle.get('content_filter') is None
+    try:
+        bundle['clustering'] = None
+        assert False, "ModelBundle debe ser inmutable"
+    except TypeError:
+        pass
+    print(f"✅ Registro correcto: {len(published)} versiones publicadas, checksums verificados")
+
+def load_training_job_data():
+    """Datos del trabajo de entrenamiento de prueba (se cargan por 'modulo:funcion', como en la app)"""
+    return create_test_data()
+
+
+def test_training_job_states():
+    """Verifica los estados de un trabajo de entrenamiento, la versión que publica y el archivo de bloqueo"""
+    import pickle
+    import tempfile
+    print("\n🏭 PROBANDO TRABAJOS DE ENTRENAMIENTO")
+    print("=" * 50)
+    
+    with tempfile.TemporaryDirectory() as root:
+        registry = ModelRegistry(os.path.join(root, 'registry'))
+        jobs_dir = os.path.join(root, 'jobs')
+        lock_path = os.path.join(jobs_dir, 'active.lock')
+        
+        def prepare_job(job_id, data_loader, lock_owner=None):
+            # Lo mismo que deja TrainingJobManager.submit antes de lanzar el proceso
+            job_dir = os.path.join(jobs_dir, job_id)
+            os.makedirs(job_dir)
+            with open(os.path.join(job_dir, INPUT_FILE), 'wb') as f:
+                pickle.dump({'data_loader': data_loader, 'registry_root': registry.root}, f)
+            write_json(os.path.join(job_dir, STATE_FILE), {'job_id': job_id, 'status': 'queued', 'created_at': time.time()})
+            with open(lock_path, 'w', encoding='utf-8') as f:
+                f.write(lock_owner or job_id)
+            return job_dir
+        
+        # queued -> running -> succeeded: publica una versión y libera el bloqueo
+        job_dir = prepare_job('job-ok', f'{__name__}:load_training_job_data')
+        run_job(job_dir)
+        state = read_json(os.path.join(job_dir, STATE_FILE))
+        assert state['status'] == 'succeeded' and state['stage'] is None and state['progress'] == 1.0
+        assert state['pid'] == os.getpid()
+        assert state['n_recipes'] == len(create_test_data()[0]) and state['n_ratings'] == len(create_test_data()[1])
+        version = state['model_version']
+        assert version is not None and registry.current_version() == version
+        metadata = registry.manifest(state['model_version'])['metadata']
+        assert metadata['job_id'] == 'job-ok'
+        assert state['started_at'] <= metadata['data_as_of'] <= state['finished_at']
+        assert not os.path.exists(lock_path)
+        
+        # Un error al cargar los datos deja el trabajo en failed, sin versión nueva y sin bloqueo
+        job_dir = prepare_job('job-error', f'{__name__}:missing_loader')
+        run_job(job_dir)
+        state = read_json(os.path.join(job_dir, STATE_FILE))
+        assert state['status'] == 'failed' and 'job' in state['errors'] and 'model_version' not in state
+        assert registry.current_version() == version
+        assert not os.path.exists(lock_path)
+        
+        # El bloqueo de otro trabajo no se toca
+        job_dir = prepare_job('job-stale', f'{__name__}:missing_loader', lock_owner='job-otro')
+        run_job(job_dir)
+        with open(lock_path, encoding='utf-8') as f:
+            assert f.read() == 'job-otro'
+    print(f"✅ Trabajos de entrenamiento correctos (versión {version})")
+
+def load_ingredient_corpus():
+    """Textos de los datos del proyecto (data/*.sql y recetas de prueba) limpiados como en _process_single_ingredient"""
+    import glob
+    import re
+    import string
+    
+    texts = []
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    for path in sorted(glob.glob(os.path.join(data_dir, '*.sql'))):
+        with open(path, encoding='utf-8') as f:
+            texts.extend(re.findall(r"'((?:[^']|'')*)'", f.read()))
+    
+    recipes_data, _ = create_test_data()
+    for recipe in recipes_data:
+        texts.extend(recipe['ingredients'])
+        texts.append(f"2 tazas de {recipe['ingredients'][0]} – «{recipe['name']}»")
+    
+    strip_punctuation = str.maketrans('', '', string.punctuation)
+    return [text.lower().translate(strip_punctuation) for text in texts if text.strip()]
+
+
+def test_ingredient_tokenizer_matches_nltk():
+    """El tokenizador por expresiones regulares da los mismos tokens que word_tokenize"""
+    print("\n✂️ PROBANDO TOKENIZADOR DE INGREDIENTES")
+    print("=" * 50)
+    
+    try:
+        from nltk.tokenize import word_tokenize
+    except ImportError:
+        print("⚠️ NLTK no instalado, se omite la comparación")
+        return
+    
+    # Sin puntuación ASCII punkt no divide oraciones: preserve_line=True compara contra
+    # las mismas reglas Treebank sin necesitar los datos de punkt
+    corpus = load_ingredient_corpus() + [
+        'cannot gonna wanna', 'wanna”', '“leche” entera', 'sal—pimienta', '¿pollo o res¡', ' \t '
+    ]
+    for text in corpus:
+        assert tokenize_ingredient_text(text) == word_tokenize(text, preserve_line=True), text
+    
+    # El procesamiento de ingredientes no necesita punkt
+    nlp = NLPProcessor()
+    assert nlp._tokenize_safe('2 tazas de arroz blanco') == ['2', 'tazas', 'de', 'arroz', 'blanco']
+    print(f"✅ {len(corpus)} textos con los mismos tokens que NLTK")
+
+
+def test_ingredient_resolver():
+    """Texto libre -> ids de Ingredient con unidades, plurales, sinónimos y cache de frases"""
+    print("\n🧾 PROBANDO RESOLUCIÓN DE INGREDIENTES")
+    print("=" * 50)
+    
+    names = ['tomate', 'arroz blanco', 'arroz integral', 'pollo', 'carne de res', 'frijol negro',
+             'frijol pinto', 'leche de coco', 'leche', 'ajo']
+    resolver = IngredientResolver(enumerate(names, start=1))
+    by_name = {name: ingredient_id for ingredient_id, name in resolver.names.items()}
+    
+    assert resolver.resolve_phrase('3 jitomates') == (by_name['tomate'],)
+    assert resolver.resolve_phrase('500 g de Carne de Res') == (by_name['carne de res'],)
+    assert resolver.resolve_phrase('carne de pollo') == (by_name['pollo'],)
+    assert resolver.resolve_phrase('2 dientes de ajo') == (by_name['ajo'],)
+    assert set(resolver.resolve_phrase('frijoles')) == {by_name['frijol negro'], by_name['frijol pinto']}
+    # Coincidencia exacta antes que por contención
+    assert resolver.resolve_phrase('1 taza de leche') == (by_name['leche'],)
+    assert resolver.resolve_phrase('ingrediente desconocido') == ()
+    
+    assert resolver.resolve('pollo, 1/2 taza de leche de coco; pollo') == [by_name['pollo'], by_name['leche de coco']]
+    assert resolver.extract('¿Qué cocino con pollo, leche de coco y arroz?') == [
+        by_name['pollo'], by_name['leche de coco'], by_name['arroz blanco'], by_name['arroz integral']
+    ]
+    
+    # Frases que normalizan igual comparten la entrada de la cache
+    resolver.resolve_phrase('2 tazas de arroz blanco')
+    hits = resolver.cache_info().hits
+    resolver.resolve_phrase('1 taza de arroz blanco.')
+    assert resolver.cache_info().hits == hits + 1
+    
+    # NLPProcessor usa la misma normalización
+    nlp = NLPProcessor()
+    assert nlp.process_ingredients('3 jitomates') == nlp.process_ingredients('tomate')
+    print(f"✅ Resolución correcta ({resolver.cache_info().currsize} frases en cache)")
+
+
+def test_light_modules_import_cheaply():
+    """Los módulos que importa la app al iniciar no arrastran sklearn, pandas, scipy ni NLTK"""
+    import subprocess
+    print("\n⚡ PROBANDO IMPORTACIONES LIGERAS")
+    print("=" * 50)
+    
+    modules = ['model_registry', 'training_job', 'array_store', 'columnar_catalog', 'ingredient_index',
+               'ngram_index', 'substitution_graph', 'ranking', 'result_cache', 'dietary_rules']
+    code = (f"import sys; sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+            f"import {', '.join(modules)}; "
+            "print(sorted({m.split('.')[0] for m in sys.modules} & {'sklearn', 'pandas', 'scipy', 'nltk', 'matplotlib'}))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]', result.stdout
+    print(f"✅ {len(modules)} módulos importados sin librerías pesadas")
+
+
 def test_integration():
     """Prueba la integración de todos los componentes"""
     print("\n🔗 PROBANDO INTEGRACIÓN COMPLETA")
@@ -483,6 +1245,25 @@ def test_model_persistence():
         similarity = new_content_filter.calculate_similarity(['pollo', 'arroz'], 1)
         print(f"✅ Content Filter cargado - Similitud calculada: {similarity:.3f}")
     
+    # Los arrays se abren mapeados en memoria (solo lectura) y dan los mismos resultados
+    assert clustering_loaded and content_loaded
+    assert not new_content_filter.recipe_content_matrix.data.flags.writeable
+    assert not new_content_filter.neighbor_ids.flags.writeable
+    assert new_content_filter.neighbors(1, 3) == content_filter.neighbors(1, 3)
+    assert np.allclose(new_content_filter.calculate_similarities(['pollo', 'arroz'], [1, 2, 3]),
+                       content_filter.calculate_similarities(['pollo', 'arroz'], [1, 2, 3]))
+    assert dict(new_clustering.cluster_labels.items()) == {k: int(v) for k, v in clustering.cluster_labels.items()}
+    
+    # Factores colaborativos en copia en escritura: la actualización en línea no toca el archivo
+    collaborative = new_rec_engine.collaborative_filter
+    if collaborative.is_trained:
+        user_id = next(iter(collaborative.user_index))
+        before = collaborative.user_factors[collaborative.user_index[user_id]].copy()
+        assert collaborative.update_user(user_id, {r['recipe_id']: 5.0 for r in ratings_data[:3]})
+        reloaded = CollaborativeFilter()
+        reloaded.load_model("ml_models/trained_models/collaborative_filter.pkl")
+        assert np.allclose(reloaded.user_factors[reloaded.user_index[user_id]], before)
+    
     # Probar recomendación con modelo cargado
     user_profile = {'dietary_restrictions': [], 'avg_rating_given': 4.0}
     recommendations = new_rec_engine.get_recommendations(
@@ -561,6 +1342,154 @@ def run_performance_benchmark():
     
     print("✅ Benchmark completado")
 
+def run_ranking_benchmark(catalog_sizes=(500, 2000)):
+    """Compara el ranking en lote contra el bucle receta por receta"""
+    print("\n⚡ BENCHMARK DE RANKING EN LOTE")
+    print("=" * 50)
+    
+    user_profile = {'dietary_restrictions': [], 'avg_rating_given': 4.0}
+    ingredients = ['pollo', 'arroz', 'tomate', 'cebolla']
+    
+    for n_recipes in catalog_sizes:
+        recipes_data, ratings_data = create_large_test_data(n_recipes)
+        rec_engine = RecommendationEngine()
+        rec_engine.train_models(recipes_data, ratings_data)
+        
+        start_time = time.time()
+        loop_ranking = rank_recipes_loop(rec_engine, recipes_data, user_profile, ingredients)
+        loop_time = time.time() - start_time
+        
+        start_time = time.time()
+        batch_ranking = rec_engine.rank_recipes(recipes_data, user_profile, ingredients)
+        batch_time = time.time() - start_time
+        
+        same_order = [r['id'] for r in loop_ranking] == [r['id'] for r in batch_ranking]
+        print(f"  {n_recipes} recetas - bucle: {loop_time:.3f}s, lote: {batch_time:.3f}s, "
+              f"aceleración: {loop_time / batch_time:.1f}x, mismo orden: {same_order}")
+    
+    print("✅ Benchmark de ranking completado")
+
+def run_tokenizer_benchmark(repeat=20):
+    """Textos por segundo: tokenizador por expresiones regulares contra word_tokenize"""
+    print("\n✂️ BENCHMARK DEL TOKENIZADOR DE INGREDIENTES")
+    print("=" * 50)
+    
+    corpus = load_ingredient_corpus() * repeat
+    start_time = time.time()
+    for text in corpus:
+        tokenize_ingredient_text(text)
+    regex_time = time.time() - start_time
+    print(f"  Expresión regular: {len(corpus) / regex_time:,.0f} textos/s")
+    
+    try:
+        from nltk.tokenize import word_tokenize
+        # preserve_line=True omite punkt: el costo real de word_tokenize es mayor
+        start_time = time.time()
+        for text in corpus:
+            word_tokenize(text, preserve_line=True)
+        nltk_time = time.time() - start_time
+        print(f"  NLTK (sin punkt): {len(corpus) / nltk_time:,.0f} textos/s, aceleración: {nltk_time / regex_time:.1f}x")
+    except ImportError:
+        print("  NLTK no instalado")
+    
+    print("✅ Benchmark del tokenizador completado")
+
+def run_columnar_filter_benchmark(n_recipes=100000):
+    """Mide el filtrado por reglas sobre el catálogo columnar"""
+    print("\n⚡ BENCHMARK DE FILTRADO COLUMNAR")
+    print("=" * 50)
+    
+    recipes_data, _ = create_large_test_data(n_recipes)
+    
+    start_time = time.time()
+    catalog = ColumnarCatalog.from_recipes(recipes_data)
+    build_time = time.time() - start_time
+    
+    rows = np.arange(len(catalog))
+    start_time = time.time()
+    mask = catalog.restriction_mask(rows, ['vegetariano', 'sin gluten'])
+    mask &= catalog.time_mask(rows, 45)
+    mask &= catalog.difficulty_mask(rows, 'fácil')
+    filter_time = time.time() - start_time
+    
+    print(f"  {n_recipes} recetas - construcción: {build_time:.3f}s, "
+          f"filtrado: {filter_time * 1000:.2f}ms, seleccionadas: {int(mask.sum())}")
+    print("✅ Benchmark de filtrado completado")
+
+def run_cookable_benchmark(n_recipes=100000, max_missing=2):
+    """Mide la consulta 'qué puedo cocinar' con bitsets y popcount"""
+    print("\n⚡ BENCHMARK 'QUÉ PUEDO COCINAR'")
+    print("=" * 50)
+    
+    recipes_data, _ = create_large_test_data(n_recipes)
+    rec_engine = RecommendationEngine()
+    available = ['pollo', 'arroz', 'cebolla', 'tomate', 'ajo', 'aceite', 'sal']
+    
+    start_time = time.time()
+    rec_engine.what_can_i_cook(available, recipes_data, max_missing=max_missing)
+    first_time = time.time() - start_time
+    
+    start_time = time.time()
+    results = rec_engine.what_can_i_cook(available, recipes_data, max_missing=max_missing)
+    query_time = time.time() - start_time
+    
+    print(f"  {n_recipes} recetas - primera consulta (incluye índice): {first_time:.3f}s, "
+          f"consulta: {query_time * 1000:.2f}ms, resultados: {len(results)}")
+    print("✅ Benchmark completado")
+
+def run_fuzzy_matching_benchmark(sizes=(10000, 100000), n_queries=20):
+    """Top-5 tolerante a errores: IngredientMatchIndex contra el recorrido con Levenshtein"""
+    print("\n⚡ BENCHMARK DE COINCIDENCIA DIFUSA DE INGREDIENTES")
+    print("=" * 50)
+    
+    nlp = NLPProcessor()
+    for n_names in sizes:
+        ingredients = create_ingredient_names(n_names)
+        rng = np.random.default_rng(5)
+        queries = [add_typos(ingredients[int(i)].name, int(rng.integers(1, 3)), rng)
+                   for i in rng.integers(0, n_names, n_queries)]
+        
+        start_time = time.time()
+        index = IngredientMatchIndex(ingredients)
+        build_time = time.time() - start_time
+        
+        start_time = time.time()
+        for query in queries:
+            index.match(query)
+        index_ms = (time.time() - start_time) * 1000 / n_queries
+        
+        # El recorrido completo es lento: basta con unas pocas consultas
+        scan_queries = queries[:max(1, n_queries * 10000 // n_names)]
+        start_time = time.time()
+        for query in scan_queries:
+            scan_ingredient_matches(nlp, query, ingredients)
+        scan_ms = (time.time() - start_time) * 1000 / len(scan_queries)
+        
+        print(f"  {n_names} nombres - construcción {build_time:.2f}s ({len(index.fuzzy.deletes)} borrados), "
+              f"índice {index_ms:.2f}ms, recorrido {scan_ms:.0f}ms por consulta ({scan_ms / index_ms:.0f}x)")
+    print("✅ Benchmark completado")
+
+def run_ann_benchmark(n_vectors=200000, dim=64, k=10, n_queries=50):
+    """Recall contra latencia del índice LSH frente al cálculo exacto"""
+    print("\n⚡ BENCHMARK ANN: RECALL VS LATENCIA")
+    print("=" * 50)
+    
+    vectors = create_clustered_vectors(n_vectors, dim)
+    queries = vectors[np.random.default_rng(1).integers(0, n_vectors, n_queries)]
+    exact_index = ExactIndex().build(vectors)
+    
+    for n_tables, n_bits, probes in [(8, 12, 0), (8, 12, 1), (16, 14, 1), (24, 16, 1)]:
+        start_time = time.time()
+        lsh_index = RandomProjectionLSH(n_tables=n_tables, n_bits=n_bits, probes=probes).build(vectors)
+        lsh_index.query(queries[0], k)  # ordena las tablas
+        build_time = time.time() - start_time
+        
+        recall, exact_ms, ann_ms = ann_recall(exact_index, lsh_index, queries, k)
+        print(f"  {n_vectors} vectores - tablas={n_tables} bits={n_bits} probes={probes}: "
+              f"construcción {build_time:.2f}s, recall@{k} {recall:.3f}, "
+              f"exacto {exact_ms:.1f}ms, LSH {ann_ms:.1f}ms ({exact_ms / ann_ms:.1f}x)")
+    print("✅ Benchmark completado")
+
 def main():
     """Función principal que ejecuta todas las pruebas"""
     print("🍳 SISTEMA EXPERTO CULINARIO - PRUEBAS DE ML")
@@ -577,9 +1506,33 @@ def main():
         test_clustering()
         test_content_filter()
         test_recommendation_engine()
+        test_batch_ranking_matches_loop()
+        test_content_similarities_match_per_recipe()
+        test_top_k_matches_full_sort()
+        test_neighbor_table_matches_on_the_fly()
+        test_columnar_rules_match_loop()
+        test_ingredient_index_matches_loops()
+        test_cookable_matches_brute_force()
+        test_trigram_index_matches_scan()
+        test_result_cache_lru_ttl()
+        test_substitution_graph()
+        test_collaborative_filter()
+        test_model_registry()
+        test_training_job_states()
+        test_light_modules_import_cheaply()
+        test_ingredient_tokenizer_matches_nltk()
+        test_ingredient_resolver()
+        test_fuzzy_ingredient_matching()
+        test_ann_index_recall()
         test_integration()
         test_model_persistence()
         run_performance_benchmark()
+        run_ranking_benchmark()
+        run_tokenizer_benchmark()
+        run_columnar_filter_benchmark()
+        run_cookable_benchmark()
+        run_ann_benchmark()
+        run_fuzzy_matching_benchmark()
         
         print("\n" + "=" * 60)
         print("🎉 TODAS LAS PRUEBAS COMPLETADAS EXITOSAMENTE")
@@ -0,0 +1,201 @@
+"""
+Trabajo de entrenamiento en un proceso separado:
+    python -m ml_models.training_job <directorio_del_trabajo>
+
+El directorio contiene input.pkl (función que carga recetas y ratings, como
+'modulo:funcion', y raíz del registro de modelos); el proceso lee sus propios datos.
+El progreso se escribe en state.json para que cualquier worker web pueda consultarlo;
+los artefactos se publican como una versión nueva del registro.
+"""
+import importlib
+import os
+import pickle
+import shutil
+import sys
+import time
+import traceback
+
+try:
+    from ml_models.model_registry import (ModelRegistry, read_json, write_json,
+                                          ENGINE_DIR, CLUSTERING_FILE, CONTENT_FILTER_FILE)
+    from ml_models.array_store import artifact_files
+except ImportError:  # ejecución directa desde ml_models/
+    from model_registry import (ModelRegistry, read_json, write_json,
+                                ENGINE_DIR, CLUSTERING_FILE, CONTENT_FILTER_FILE)
+    from array_store import artifact_files
+
+STATE_FILE = 'state.json'
+INPUT_FILE = 'input.pkl'
+
+
+def update_state(job_dir, **changes):
+    state = read_json(os.path.join(job_dir, STATE_FILE)) or {}
+    state.update(changes)
+    write_json(os.path.join(job_dir, STATE_FILE), state)
+    return state
+
+
+def _names(values):
+    return [str(value) for value in values] if values is not None else []
+
+
+def _train_recommendation_engine(recipes_data, ratings_data, version_dir, schema):
+    from ml_models.recommendation_engine import RecommendationEngine
+    engine = RecommendationEngine(model_path=os.path.join(version_dir, ENGINE_DIR) + os.sep)
+    engine.train_models(recipes_data, ratings_data)
+    schema['recommendation_engine'] = {
+        'rating_features': _names(getattr(engine.scaler, 'feature_names_in_', None)),
+        'collaborative_factors': engine.collaborative_filter.n_factors if engine.collaborative_filter.is_trained else 0
+    }
+
+
+def _train_clustering(recipes_data, ratings_data, version_dir, schema):
+    from ml_models.clustering import RecipeClustering
+    clustering = RecipeClustering()
+    clustering.train_clustering(recipes_data)
+    clustering.save_model(os.path.join(version_dir, CLUSTERING_FILE))
+    schema['clustering'] = {'features': _names(clustering.feature_names), 'n_clusters': clustering.n_clusters}
+
+
+def _train_content_filter(recipes_data, ratings_data, version_dir, schema):
+    if not recipes_data:
+        raise ValueError("El filtro de contenido necesita el catálogo de recetas")
+    from ml_models.content_filter import ContentBasedFilter
+    content_filter = ContentBasedFilter()
+    content_filter.train(recipes_data)
+    content_filter.save_model(os.path.join(version_dir, CONTENT_FILTER_FILE))
+    schema['content_filter'] = {'features': _names(content_filter.feature_names)}
+
+
+STAGES = [
+    ('recommendation_engine', _train_recommendation_engine),
+    ('clustering', _train_clustering),
+    ('content_filter', _train_content_filter),
+]
+
+# Artefacto de cada etapa dentro de una versión
+STAGE_ARTIFACTS = {
+    'recommendation_engine': ENGINE_DIR,
+    'clustering': CLUSTERING_FILE,
+    'content_filter': CONTENT_FILTER_FILE,
+}
+
+
+def _inherit_artifact(registry, stage_name, staging_dir):
+    """Copia el artefacto de la versión actual para una etapa que falló; devuelve la versión de origen"""
+    current = registry.current_version()
+    if current is None:
+        return None
+    source = os.path.join(registry.version_dir(current), STAGE_ARTIFACTS[stage_name])
+    target = os.path.join(staging_dir, STAGE_ARTIFACTS[stage_name])
+    if os.path.isdir(source):
+        shutil.rmtree(target, ignore_errors=True)  # restos parciales de la etapa fallida
+        shutil.copytree(source, target)
+    elif os.path.isfile(source):
+        for path in artifact_files(source):  # el pickle y sus .npy
+            shutil.copy2(path, os.path.join(staging_dir, os.path.basename(path)))
+    else:
+        return None
+    return current
+
+
+def train_version(recipes_data, ratings_data, registry, on_stage=None, metadata=None):
+    """
+    Entrena todas las etapas en un directorio de preparación y lo publica como versión
+    actual. Un error en una etapa se registra, su artefacto se hereda de la versión
+    actual y las demás continúan; si fallan todas no se publica nada.
+    Devuelve (versión o None, tiempos, errores).
+    """
+    version, staging_dir = registry.new_version()
+    schema, timings, errors, inherited = {}, {}, {}, {}
+    data_as_of = time.time()  # si metadata no trae el momento en que se leyeron los datos
+    try:
+        for position, (name, stage) in enumerate(STAGES):
+            if on_stage:
+                on_stage(name, position / len(STAGES), timings, errors)
+            start = time.time()
+            try:
+                stage(recipes_data or None, ratings_data or None, staging_dir, schema)
+            except Exception as e:
+                traceback.print_exc()
+                errors[name] = str(e)
+                source = _inherit_artifact(registry, name, staging_dir)
+                if source:
+                    inherited[name] = source
+                    schema[name] = (registry.manifest(source)['feature_schema'] or {}).get(name, {})
+            timings[name] = round(time.time() - start, 3)
+
+        if len(errors) == len(STAGES):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return None, timings, errors
+
+        registry.publish(version, staging_dir, feature_schema=schema,
+                         metadata={'data_as_of': data_as_of, **(metadata or {}), 'timings': timings, 'errors': errors,
+                                   'inherited': inherited})
+        return version, timings, errors
+
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+
+def _load_callable(path):
+    """Función a partir de 'modulo:funcion'"""
+    module_name, _, attribute = path.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def run_job(job_dir):
+    """Ejecuta un trabajo preparado por TrainingJobManager y deja su resultado en state.json"""
+    job_dir = os.path.abspath(job_dir)
+    jobs_dir = os.path.dirname(job_dir)
+    state = update_state(job_dir, status='running', pid=os.getpid(), started_at=time.time(),
+                         stage=None, progress=0.0, timings={}, errors={})
+    try:
+        with open(os.path.join(job_dir, INPUT_FILE), 'rb') as f:
+            payload = pickle.load(f)
+
+        # Las calificaciones posteriores a este momento quedan para las actualizaciones en línea
+        data_as_of = time.time()
+        if 'data_loader' in payload:
+            update_state(job_dir, stage='data')
+            recipes_data, ratings_data = _load_callable(payload['data_loader'])()
+        else:
+            recipes_data, ratings_data = payload['recipes_data'], payload['ratings_data']
+        update_state(job_dir, n_recipes=len(recipes_data), n_ratings=len(ratings_data))
+
+        def on_stage(name, progress, timings, errors):
+            update_state(job_dir, stage=name, progress=progress, timings=timings, errors=errors)
+
+        version, timings, errors = train_version(
+            recipes_data, ratings_data, ModelRegistry(payload['registry_root']),
+            on_stage=on_stage, metadata={'job_id': state['job_id'], 'data_as_of': data_as_of}
+        )
+        status = 'succeeded' if version else 'failed'
+        state = update_state(job_dir, status=status, stage=None, progress=1.0, timings=timings, errors=errors,
+                             model_version=version, finished_at=time.time())
+        print(f"✅ Trabajo {state['job_id']} terminado: {status}")
+
+    except Exception as e:
+        traceback.print_exc()
+        update_state(job_dir, status='failed', stage=None, finished_at=time.time(), errors={'job': str(e)})
+    finally:
+        _release_lock(jobs_dir, state.get('job_id'))
+
+
+def _release_lock(jobs_dir, job_id):
+    lock_path = os.path.join(jobs_dir, 'active.lock')
+    try:
+        with open(lock_path, encoding='utf-8') as f:
+            owner = f.read().strip()
+        if owner == job_id:
+            os.remove(lock_path)
+    except OSError:
+        pass
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Uso: python -m ml_models.training_job <directorio_del_trabajo>")
+        sys.exit(2)
+    run_job(sys.argv[1])